@@ -0,0 +1,303 @@
+"""
+CP468 — alldiff.py
+Unit-level all-different propagators for rows, columns and boxes, and the
+propagation loop that runs them together with AC-3.
+
+Pairwise binary_neq arcs cannot see that a unit needs every value exactly once,
+so these rules work on whole units of the shared topology:
+    - hidden single : a value that fits in only one cell of a unit goes there
+    - naked subsets : k cells whose domains together hold only k values own those
+                      values, so the rest of the unit loses them (k >= 2). This also
+                      covers hidden subsets, which are the complement in the same unit.
+    - regin         : matching-based filtering (Régin 1994), removes every value that
+                      is in no maximum matching of cells to values; gives full
+                      generalized arc consistency for each unit.
+    Fewer cells than values left in a unit (pigeonhole) is detected by all of them.
+
+Functions:
+    - propagate(csp, strength, queue, trail, engine, track_queue, stats) -> (bool, queue sink)
+    - hidden_singles(csp, trail, stats) -> set of changed vars, or None on a contradiction
+    - naked_subsets(csp, max_size, trail, stats) -> set of changed vars, or None
+    - regin(csp, trail, stats) -> set of changed vars, or None
+"""
+
+from __future__ import annotations
+from itertools import combinations
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from sudoku_csp import CSP, Domain, Var
+import ac3
+import bitset
+import constraints
+import queue_trace
+
+if TYPE_CHECKING:
+    from backtracking import Trail
+    from metrics import SolverStats
+
+STRENGTHS = ("ac3", "hidden", "subsets", "regin")
+
+# Largest naked subset looked for by the "subsets" strength
+MAX_SUBSET = 4
+
+
+def propagate(
+    csp: CSP,
+    strength: str = "ac3",
+    queue: Optional[Iterable[Tuple[Var, Var]]] = None,
+    trail: Optional["Trail"] = None,
+    engine: str = "ac3",
+    track_queue=False,
+    stats: Optional["SolverStats"] = None,
+) -> Tuple[bool, Optional["queue_trace.QueueStats"]]:
+    """
+    Run AC-3 and then the unit rules selected by strength until nothing changes.
+        "ac3"     : AC-3 only
+        "hidden"  : + hidden singles
+        "subsets" : + hidden singles and naked subsets up to MAX_SUBSET cells
+        "regin"   : + Régin's matching filter on every unit
+    Same return value as ac3.ac3; every AC-3 round reports to the same queue sink.
+    stats (metrics.SolverStats) counts the AC-3 work and the values the unit rules remove.
+    The unit rules need every unit to be all-different, so a predicate constraint
+    (constraints.kind_of) only gets AC-3 whatever the strength.
+    """
+    if strength not in STRENGTHS:
+        raise ValueError(f"Unknown propagation strength '{strength}' (expected one of {STRENGTHS}).")
+
+    tracker = queue_trace.make_sink(track_queue)
+    consistent, _ = ac3.ac3(csp, queue, tracker, trail, engine, stats)
+    if not consistent or strength == "ac3" or not constraints.is_neq(csp.constraint):
+        return consistent, tracker
+
+    while True:
+        if strength == "regin":
+            changed = regin(csp, trail, stats)
+        else:
+            changed = hidden_singles(csp, trail, stats)
+            if changed is not None and strength == "subsets":
+                more = naked_subsets(csp, MAX_SUBSET, trail, stats)
+                changed = None if more is None else changed | more
+
+        if changed is None:
+            return False, tracker
+        if not changed:
+            return True, tracker
+
+        # Let AC-3 push the new information out through the arcs into the changed cells
+        arcs = [(nb, v) for v in changed for nb in csp.neighbors[v]]
+        consistent, _ = ac3.ac3(csp, arcs, tracker, trail, engine, stats)
+        if not consistent:
+            return False, tracker
+
+
+def _restrict(csp: CSP, var: Var, new: Domain, trail: Optional["Trail"], stats: Optional["SolverStats"] = None) -> None:
+    """Shrink var's domain to new (a subset of the current one) and record it"""
+    removed = csp.domains[var] & ~new
+    csp.domains[var] = new
+    if trail is not None:
+        trail.record(var, removed)
+    if stats is not None:
+        stats.values_pruned += bitset.popcount(removed)
+
+
+def hidden_singles(csp: CSP, trail: Optional["Trail"] = None, stats: Optional["SolverStats"] = None) -> Optional[Set[Var]]:
+    """
+    Place every value that has exactly one possible cell in a unit.
+    Returns the changed variables, or None if a value has no cell left in some
+    unit or one cell is the only place for two values.
+    If the trail carries a heuristics.ValueCounts (trail.counts), units where every value
+    has two or more cells left or is already placed are skipped without looking at them.
+    """
+    domains = csp.domains
+    full = bitset.full_mask(csp.topology.size)
+    counts = trail.counts if trail is not None else None
+    changed: Set[Var] = set()
+
+    for u, unit in enumerate(csp.topology.units):
+        if counts is not None:
+            base = u * counts.stride
+            if not counts.low[base] & ~counts.placed[base]:
+                continue
+        # once: values seen in at least one cell, twice: in at least two
+        once = twice = 0
+        for v in unit:
+            d = domains[v]
+            twice |= once & d
+            once |= d
+        if once != full:
+            return None
+
+        exactly_once = once & ~twice
+        if not exactly_once:
+            continue
+        for v in unit:
+            d = domains[v]
+            hit = d & exactly_once
+            if not hit:
+                continue
+            if not bitset.is_singleton(hit):
+                return None
+            if d != hit:
+                _restrict(csp, v, hit, trail, stats)
+                changed.add(v)
+    return changed
+
+
+def naked_subsets(csp: CSP, max_size: int = MAX_SUBSET, trail: Optional["Trail"] = None, stats: Optional["SolverStats"] = None) -> Optional[Set[Var]]:
+    """
+    For every unit, find groups of k unassigned cells (2 <= k <= max_size) whose
+    domains hold exactly k values and remove those values from the other cells.
+    Returns the changed variables, or None if k cells share fewer than k values.
+    """
+    domains = csp.domains
+    changed: Set[Var] = set()
+
+    for unit in csp.topology.units:
+        open_cells = [v for v in unit if not bitset.is_singleton(domains[v])]
+        # A naked k-subset is a hidden (len - k)-subset, so half the cells is enough
+        top = min(max_size, len(open_cells) // 2)
+        for k in range(2, top + 1):
+            for group in combinations(open_cells, k):
+                union = 0
+                for v in group:
+                    union |= domains[v]
+                size = bitset.popcount(union)
+                if size < k:
+                    return None
+                if size > k:
+                    continue
+                for v in open_cells:
+                    if v in group:
+                        continue
+                    d = domains[v]
+                    if d & union:
+                        new = d & ~union
+                        if new == 0:
+                            return None
+                        _restrict(csp, v, new, trail, stats)
+                        changed.add(v)
+    return changed
+
+
+def regin(csp: CSP, trail: Optional["Trail"] = None, stats: Optional["SolverStats"] = None) -> Optional[Set[Var]]:
+    """
+    Régin's all-different filtering on every unit.
+    Returns the changed variables, or None if some unit has no complete matching.
+    """
+    changed: Set[Var] = set()
+    for unit in csp.topology.units:
+        supported = _regin_unit(csp.domains, unit)
+        if supported is None:
+            return None
+        for v, keep in zip(unit, supported):
+            if keep != csp.domains[v]:
+                if keep == 0:
+                    return None
+                _restrict(csp, v, keep, trail, stats)
+                changed.add(v)
+    return changed
+
+
+def _regin_unit(domains: Sequence[Domain], unit: Sequence[Var]) -> Optional[List[Domain]]:
+    """
+    Return, for each cell of the unit, the values that belong to some maximum
+    matching of cells to values (None if not every cell can be matched).
+    """
+    cells = [domains[v] for v in unit]
+    n = len(cells)
+    match_cell: List[int] = [0] * n          # cell index -> matched value
+    match_value: Dict[int, int] = {}         # value -> cell index
+
+    def augment(i: int, seen: Set[int]) -> bool:
+        for val in bitset.values(cells[i]):
+            if val in seen:
+                continue
+            seen.add(val)
+            j = match_value.get(val)
+            if j is None or augment(j, seen):
+                match_cell[i] = val
+                match_value[val] = i
+                return True
+        return False
+
+    for i in range(n):
+        if not augment(i, set()):
+            return None
+
+    # Residual graph: cell i -> its matched value, value -> every other cell that allows it.
+    # Node ids: cells 0..n-1, value val -> n + val - 1.
+    values = set()
+    for d in cells:
+        values.update(bitset.values(d))
+    graph: Dict[int, List[int]] = {i: [n + match_cell[i] - 1] for i in range(n)}
+    for val in values:
+        graph[n + val - 1] = [i for i in range(n) if cells[i] & bitset.bit(val) and match_cell[i] != val]
+
+    # Values reachable from an unmatched value lie on an even alternating path
+    free = [n + val - 1 for val in values if val not in match_value]
+    reachable = set(free)
+    stack = list(free)
+    while stack:
+        node = stack.pop()
+        for nxt in graph[node]:
+            if nxt not in reachable:
+                reachable.add(nxt)
+                stack.append(nxt)
+
+    component = _scc(graph)
+
+    supported: List[Domain] = []
+    for i in range(n):
+        keep = bitset.bit(match_cell[i])
+        for val in bitset.values(cells[i]):
+            node = n + val - 1
+            if component[node] == component[i] or node in reachable:
+                keep |= bitset.bit(val)
+        supported.append(keep)
+    return supported
+
+
+def _scc(graph: Dict[int, List[int]]) -> Dict[int, int]:
+    """Tarjan's strongly connected components (iterative); node -> component id"""
+    index: Dict[int, int] = {}
+    low: Dict[int, int] = {}
+    component: Dict[int, int] = {}
+    on_stack: Set[int] = set()
+    stack: List[int] = []
+    counter = 0
+
+    for root in graph:
+        if root in index:
+            continue
+        work = [(root, iter(graph[root]))]
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, edges = work[-1]
+            advanced = False
+            for nxt in edges:
+                if nxt not in index:
+                    index[nxt] = low[nxt] = counter
+                    counter += 1
+                    stack.append(nxt)
+                    on_stack.add(nxt)
+                    work.append((nxt, iter(graph[nxt])))
+                    advanced = True
+                    break
+                if nxt in on_stack:
+                    low[node] = min(low[node], index[nxt])
+            if advanced:
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[node])
+            if low[node] == index[node]:
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component[member] = node
+                    if member == node:
+                        break
+    return component
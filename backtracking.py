@@ -3,105 +3,649 @@ CP468 — backtracking.py
 Additional algorithm when AC-3 does not finish: Backtracking search with optional
 forward-checking and AC-3 as inference.
 
+Search modes (solve(search=...)):
+    - chronological : on failure undo the last assignment and try its next value
+    - iterative     : the same search without recursion: an explicit stack of
+                      (variable, remaining values) and the MRV buckets' unassigned count
+                      instead of csp.is_solved() at every node; same solutions, same order.
+                      For searches deeper than Python's recursion limit (e.g. large grids),
+                      not for speed: both spend most of their time in inference and MRV upkeep
+    - cbj           : conflict-directed backjumping; every failure carries the set of
+                      earlier decisions that caused it, and decisions outside that set
+                      are jumped over instead of being retried. max_nogood_size > 0 also
+                      records those sets as nogoods and refuses to repeat them.
+
+Restarts (solve(restarts=...)): either search can be cut off after a node budget and
+started again from the root with randomized tie-breaking (heuristics, rng=...), which
+keeps one unlucky early choice from trapping the whole solve in a huge subtree.
+Not a speed-up on the bundled puzzles: a single run already costs 1000-8500 nodes
+whatever the tie-breaking, so cutting runs short only throws work away (numbers in
+the README). Off by default.
+    - luby      : budgets restart_base x 1, 1, 2, 1, 1, 2, 4, 1, 1, 2, ... (Luby et al.)
+    - geometric : budgets restart_base x restart_factor^i
+Budgets grow without bound, so the search stays complete. seed makes it reproducible.
+
 Contributors:
     - Jordan F.
 """
 
-from typing import Dict, List, Set
-from sudoku_csp import CSP, Var
+import itertools
+import random
+from collections import deque
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+from sudoku_csp import CSP, Domain, Var
+from metrics import SolverStats
+import bitset
+import constraints
 import heuristics
+import alldiff
 import ac3
 
 
 class Trail:
-    """Efficient undo mechanism for domain changes"""
+    """
+    Efficient undo mechanism for domain changes.
+    Listeners (e.g. heuristics.MRVBuckets) get removed(var, mask) after a recorded
+    removal and restored(var, mask) after an undo, so they can follow the domains.
+    counts is the heuristics.ValueCounts among the listeners, if any, for LCV and
+    hidden singles to read.
+    """
 
-    def __init__(self):
-        self.frames: List[List[tuple[Var, Set[int]]]] = []
+    def __init__(self, listeners=None):
+        self.frames: List[List[tuple[Var, Domain]]] = []
+        self.entries = 0  # (var, removed) pairs over all frames, kept for SolverStats.max_trail_depth
+        self.listeners = list(listeners or ())
+        self.counts: Optional[heuristics.ValueCounts] = None
 
     def push_frame(self):
         """Start new backtracking frame"""
         self.frames.append([])
 
-    def record(self, var: Var, removed_values: Set[int]):
-        """Record values removed from a variable's domain"""
-        if removed_values and self.frames:
-            self.frames[-1].append((var, removed_values.copy()))
+    def record(self, var: Var, removed_values: Domain):
+        """Record values removed from a variable's domain (as a bitmask)"""
+        if not removed_values:
+            return
+        if self.frames:
+            self.frames[-1].append((var, removed_values))
+            self.entries += 1
+        for listener in self.listeners:
+            listener.removed(var, removed_values)
 
-    def pop_frame_and_undo(self, domains: Dict[Var, Set[int]]):
+    def pop_frame_and_undo(self, domains: List[Domain]):
         """Undo all changes in the current frame"""
         if not self.frames:
             return
         frame = self.frames.pop()
+        self.entries -= len(frame)
         for var, removed_vals in reversed(frame):
             domains[var] |= removed_vals
+            for listener in self.listeners:
+                listener.restored(var, removed_vals)
+
 
+SEARCHES = ("chronological", "iterative", "cbj")
+RESTARTS = ("none", "luby", "geometric")
+
+# Nodes in the first restart run; 100 cut the hardest puzzles off 30+ times
+RESTART_BASE = 1000
+
+# Most nogoods kept at once; the oldest are dropped first
+MAX_NOGOODS = 100_000
+
+
+class ConflictSets:
+    """
+    Trail listener that keeps, for every variable, a bitmask of the decision levels
+    (bit l = the assignment made at trail depth l) that explain the values removed
+    from its domain. Removals at depth 0 (givens, initial propagation) need no explanation.
 
-def solve(csp: CSP) -> bool:
+    A value b taken from X while a peer Y has the domain {b} is explained by Y's mask
+    (that covers decisions and forward checking as well as AC-3). Removals made by
+    unit rules fall back to the union of all peers' masks, which is larger but still
+    a valid explanation, since every all-different rule only looks at X's peers. With a
+    predicate constraint (constraints.kind_of) every removal gets that union.
+    """
+
+    def __init__(self, csp: CSP, trail: Trail):
+        self.csp = csp
+        self.trail = trail
+        self.expl = [0] * len(csp.domains)
+        self.decision: Optional[Var] = None  # set by the search just before an assignment
+        self.neq = constraints.is_neq(csp.constraint)
+        self._log: List[Tuple[Var, int]] = []
+
+    def removed(self, var: Var, mask: Domain) -> None:
+        level = len(self.trail.frames)
+        if not level:
+            return
+        if var == self.decision:
+            why = 1 << level
+            self.decision = None
+        else:
+            why = 0
+            domains = self.csp.domains
+            peers = self.csp.neighbors[var]
+            if not self.neq:
+                for p in peers:
+                    why |= self.expl[p]
+            rest = mask if self.neq else 0
+            while rest:
+                b = rest & -rest
+                rest ^= b
+                for p in peers:
+                    if domains[p] == b:
+                        why |= self.expl[p]
+                        break
+                else:
+                    for p in peers:
+                        why |= self.expl[p]
+                    break
+        old = self.expl[var]
+        self._log.append((var, old))
+        self.expl[var] = old | why
+
+    def restored(self, var: Var, mask: Domain) -> None:
+        # The trail undoes entries in exactly the reverse order they were recorded
+        v, old = self._log.pop()
+        self.expl[v] = old
+
+    def failure(self) -> int:
+        """Explanation of a failed propagation: the mask of a wiped-out variable if there is one"""
+        for var, domain in enumerate(self.csp.domains):
+            if domain == 0:
+                return self.expl[var]
+        conflict = 0
+        for mask in self.expl:
+            conflict |= mask
+        return conflict
+
+
+class NogoodStore:
+    """
+    Sets of assignments found to be inconsistent together, of at most max_size
+    assignments each, and at most capacity of them (oldest dropped first).
+    """
+
+    def __init__(self, max_size: int, capacity: int = MAX_NOGOODS):
+        self.max_size = max_size
+        self.capacity = capacity
+        self.order: Deque[Tuple[Tuple[Var, int], ...]] = deque()
+        self.index: Dict[Tuple[Var, int], List[Tuple[Tuple[Var, int], ...]]] = {}
+
+    def add(self, conflict: int, decisions: List[Tuple[Var, int]]) -> bool:
+        """Record the decisions at the levels in the conflict mask as a nogood"""
+        literals = tuple(decisions[level - 1] for level in range(1, len(decisions) + 1) if conflict >> level & 1)
+        if not literals or len(literals) > self.max_size:
+            return False
+        self.order.append(literals)
+        for lit in literals:
+            self.index.setdefault(lit, []).append(literals)
+        if len(self.order) > self.capacity:
+            old = self.order.popleft()
+            for lit in old:
+                self.index[lit].remove(old)
+        return True
+
+    def blocked(self, csp: CSP, var: Var, value: int, conflicts: ConflictSets) -> Optional[int]:
+        """
+        If var=value would complete a recorded nogood, the conflict mask explaining
+        the other assignments in it; otherwise None.
+        """
+        for nogood in self.index.get((var, value), ()):
+            conflict = 0
+            for v, val in nogood:
+                if v == var:
+                    continue
+                if csp.domains[v] != bitset.bit(val):
+                    break
+                conflict |= conflicts.expl[v]
+            else:
+                return conflict
+        return None
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+
+class _Restart(Exception):
+    """Raised when a search run has used up its node budget"""
+
+
+def luby(i: int) -> int:
+    """i-th term (from 1) of the Luby sequence 1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8, ..."""
+    k = 1
+    while (1 << k) - 1 < i:
+        k += 1
+    while i != (1 << k) - 1:
+        i -= (1 << (k - 1)) - 1
+        k = 1
+        while (1 << k) - 1 < i:
+            k += 1
+    return 1 << (k - 1)
+
+
+def solve(csp: CSP, engine: str = "ac3", incremental_mrv: bool = True, propagation: str = "ac3", stats: Optional[SolverStats] = None, search: str = "chronological", max_nogood_size: int = 0,
+          restarts: str = "none", restart_base: int = RESTART_BASE, restart_factor: float = 1.5, seed: Optional[int] = None,
+          value_counts: bool = False) -> bool:
     """
     Solve CSP using backtracking with AC-3 inference
+    engine selects the arc consistency engine used for inference (see ac3.ENGINES)
+    incremental_mrv keeps MRV buckets up to date through the trail instead of rescanning
+    every variable at each node (same variable order either way)
+    propagation adds unit-level all-different rules on top of AC-3 (see alldiff.STRENGTHS)
+    stats (metrics.SolverStats) is filled with the search and propagation counters
+    search picks chronological backtracking, the same search without recursion ("iterative")
+    or conflict-directed backjumping (see SEARCHES);
+    with "cbj", max_nogood_size > 0 records nogoods of up to that many assignments
+    restarts picks a restart schedule (see RESTARTS), counted in stats.restarts; seed (or any
+    restart schedule) randomizes the MRV / LCV tie-breaking, reproducibly for a fixed seed.
+    Nogoods are kept across restarts.
+    value_counts keeps a heuristics.ValueCounts table on the trail for LCV and hidden
+    singles (same search either way). It pays off with propagation="hidden" on 16x16 and
+    larger grids; with plain AC-3 the update on every removal costs more than LCV saves,
+    so it is off by default (numbers in the README)
+    """
+    if search not in SEARCHES:
+        raise ValueError(f"Unknown search {search!r}, expected one of {SEARCHES}.")
+    if restarts not in RESTARTS:
+        raise ValueError(f"Unknown restart schedule {restarts!r}, expected one of {RESTARTS}.")
+    if restart_base < 1 or restart_factor <= 1:
+        raise ValueError("restart_base must be at least 1 and restart_factor greater than 1.")
+    trail, mrv = _new_trail(csp, incremental_mrv, value_counts) #to keep track of variable assignments
+    rng = random.Random(seed) if seed is not None or restarts != "none" else None
+    if search == "cbj":
+        conflicts = ConflictSets(csp, trail)
+        trail.listeners.append(conflicts)
+        nogoods = NogoodStore(max_nogood_size) if max_nogood_size > 0 else None
+
+    if search == "iterative" and mrv is None:
+        # The explicit-stack engine reads the unassigned count from the buckets
+        mrv = heuristics.MRVBuckets(csp)
+        trail.listeners.append(mrv)
+
+    def run(budget: Optional[List[int]]) -> bool:
+        if search == "iterative":
+            return _backtrack_iterative(csp, trail, engine, mrv, propagation, stats, budget, rng)
+        if search == "cbj":
+            conflicts.decision = None
+            solved, _ = _cbj(csp, trail, engine, mrv, propagation, conflicts, nogoods, [], stats, budget, rng)
+            return solved
+        return _backtrack(csp, trail, engine, mrv, propagation, stats, budget, rng)
+
+    if restarts == "none":
+        return run(None)
+    for i in itertools.count():
+        if restarts == "luby":
+            limit = restart_base * luby(i + 1)
+        else:
+            limit = int(restart_base * restart_factor ** i)
+        try:
+            return run([limit])
+        except _Restart:
+            # The run was abandoned mid-search: unwind every frame back to the root
+            while trail.frames:
+                trail.pop_frame_and_undo(csp.domains)
+            if stats is not None:
+                stats.restarts += 1
+
+
+def count_solutions(
+    csp: CSP,
+    limit: Optional[int] = 2,
+    on_solution: Optional[Callable[[List[List[int]]], None]] = None,
+    engine: str = "ac3",
+    incremental_mrv: bool = True,
+    propagation: str = "ac3",
+    stats: Optional[SolverStats] = None,
+    value_counts: bool = False,
+) -> int:
+    """
+    Count the solutions of the CSP, stopping as soon as `limit` have been found
+    (limit=None counts them all; limit=2 is the uniqueness check).
+    on_solution(grid) is called for every solution, in search order.
+    The whole search runs on one Trail and is undone at the end, so csp.domains
+    are left as they were. value_counts is as in solve().
     """
-    trail = Trail() #to keep track of variable assignments
-    return _backtrack(csp, trail)
+    if limit is not None and limit < 1:
+        raise ValueError("limit must be at least 1 (or None for no limit).")
+    trail, mrv = _new_trail(csp, incremental_mrv, value_counts)
+    found = [0]
+    _enumerate(csp, trail, engine, mrv, propagation, found, limit, on_solution, stats)
+    return found[0]
+
+
+Branch = Tuple[List[Domain], Optional[Var], int]  # (domains, var, value); var None: continue from domains as they are
 
 
-def _backtrack(csp: CSP, trail: Trail) -> bool:
+def explore(
+    csp: CSP,
+    node_budget: Optional[int] = None,
+    limit: Optional[int] = 1,
+    on_solution: Optional[Callable[[List[List[int]]], None]] = None,
+    engine: str = "ac3",
+    propagation: str = "ac3",
+    stats: Optional[SolverStats] = None,
+) -> Tuple[int, List[Branch]]:
+    """
+    The iterative search for at most node_budget nodes, reporting up to `limit`
+    solutions to on_solution (limit=None: all of them).
+    Returns (solutions found, open branches). If the budget ran out first, the open
+    branches are the parts of the tree not searched yet, as domain snapshots: the node
+    the search stopped at (var None) and every untried value above it (domains at the
+    node where var was chosen, to be assigned var=value). Searching all of them finds
+    every remaining solution exactly once; parallel.split_solve hands them to other workers.
+    csp.domains are left as they were.
+    """
+    trail, mrv = _new_trail(csp, True)
+    stack: List[Tuple[Var, Iterator[int]]] = []
+    found = 0
+    nodes = 0
+    while True:
+        if node_budget is not None and nodes >= node_budget:
+            return found, _open_branches(csp, trail, stack)
+        nodes += 1
+        if stats is not None:
+            _count_node(trail, stats)
+        retreat = True
+        if mrv.n_unassigned:
+            var = heuristics.select_var_mrv(csp, mrv, stats)
+            stack.append((var, iter(heuristics.order_values_lcv(csp, var, stats, counts=trail.counts))))
+            retreat = False
+        elif csp.is_solved():
+            found += 1
+            if on_solution is not None:
+                on_solution(csp.to_grid())
+            if limit is not None and found >= limit:
+                while trail.frames:
+                    trail.pop_frame_and_undo(csp.domains)
+                return found, []
+
+        while True:
+            if retreat:
+                if not stack:
+                    return found, []
+                trail.pop_frame_and_undo(csp.domains)
+            var, values = stack[-1]
+            for value in values:
+                trail.push_frame()
+                if _assign_and_infer(csp, var, value, trail, engine, propagation, stats):
+                    break
+                trail.pop_frame_and_undo(csp.domains)
+            else:
+                stack.pop()
+                retreat = True
+                continue
+            break
+
+
+def _open_branches(csp: CSP, trail: Trail, stack: List[Tuple[Var, Iterator[int]]]) -> List[Branch]:
+    """Unwind an interrupted explore() to the root, collecting what it has not searched"""
+    branches: List[Branch] = [(list(csp.domains), None, 0)]
+    for var, values in reversed(stack):
+        trail.pop_frame_and_undo(csp.domains) # back to the node where var was chosen
+        snapshot = list(csp.domains)
+        branches.extend((snapshot, var, value) for value in values)
+    return branches
+
+
+def _new_trail(csp: CSP, incremental_mrv: bool, value_counts: bool = False) -> Tuple[Trail, Optional[heuristics.MRVBuckets]]:
+    trail = Trail()
+    mrv = None
+    if incremental_mrv:
+        mrv = heuristics.MRVBuckets(csp)
+        trail.listeners.append(mrv)
+    if value_counts and constraints.is_neq(csp.constraint):
+        # The table assumes all-different units; other constraints keep the scans
+        trail.counts = heuristics.ValueCounts(csp)
+        trail.listeners.append(trail.counts)
+    return trail, mrv
+
+
+def _backtrack(csp: CSP, trail: Trail, engine: str = "ac3", mrv: Optional[heuristics.MRVBuckets] = None, propagation: str = "ac3", stats: Optional[SolverStats] = None,
+               budget: Optional[List[int]] = None, rng: Optional[random.Random] = None) -> bool:
+    if stats is not None:
+        _count_node(trail, stats)
+    if budget is not None:
+        budget[0] -= 1
+        if budget[0] < 0:
+            raise _Restart
+
     # if all variables are assigned and constraints are satisfied, move on
     if csp.is_solved():
         return True
     
     #Choose the next variable to assign using MRV
-    var = heuristics.select_var_mrv(csp)
+    var = heuristics.select_var_mrv(csp, mrv, stats, rng)
 
     
     if var is None:
         return False  # No unassigned variable found but puzzle not solved?
 
     # Get the values for the vairable, ordered by LCV
-    values = heuristics.order_values_lcv(csp, var)
+    values = heuristics.order_values_lcv(csp, var, stats, rng, trail.counts)
 
 
     for value in values:
         trail.push_frame() #Use the Trail to save the state before trying the value
-        if _assign_and_infer(csp, var, value, trail):
-            if _backtrack(csp, trail):
+        if _assign_and_infer(csp, var, value, trail, engine, propagation, stats):
+            if _backtrack(csp, trail, engine, mrv, propagation, stats, budget, rng):
                 return True    
         trail.pop_frame_and_undo(csp.domains) #If it doesnt work use the trail to undo the changes to try another value
+        if stats is not None:
+            stats.backtracks += 1
 
     return False #No other value works, so backtrack
 
 
-def _assign_and_infer(csp: CSP, var: Var, value: int, trail: Trail) -> bool:
+def _backtrack_iterative(csp: CSP, trail: Trail, engine: str, mrv: heuristics.MRVBuckets, propagation: str,
+                         stats: Optional[SolverStats] = None, budget: Optional[List[int]] = None,
+                         rng: Optional[random.Random] = None) -> bool:
+    """
+    _backtrack with an explicit stack. stack[i] is the variable assigned at depth i
+    and the values it has left to try; its current value is trail frame i.
+    Only a node with no unassigned variable left pays for the full csp.is_solved() check.
+    """
+    stack: List[Tuple[Var, Iterator[int]]] = []
+    while True:
+        # Entered a node: the root, or the state after the last assignment that survived inference
+        if stats is not None:
+            _count_node(trail, stats)
+        if budget is not None:
+            budget[0] -= 1
+            if budget[0] < 0:
+                raise _Restart
+        if mrv.n_unassigned:
+            var = heuristics.select_var_mrv(csp, mrv, stats, rng)
+            stack.append((var, iter(heuristics.order_values_lcv(csp, var, stats, rng, trail.counts))))
+            retreat = False
+        elif csp.is_solved():
+            return True
+        else:
+            retreat = True  # every cell fixed but not a solution
+
+        # Find the next value that survives inference, unwinding exhausted nodes
+        while True:
+            if retreat:
+                if not stack:
+                    return False
+                trail.pop_frame_and_undo(csp.domains) # undo the assignment that led to the failed node
+                if stats is not None:
+                    stats.backtracks += 1
+            var, values = stack[-1]
+            for value in values:
+                trail.push_frame()
+                if _assign_and_infer(csp, var, value, trail, engine, propagation, stats):
+                    break
+                trail.pop_frame_and_undo(csp.domains)
+                if stats is not None:
+                    stats.backtracks += 1
+            else:
+                stack.pop()
+                retreat = True
+                continue
+            break
+
+
+def _cbj(csp: CSP, trail: Trail, engine: str, mrv: Optional[heuristics.MRVBuckets], propagation: str,
+         conflicts: ConflictSets, nogoods: Optional[NogoodStore], decisions: List[Tuple[Var, int]],
+         stats: Optional[SolverStats] = None, budget: Optional[List[int]] = None,
+         rng: Optional[random.Random] = None) -> Tuple[bool, int]:
+    """
+    Backjumping search. Returns (solved, conflict); on failure conflict is the mask of
+    decision levels that together rule out this node, and every level between the
+    deepest of them and this one is unwound without trying its other values.
+    """
+    if stats is not None:
+        _count_node(trail, stats)
+    if budget is not None:
+        budget[0] -= 1
+        if budget[0] < 0:
+            raise _Restart
+    if csp.is_solved():
+        return True, 0
+
+    var = heuristics.select_var_mrv(csp, mrv, stats, rng)
+    if var is None:
+        return False, conflicts.failure()
+
+    bit = 1 << (len(trail.frames) + 1)  # level of the assignments made here
+    conflict = 0
+    for value in heuristics.order_values_lcv(csp, var, stats, rng, trail.counts):
+        if nogoods is not None:
+            blocked = nogoods.blocked(csp, var, value, conflicts)
+            if blocked is not None:
+                conflict |= blocked
+                if stats is not None:
+                    stats.nogood_prunes += 1
+                continue
+
+        trail.push_frame()
+        decisions.append((var, value))
+        conflicts.decision = var
+        if _assign_and_infer(csp, var, value, trail, engine, propagation, stats):
+            solved, sub = _cbj(csp, trail, engine, mrv, propagation, conflicts, nogoods, decisions, stats, budget, rng)
+            if solved:
+                return True, 0
+        else:
+            sub = conflicts.failure()
+        conflicts.decision = None
+        decisions.pop()
+        trail.pop_frame_and_undo(csp.domains)
+        if stats is not None:
+            stats.backtracks += 1
+
+        if not sub & bit:
+            # This assignment played no part in the failure, so neither would any other value
+            if stats is not None:
+                stats.backjumps += 1
+            return False, sub
+        conflict |= sub & ~bit
+
+    # Values pruned from var before this node are part of the reason too
+    conflict |= conflicts.expl[var]
+    if nogoods is not None and nogoods.add(conflict, decisions) and stats is not None:
+        stats.nogoods += 1
+    return False, conflict
+
+
+def _count_node(trail: Trail, stats: SolverStats) -> None:
+    """One more search node; the trail has one frame per assignment above it"""
+    stats.nodes += 1
+    depth = len(trail.frames)
+    if depth > stats.max_depth:
+        stats.max_depth = depth
+    if trail.entries > stats.max_trail_depth:
+        stats.max_trail_depth = trail.entries
+
+
+def _enumerate(csp: CSP, trail: Trail, engine: str, mrv: Optional[heuristics.MRVBuckets], propagation: str,
+               found: List[int], limit: Optional[int], on_solution, stats: Optional[SolverStats] = None) -> bool:
+    """Same search as _backtrack but keeps going after a solution; True once the limit is hit"""
+    if stats is not None:
+        _count_node(trail, stats)
+    if csp.is_solved():
+        found[0] += 1
+        if on_solution is not None:
+            on_solution(csp.to_grid())
+        return limit is not None and found[0] >= limit
+
+    var = heuristics.select_var_mrv(csp, mrv, stats)
+    if var is None:
+        return False
+
+    for value in heuristics.order_values_lcv(csp, var, stats, counts=trail.counts):
+        trail.push_frame()
+        before = found[0]
+        stop = (_assign_and_infer(csp, var, value, trail, engine, propagation, stats)
+                and _enumerate(csp, trail, engine, mrv, propagation, found, limit, on_solution, stats))
+        trail.pop_frame_and_undo(csp.domains) #always undo, the next solution starts from here
+        if stop:
+            return True
+        if stats is not None and found[0] == before:
+            stats.backtracks += 1
+
+    return False
+
+
+def _assign_and_infer(csp: CSP, var: Var, value: int, trail: Trail, engine: str = "ac3", propagation: str = "ac3", stats: Optional[SolverStats] = None) -> bool:
     """
-    Assign a value to a variable and run AC-3 inference.
+    Assign a value to a variable and run AC-3 inference (plus the all-different
+    unit rules chosen by propagation).
+    Forward checking strips the value from the neighbours for != constraints
+    (constraints.is_neq) and revises every neighbour against var for any other check.
     Returns False if inconsistency is detected anywhere.
     """
 
-    # Record domain changes for var itself
-    removed_vals = csp.domains[var] - {value}
+    value_bit = bitset.bit(value)
 
-    #Use trail to keep track of domain before we change it
-    trail.record(var, removed_vals)
+    # Record domain changes for var itself
+    removed_vals = csp.domains[var] & ~value_bit
 
     # Assign the value
-    csp.domains[var] = {value}
+    csp.domains[var] = value_bit
+
+    #Use trail to keep track of what was removed so it can be put back
+    trail.record(var, removed_vals)
 
     # Forward checking
+    shrunk = []
+    neq = constraints.is_neq(csp.constraint)
     for neighbor in csp.neighbors[var]:
+        if not neq:
+            # Generic check: drop whatever no longer has a support in var's new domain
+            if ac3.revise(csp, neighbor, var, trail, stats):
+                if csp.domains[neighbor] == 0:
+                    return False
+                shrunk.append(neighbor)
+            continue
         #If the value we assigned is in the neighbors domain, remove it
-        if value in csp.domains[neighbor]:
-            trail.record(neighbor, {value})
-            csp.domains[neighbor].remove(value)
+        domain = csp.domains[neighbor]
+        if domain & value_bit:
+            domain &= ~value_bit
+            csp.domains[neighbor] = domain
+            trail.record(neighbor, value_bit)
+            if stats is not None:
+                stats.values_pruned += 1
             #If it empties the neighbours domain, its a dead end
-            if len(csp.domains[neighbor]) == 0:
+            if not domain:
                 return False
+            # Under != a neighbour only prunes its own neighbours once it is down to one value
+            if not domain & (domain - 1):
+                shrunk.append(neighbor)
             
 
     # Run AC-3 on neighbors of var for further inference
+    # (AC-3 records its removals on the same trail so a backtrack undoes them too)
     arcs = []
     for neighbor in csp.neighbors[var]:
         arcs.append((neighbor, var))
-    is_consistent, _ = ac3.ac3(csp, queue=arcs, track_queue=False)
+    # Forward checking left these neighbours with one value (or, for a generic check, just
+    # smaller domains), so the arcs pointing at them have to be revised too
+    for neighbor in shrunk:
+        for Xk in csp.neighbors[neighbor]:
+            if Xk != var:
+                arcs.append((Xk, neighbor))
+    is_consistent, _ = alldiff.propagate(csp, propagation, arcs, trail, engine, stats=stats)
 
     #Returns True ONLY if it still consistent after inference
     return is_consistent
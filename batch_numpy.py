@@ -0,0 +1,142 @@
+"""
+CP468 — batch_numpy.py
+Vectorized propagation for many puzzles at once (requires NumPy).
+
+A batch of N puzzles is held as an (N, cells, size) boolean candidate tensor.
+Singleton elimination and hidden singles are run as array operations over the
+whole batch until nothing changes; only the puzzles that are still open are
+turned into a CSP and handed to backtracking.solve.
+
+Functions:
+    - grids_to_candidates(grids, topology) -> (N, cells, size) bool array
+    - propagate_batch(cand, topology) -> (N,) status array (SOLVED / OPEN / FAILED)
+    - candidates_to_csp(cand, topology) -> CSP
+    - solve_batch(grids, ...) -> list of result dicts
+"""
+
+from __future__ import annotations
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from sudoku_csp import CSP, box_size, unit_constraint
+from topology import Topology, get_topology
+import backtracking
+
+FAILED = -1
+OPEN = 0
+SOLVED = 1
+
+
+@lru_cache(maxsize=None)
+def _matrices(box: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(cells, cells) peer matrix and (units, cells) unit membership matrix as int16"""
+    topo = get_topology(box)
+    peers = np.zeros((topo.n_cells, topo.n_cells), dtype=np.int16)
+    for i, ps in enumerate(topo.peers):
+        peers[i, list(ps)] = 1
+    units = np.zeros((len(topo.units), topo.n_cells), dtype=np.int16)
+    for u, cells in enumerate(topo.units):
+        units[u, list(cells)] = 1
+    return peers, units
+
+
+def grids_to_candidates(grids: Sequence[Sequence[Sequence[int]]], topology: Topology) -> np.ndarray:
+    """Stack grids (0 = empty) into an (N, cells, size) candidate tensor"""
+    size = topology.size
+    values = np.asarray(grids, dtype=np.int16).reshape(len(grids), topology.n_cells)
+    if values.min(initial=0) < 0 or values.max(initial=0) > size:
+        raise ValueError(f"Grid values must be integers in 0..{size}.")
+    digits = np.arange(1, size + 1, dtype=np.int16)
+    cand = values[:, :, None] == digits
+    cand[values == 0] = True
+    return cand
+
+
+def propagate_batch(cand: np.ndarray, topology: Topology) -> np.ndarray:
+    """
+    Run singleton elimination and hidden singles on every puzzle (in place)
+    until no puzzle changes. Returns the status of each puzzle.
+    """
+    peers, units = _matrices(topology.box)
+    status = np.full(len(cand), OPEN, dtype=np.int8)
+    active = np.arange(len(cand))
+
+    while active.size:
+        c = cand[active]
+        before = c.copy()
+
+        # Singleton elimination: a placed value is removed from all peers
+        placed = c & (c.sum(axis=2) == 1)[:, :, None]
+        c &= ~(np.matmul(peers, placed.astype(np.int16)) > 0)
+
+        # Hidden singles: a value with one possible cell in a unit is placed there
+        counts = np.matmul(units, c.astype(np.int16))              # (n, units, size)
+        unique = np.matmul(units.T, (counts == 1).astype(np.int16)) > 0
+        hidden = c & unique
+        forced = hidden.sum(axis=2) == 1
+        c = np.where(forced[:, :, None], hidden, c)
+
+        failed = (
+            (c.sum(axis=2) == 0).any(axis=1)
+            | (counts == 0).any(axis=(1, 2))
+            | (hidden.sum(axis=2) > 1).any(axis=1)
+        )
+        changed = (c != before).any(axis=(1, 2))
+        # Only trust an all-singleton grid once a full round found nothing to do,
+        # a freshly placed hidden single may still clash with a peer
+        solved = ~failed & ~changed & (c.sum(axis=2) == 1).all(axis=1)
+
+        cand[active] = c
+        status[active[failed]] = FAILED
+        status[active[solved]] = SOLVED
+        active = active[changed & ~failed & ~solved]
+
+    return status
+
+
+def candidates_to_csp(cand: np.ndarray, topology: Topology) -> CSP:
+    """
+    Build a CSP whose domains are the bitmasks of one (cells, size) candidate slice, with
+    the same unit all-different constraint as sudoku_csp_from_grid
+    """
+    weights = 1 << np.arange(topology.size, dtype=np.int64)
+    masks = (cand.astype(np.int64) * weights).sum(axis=1)
+    return CSP(topology, [int(m) for m in masks], unit_constraint(topology.box))
+
+
+def solve_batch(
+    grids: Sequence[Sequence[Sequence[int]]],
+    box: Optional[int] = None,
+    engine: str = "ac3",
+    propagation: str = "hidden",
+) -> List[dict]:
+    """
+    Solve a list of grids: vectorized propagation for the whole batch, then
+    backtracking (with the given engine / propagation strength) for the rest.
+    All grids must have the same size; box is inferred from the first one unless given.
+    Each result has "status" ("propagation", "backtracking", "unsolvable" or
+    "no solution") and "grid" (the solution, or None).
+    """
+    if not grids:
+        return []
+    topo = get_topology(box if box is not None else box_size(len(grids[0])))
+    cand = grids_to_candidates(grids, topo)
+    status = propagate_batch(cand, topo)
+
+    results: List[dict] = []
+    digits = np.arange(1, topo.size + 1)
+    for i in range(len(grids)):
+        if status[i] == FAILED:
+            results.append({"status": "unsolvable", "grid": None})
+        elif status[i] == SOLVED:
+            solution = (cand[i] * digits).sum(axis=1).reshape(topo.size, topo.size)
+            results.append({"status": "propagation", "grid": solution.tolist()})
+        else:
+            csp = candidates_to_csp(cand[i], topo)
+            if backtracking.solve(csp, engine=engine, propagation=propagation):
+                results.append({"status": "backtracking", "grid": csp.to_grid()})
+            else:
+                results.append({"status": "no solution", "grid": None})
+    return results
@@ -0,0 +1,123 @@
+"""
+CP468 — bench_scaling.py
+How build, propagation and search time grow with the board size.
+
+For every box size (2 -> 4x4, 3 -> 9x9, 4 -> 16x16, 5 -> 25x25) a few random
+puzzles are generated from a shuffled solved grid with a fraction of the cells
+blanked, then each phase is timed separately:
+    - topology : building the shared Topology (units, peers, arc arrays)
+    - build    : sudoku_csp_from_grid on an already cached topology
+    - propagate: alldiff.propagate (AC-3 plus the chosen unit rules)
+    - search   : backtracking.solve on what propagation left open
+The arc count grows as n^2 * (3n - 2 sqrt(n) - 1) for an n x n board, which is
+what the per-arc Python costs of AC-3 multiply with.
+
+Usage:
+    python bench_scaling.py [--max-box 4] [--puzzles 3] [--holes 0.5] [--propagation hidden]
+    --max-box 5 adds 25x25 boards, whose search phase takes minutes in pure Python.
+"""
+
+from __future__ import annotations
+import argparse
+import random
+import statistics
+import time
+from typing import List
+
+from sudoku_csp import sudoku_csp_from_grid
+from topology import get_topology
+import ac3
+import alldiff
+import backtracking
+
+Grid = List[List[int]]
+
+
+def solved_grid(box: int, rng: random.Random) -> Grid:
+    """A random valid solution: the canonical pattern with rows, columns and digits shuffled"""
+    size = box * box
+
+    def shuffled_lines() -> List[int]:
+        bands = rng.sample(range(box), box)
+        return [b * box + r for b in bands for r in rng.sample(range(box), box)]
+
+    rows = shuffled_lines()
+    cols = shuffled_lines()
+    digits = rng.sample(range(1, size + 1), size)
+    # (box * (r % box) + r // box + c) % size is a valid Sudoku for any box size
+    return [[digits[(box * (r % box) + r // box + c) % size] for c in cols] for r in rows]
+
+
+def make_puzzle(box: int, holes: float, rng: random.Random) -> Grid:
+    """Blank a fraction `holes` of the cells of a random solution (not necessarily unique)"""
+    grid = solved_grid(box, rng)
+    size = box * box
+    for cell in rng.sample(range(size * size), int(holes * size * size)):
+        grid[cell // size][cell % size] = 0
+    return grid
+
+
+def bench_box(box: int, puzzles: int, holes: float, engine: str, propagation: str, seed: int) -> dict:
+    rng = random.Random(seed + box)
+    grids = [make_puzzle(box, holes, rng) for _ in range(puzzles)]
+
+    get_topology.cache_clear()
+    t0 = time.perf_counter()
+    topo = get_topology(box)
+    topology_sec = time.perf_counter() - t0
+
+    build, propagate, search = [], [], []
+    solved = 0
+    for grid in grids:
+        t0 = time.perf_counter()
+        csp = sudoku_csp_from_grid(grid)
+        t1 = time.perf_counter()
+        consistent, _ = alldiff.propagate(csp, propagation, engine=engine)
+        t2 = time.perf_counter()
+        ok = consistent and (csp.is_solved() or backtracking.solve(csp, engine=engine, propagation=propagation))
+        t3 = time.perf_counter()
+        build.append(t1 - t0)
+        propagate.append(t2 - t1)
+        search.append(t3 - t2)
+        solved += bool(ok)
+
+    return {
+        "box": box,
+        "size": topo.size,
+        "cells": topo.n_cells,
+        "arcs": len(topo.arc_src),
+        "topology": topology_sec,
+        "build": statistics.median(build),
+        "propagate": statistics.median(propagate),
+        "search": statistics.median(search),
+        "solved": solved,
+        "puzzles": puzzles,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sudoku CSP scaling benchmark (4x4 .. 25x25)")
+    parser.add_argument("--min-box", type=int, default=2)
+    parser.add_argument("--max-box", type=int, default=4)
+    parser.add_argument("--puzzles", type=int, default=3, help="random puzzles per board size")
+    parser.add_argument("--holes", type=float, default=0.5, help="fraction of blank cells")
+    parser.add_argument("--ac3-engine", choices=ac3.ENGINES, default="ac3")
+    parser.add_argument("--propagation", choices=alldiff.STRENGTHS, default="hidden")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if not 0.0 <= args.holes < 1.0:
+        parser.error("--holes must be in [0, 1)")
+
+    print(f"engine={args.ac3_engine} propagation={args.propagation} holes={args.holes:.0%} "
+          f"puzzles/size={args.puzzles} (median times in ms)\n")
+    print(f"{'board':>7} {'cells':>6} {'arcs':>8} | {'topology':>9} {'build':>8} {'propagate':>10} {'search':>10} | solved")
+    print("-" * 78)
+    for box in range(args.min_box, args.max_box + 1):
+        r = bench_box(box, args.puzzles, args.holes, args.ac3_engine, args.propagation, args.seed)
+        board = f"{r['size']}x{r['size']}"
+        print(f"{board:>7} {r['cells']:>6} {r['arcs']:>8} | {r['topology'] * 1e3:>9.2f} {r['build'] * 1e3:>8.2f} "
+              f"{r['propagate'] * 1e3:>10.2f} {r['search'] * 1e3:>10.2f} | {r['solved']}/{r['puzzles']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+CP468 — benchmark.py
+Reproducible benchmark runner with JSON output and baseline comparison.
+
+Every puzzle is solved `warmup` times untimed and then `repeats` times timed,
+with each phase measured on its own:
+    - build     : sudoku_csp_from_grid
+    - propagate : alldiff.propagate (AC-3 plus the chosen unit rules)
+    - search    : backtracking.solve (0 when propagation already decided the puzzle)
+    - total     : the three together
+For each phase the report gives median / p95 / min over the repeats of the
+corpus-wide sum, plus the median per puzzle. --save writes it as JSON;
+--baseline compares against an earlier JSON run and exits with status 1 if a
+phase (or a single puzzle) got slower by more than --threshold.
+
+Usage:
+    python benchmark.py [paths ...] [--repeats 5] [--warmup 1] [--save out.json]
+    python benchmark.py --baseline before.json --threshold 0.10
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from sudoku_csp import sudoku_csp_from_grid
+import ac3
+import alldiff
+import backtracking
+import io_utils
+from metrics import percentile
+
+PHASES = ("build", "propagate", "search", "total")
+
+# Differences below this many seconds are timer noise, never a regression
+NOISE_FLOOR = 0.0005
+
+
+def summarize(values: Sequence[float]) -> Dict[str, float]:
+    return {"median": statistics.median(values), "p95": percentile(values, 95), "min": min(values)}
+
+
+def time_puzzle(grid: List[List[int]], engine: str, propagation: str) -> Tuple[Dict[str, float], str]:
+    """Solve one puzzle, returning the time of every phase and the outcome"""
+    t0 = time.perf_counter()
+    csp = sudoku_csp_from_grid(grid)
+    t1 = time.perf_counter()
+    consistent, _ = alldiff.propagate(csp, propagation, engine=engine)
+    t2 = time.perf_counter()
+    if not consistent:
+        outcome = "unsolvable"
+    elif csp.is_solved():
+        outcome = "propagation"
+    else:
+        outcome = "backtracking" if backtracking.solve(csp, engine=engine, propagation=propagation) else "no solution"
+    t3 = time.perf_counter()
+    times = {"build": t1 - t0, "propagate": t2 - t1, "search": t3 - t2, "total": t3 - t0}
+    return times, outcome
+
+
+def default_paths() -> List[str]:
+    base = io_utils._puzzle_dir()
+    return [str(base / name) for name in ("valid", "unsolvable", "solved", "multiple_solutions")]
+
+
+def load_corpus(paths: Iterable[str], limit: int = 0) -> List[Tuple[str, List[List[int]]]]:
+    """(label, grid) pairs from every path; labels are prefixed with the path's name"""
+    corpus = []
+    for path in paths:
+        prefix = Path(path).name
+        for label, grid in io_utils.iter_puzzles(path):
+            corpus.append((f"{prefix}/{label}" if Path(path).is_dir() else label, grid))
+            if limit and len(corpus) >= limit:
+                return corpus
+    return corpus
+
+
+def run_benchmark(corpus, repeats: int = 5, warmup: int = 1, engine: str = "ac3", propagation: str = "ac3") -> dict:
+    """Time the corpus and return the JSON-ready report"""
+    per_puzzle: Dict[str, Dict[str, List[float]]] = {label: {p: [] for p in PHASES} for label, _ in corpus}
+    outcomes: Dict[str, str] = {}
+    corpus_totals: Dict[str, List[float]] = {p: [] for p in PHASES}
+
+    for label, grid in corpus:
+        for _ in range(warmup):
+            time_puzzle(grid, engine, propagation)
+
+    # Repeats are the outer loop so a slow drift (thermal, other load) spreads over all puzzles
+    for _ in range(repeats):
+        sums = dict.fromkeys(PHASES, 0.0)
+        for label, grid in corpus:
+            times, outcomes[label] = time_puzzle(grid, engine, propagation)
+            for p in PHASES:
+                per_puzzle[label][p].append(times[p])
+                sums[p] += times[p]
+        for p in PHASES:
+            corpus_totals[p].append(sums[p])
+
+    return {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "engine": engine,
+            "propagation": propagation,
+            "repeats": repeats,
+            "warmup": warmup,
+            "puzzles": len(corpus),
+        },
+        "phases": {p: summarize(corpus_totals[p]) for p in PHASES},
+        "puzzles": {
+            label: {"outcome": outcomes[label], **{p: statistics.median(per_puzzle[label][p]) for p in PHASES}}
+            for label, _ in corpus
+        },
+    }
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> List[str]:
+    """
+    Lines describing every phase / puzzle whose median got slower than the baseline
+    by more than threshold (0.10 = 10%). Puzzles missing from either run are skipped.
+    """
+    regressions = []
+
+    def check(name: str, new: float, old: float) -> None:
+        if new - old > NOISE_FLOOR and new > old * (1 + threshold):
+            change = (new / old - 1) * 100 if old > 0 else float("inf")
+            regressions.append(f"{name:<45} {old * 1e3:>10.3f} ms -> {new * 1e3:>10.3f} ms  (+{change:.1f}%)")
+
+    for p in PHASES:
+        if p in baseline.get("phases", {}):
+            check(f"[phase] {p}", report["phases"][p]["median"], baseline["phases"][p]["median"])
+    old_puzzles = baseline.get("puzzles", {})
+    for label, stats in report["puzzles"].items():
+        if label in old_puzzles:
+            check(label, stats["total"], old_puzzles[label]["total"])
+    return regressions
+
+
+def print_report(report: dict) -> None:
+    meta = report["meta"]
+    print("\n==================== BENCHMARK ====================")
+    print(f"Puzzles               : {meta['puzzles']}")
+    print(f"Engine / propagation  : {meta['engine']} / {meta['propagation']}")
+    print(f"Repeats (warmup)      : {meta['repeats']} ({meta['warmup']})")
+    print(f"Python                : {meta['implementation']} {meta['python']} ({meta['machine']})")
+    print("---------------------------------------------------")
+    print(f"{'phase':<12} {'median ms':>12} {'p95 ms':>12} {'min ms':>12}")
+    for p in PHASES:
+        s = report["phases"][p]
+        print(f"{p:<12} {s['median'] * 1e3:>12.3f} {s['p95'] * 1e3:>12.3f} {s['min'] * 1e3:>12.3f}")
+    print("---------------------------------------------------")
+    print("Slowest puzzles (median total):")
+    slowest = sorted(report["puzzles"].items(), key=lambda kv: kv[1]["total"], reverse=True)[:10]
+    for label, stats in slowest:
+        print(f"  {label:<40} : {stats['outcome']:<12} | {stats['total'] * 1e3:.3f} ms")
+    print("===================================================")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sudoku CSP benchmark runner")
+    parser.add_argument("paths", nargs="*", help="puzzle directories / multi-puzzle files / archives (default: test_puzzles/*)")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--limit", type=int, default=0, help="only the first N puzzles of the corpus")
+    parser.add_argument("--ac3-engine", choices=ac3.ENGINES, default="ac3")
+    parser.add_argument("--propagation", choices=alldiff.STRENGTHS, default="ac3")
+    parser.add_argument("--save", help="write the report as JSON to this file")
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown before flagging (0.10 = 10%%)")
+    args = parser.parse_args()
+    if args.repeats < 1 or args.warmup < 0:
+        parser.error("--repeats must be at least 1 and --warmup at least 0")
+
+    corpus = load_corpus(args.paths or default_paths(), args.limit)
+    if not corpus:
+        print("No puzzles found.")
+        sys.exit(1)
+    print(f"[INFO] Benchmarking {len(corpus)} puzzle(s), {args.warmup} warmup + {args.repeats} timed run(s) each")
+
+    report = run_benchmark(corpus, args.repeats, args.warmup, args.ac3_engine, args.propagation)
+    print_report(report)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[INFO] Report written to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        print(f"\nCompared with {args.baseline} (threshold {args.threshold:.0%}):")
+        for key in ("engine", "propagation", "python", "machine"):
+            old = baseline.get("meta", {}).get(key)
+            if old != report["meta"][key]:
+                print(f"  [WARN] {key} differs from the baseline: {old} -> {report['meta'][key]}")
+        if regressions:
+            for line in regressions:
+                print(f"  REGRESSION {line}")
+            sys.exit(1)
+        print("  no regressions")
+
+
+if __name__ == "__main__":
+    main()
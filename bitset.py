@@ -0,0 +1,63 @@
+"""
+CP468 — bitset.py
+Bitmask domain helpers. A domain is stored as a plain int where bit (v - 1)
+is set iff value v is still a candidate, so a 9x9 cell needs 9 bits.
+
+Functions:
+    - bit(value) -> int
+    - full_mask(n) -> int
+    - mask_of(values) -> int
+    - popcount(mask) -> int
+    - lowest_bit(mask) -> int
+    - lowest_value(mask) -> int
+    - is_singleton(mask) -> bool
+    - values(mask) -> Iterator[int]
+"""
+
+from typing import Iterable, Iterator
+
+
+def bit(value: int) -> int:
+    """Single-bit mask for a value (1-based)"""
+    return 1 << (value - 1)
+
+
+def full_mask(n: int) -> int:
+    """Mask with values 1..n all present"""
+    return (1 << n) - 1
+
+
+def mask_of(values: Iterable[int]) -> int:
+    """Build a mask from an iterable of values"""
+    mask = 0
+    for v in values:
+        mask |= 1 << (v - 1)
+    return mask
+
+
+def popcount(mask: int) -> int:
+    """Number of values left in the domain"""
+    return mask.bit_count()
+
+
+def lowest_bit(mask: int) -> int:
+    """Isolate the lowest set bit (0 if the mask is empty)"""
+    return mask & -mask
+
+
+def lowest_value(mask: int) -> int:
+    """Smallest value in the domain (0 if the mask is empty)"""
+    return (mask & -mask).bit_length()
+
+
+def is_singleton(mask: int) -> bool:
+    """True if exactly one value is left"""
+    return mask != 0 and mask & (mask - 1) == 0
+
+
+def values(mask: int) -> Iterator[int]:
+    """Yield the values of a mask in increasing order"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length()
+        mask ^= low
@@ -0,0 +1,238 @@
+"""
+CP468 — canon.py
+Canonical forms of Sudoku grids and an LRU solution cache keyed on them.
+
+Two puzzles that differ only by a Sudoku symmetry (digit relabeling, row swaps
+inside a band, column swaps inside a stack, band swaps, stack swaps, transposition)
+have the same solutions up to that symmetry, so one solve can serve both.
+
+canonicalize(grid) picks one representative of the grid's symmetry class:
+    - rows are ordered by relabel-invariant keys (givens per line, givens per crossing
+      line), bands by the keys of their rows, and the same for columns / stacks
+    - lines with equal keys are tried in every order, up to max_candidates
+      orderings per orientation, and both orientations (plain / transposed) are tried
+    - digits are renamed 1, 2, 3, ... in order of first appearance
+    - the lexicographically smallest result is the key
+The transform that produced the key is recorded so a cached solution can be mapped
+back onto the caller's grid. Equal keys always mean equivalent puzzles; when the tie
+enumeration is capped (nearly empty or nearly full grids, where most lines tie) two
+equivalent puzzles can still get different keys, which only costs a cache miss.
+
+Functions / classes:
+    - canonicalize(grid, max_candidates) -> Canonical
+    - Transform: apply(grid), invert(grid)
+    - SolutionCache(capacity, path): get(canonical), put(canonical, solution), save()
+"""
+
+from __future__ import annotations
+import json
+import math
+import os
+from collections import OrderedDict
+from itertools import groupby, islice, permutations, product
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+Grid = List[List[int]]
+
+# Orderings (row order x column order) tried per orientation
+MAX_CANDIDATES = 512
+
+
+class Transform:
+    """
+    grid -> canonical grid: optionally transpose, then take rows in `rows` order and
+    columns in `cols` order, then rename digit d to relabel[d] (relabel[0] == 0).
+    """
+
+    __slots__ = ("transpose", "rows", "cols", "relabel")
+
+    def __init__(self, transpose: bool, rows: Sequence[int], cols: Sequence[int], relabel: Sequence[int]) -> None:
+        self.transpose = transpose
+        self.rows = tuple(rows)
+        self.cols = tuple(cols)
+        self.relabel = tuple(relabel)
+
+    def apply(self, grid: Grid) -> Grid:
+        g = [list(col) for col in zip(*grid)] if self.transpose else grid
+        relabel = self.relabel
+        return [[relabel[g[r][c]] for c in self.cols] for r in self.rows]
+
+    def invert(self, grid: Grid) -> Grid:
+        """Map a grid in the canonical frame (e.g. a cached solution) back to the original frame"""
+        size = len(self.rows)
+        inverse = [0] * len(self.relabel)
+        for d, label in enumerate(self.relabel):
+            inverse[label] = d
+        out = [[0] * size for _ in range(size)]
+        for i, r in enumerate(self.rows):
+            row = grid[i]
+            for j, c in enumerate(self.cols):
+                out[r][c] = inverse[row[j]]
+        return [list(col) for col in zip(*out)] if self.transpose else out
+
+    def __repr__(self) -> str:
+        return f"Transform(transpose={self.transpose}, rows={self.rows}, cols={self.cols}, relabel={self.relabel})"
+
+
+class Canonical:
+    """A grid's canonical key and the transform that maps the grid onto it"""
+
+    __slots__ = ("key", "transform")
+
+    def __init__(self, key: str, transform: Transform) -> None:
+        self.key = key
+        self.transform = transform
+
+    def __repr__(self) -> str:
+        return f"Canonical({self.key!r})"
+
+
+def _tie_orders(items: Sequence[int], key: Callable[[int], tuple]) -> Iterator[Tuple[int, ...]]:
+    """items sorted by key, in every order that only permutes runs of equal keys"""
+    groups = [list(g) for _, g in groupby(sorted(items, key=key), key=key)]
+    for combo in product(*(list(permutations(g)) for g in groups)):
+        yield tuple(x for part in combo for x in part)
+
+
+def _line_orders(g: Grid, box: int) -> Iterator[Tuple[int, ...]]:
+    """Candidate row orders of g (bands kept together), from relabel-invariant keys"""
+    size = box * box
+    col_givens = [sum(1 for r in range(size) if g[r][c]) for c in range(size)]
+    row_key = {
+        r: (sum(1 for v in g[r] if v), tuple(sorted(col_givens[c] for c in range(size) if g[r][c])))
+        for r in range(size)
+    }
+    band_key = {b: tuple(sorted(row_key[b * box + i] for i in range(box))) for b in range(box)}
+
+    for bands in _tie_orders(range(box), band_key.__getitem__):
+        within = [list(_tie_orders(range(b * box, (b + 1) * box), row_key.__getitem__)) for b in bands]
+        for combo in product(*within):
+            yield tuple(r for part in combo for r in part)
+
+
+def _relabeled(g: Grid, rows: Sequence[int], cols: Sequence[int], size: int) -> Tuple[Tuple[int, ...], List[int]]:
+    """Cells in the given order with digits renamed by first appearance, and the full renaming"""
+    relabel = [0] * (size + 1)
+    nxt = 1
+    cells = []
+    for r in rows:
+        row = g[r]
+        for c in cols:
+            v = row[c]
+            if v and not relabel[v]:
+                relabel[v] = nxt
+                nxt += 1
+            cells.append(relabel[v])
+    # Digits that are not given still need a label so a solution can be mapped
+    for d in range(1, size + 1):
+        if not relabel[d]:
+            relabel[d] = nxt
+            nxt += 1
+    return tuple(cells), relabel
+
+
+def canonicalize(grid: Grid, max_candidates: int = MAX_CANDIDATES) -> Canonical:
+    """Canonical key of grid and the transform that produced it (see module docstring)"""
+    size = len(grid)
+    box = math.isqrt(size)
+    if box * box != size or any(len(row) != size for row in grid):
+        raise ValueError(f"Grid must be n x n with n a perfect square, got {size} rows.")
+
+    best: Optional[Tuple[int, ...]] = None
+    best_transform: Optional[Transform] = None
+    for transpose in (False, True):
+        g = [list(col) for col in zip(*grid)] if transpose else grid
+        gt = [list(col) for col in zip(*g)]
+        # Cap both generators before combining them: product() materializes its inputs, and
+        # nearly empty grids tie almost every line (24^5 row orders on an empty 16x16)
+        col_orders = list(islice(_line_orders(gt, box), max_candidates))
+        row_orders = list(islice(_line_orders(g, box), -(-max_candidates // len(col_orders))))
+        for rows, cols in islice(product(row_orders, col_orders), max_candidates):
+            cells, relabel = _relabeled(g, rows, cols, size)
+            if best is None or cells < best:
+                best = cells
+                best_transform = Transform(transpose, rows, cols, relabel)
+
+    sep = "" if size <= 9 else ","
+    return Canonical(sep.join(map(str, best)), best_transform)
+
+
+class SolutionCache:
+    """
+    Bounded LRU cache of solutions keyed on canonical form. A stored None means the
+    puzzle has no solution. With a path, entries are loaded from / saved to a JSON file.
+    """
+
+    def __init__(self, capacity: int = 4096, path: Optional[str] = None) -> None:
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1.")
+        self.capacity = capacity
+        self.path = path
+        self.entries: "OrderedDict[str, Optional[Tuple[int, ...]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def get(self, canonical: Canonical) -> Tuple[bool, Optional[Grid]]:
+        """(hit, solution in the caller's frame); a hit with solution None means unsolvable"""
+        if canonical.key not in self.entries:
+            self.misses += 1
+            return False, None
+        self.entries.move_to_end(canonical.key)
+        self.hits += 1
+        flat = self.entries[canonical.key]
+        if flat is None:
+            return True, None
+        size = len(canonical.transform.rows)
+        solution = [list(flat[r * size:(r + 1) * size]) for r in range(size)]
+        return True, canonical.transform.invert(solution)
+
+    def put(self, canonical: Canonical, solution: Optional[Grid]) -> None:
+        """Store the solution of the grid canonical was computed from (None: unsolvable)"""
+        flat = None
+        if solution is not None:
+            flat = tuple(v for row in canonical.transform.apply(solution) for v in row)
+        self.entries[canonical.key] = flat
+        self.entries.move_to_end(canonical.key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def load(self, path: str) -> None:
+        with open(path) as f:
+            data = json.load(f)
+        for key, flat in data.get("entries", []):
+            self.entries[key] = None if flat is None else tuple(flat)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def save(self, path: Optional[str] = None) -> None:
+        """Write the entries (least recently used first) as JSON, atomically"""
+        path = path or self.path
+        if not path:
+            raise ValueError("No cache file given.")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"version": 1, "entries": [[k, v] for k, v in self.entries.items()]}, f)
+        os.replace(tmp, path)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __repr__(self) -> str:
+        s = self.stats()
+        return (f"SolutionCache(entries={s['entries']}/{s['capacity']}, hits={s['hits']}, "
+                f"misses={s['misses']}, evictions={s['evictions']}, hit_rate={s['hit_rate']:.1%})")
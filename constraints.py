@@ -19,14 +19,33 @@ Functions to Implement:
     - def same_col(x1: Var, x2: Var) -> bool
         # True if x1 and x2 share the same column.
 
-    - def same_box(x1: Var, x2: Var) -> bool
-        # True if x1 and x2 share the same 3x3 subgrid (rows//3, cols//3 equal).
+    - def same_box(x1: Var, x2: Var, box: int = 3) -> bool
+        # True if x1 and x2 share the same box x box subgrid (rows//box, cols//box equal).
+
+Constraint descriptors:
+    A CSP's constraint is a callable check(x1, a, x2, b) -> bool. Wrapping it in a
+    Constraint adds a kind the engines can dispatch on instead of calling it per value pair:
+    - NEQ       : pairwise a != b between neighbours (NOT_EQUAL)
+    - ALLDIFF   : every scope (e.g. the Sudoku units) is all-different and neighbours are the
+                  pairs that share a scope, so the check is a != b (all_different(scopes))
+    - PREDICATE : anything else (predicate(check)); engines only use the generic loops
+    kind_of(c) also accepts plain callables: binary_neq counts as NEQ, everything else as PREDICATE.
 
 Notes:
-    - Var is a tuple[int,int] with 0-based indexing.
-    - These helpers are used by sudoku_csp.sudoku_csp_from_grid to build neighbors.
+    - CSP variables are flat cell indices (cell = r * size + c, see topology.Topology), so
+      check(x1, a, x2, b) gets two ints. The same_* helpers take 0-based (row, col) pairs
+      instead, e.g. topology.coords[var].
+    - topology.Topology builds its peer lists from its row / column / box units, not from
+      the same_* helpers; nothing in the solver calls them.
 """
 
+from typing import Callable, Sequence, Tuple
+
+NEQ = "neq"
+ALLDIFF = "alldiff"
+PREDICATE = "predicate"
+KINDS = (NEQ, ALLDIFF, PREDICATE)
+
 def binary_neq(x1, a, x2, b):
     return a != b
 
@@ -36,8 +55,48 @@ def same_row(x1, x2):
 def same_col(x1, x2):
     return x1[1] == x2[1]
 
-def same_box(x1, x2):
+def same_box(x1, x2, box=3):
     r1, c1 = x1
     r2, c2 = x2
-    return (r1 // 3 == r2 // 3) and (c1 // 3 == c2 // 3)
+    return (r1 // box == r2 // box) and (c1 // box == c2 // box)
+
+
+
+class Constraint:
+    """A binary constraint check plus the metadata engines dispatch on (see module docstring)"""
+
+    __slots__ = ("kind", "check", "scopes")
+
+    def __init__(self, kind: str, check: Callable = binary_neq, scopes: Sequence[Tuple[int, ...]] = ()) -> None:
+        if kind not in KINDS:
+            raise ValueError(f"Unknown constraint kind '{kind}' (expected one of {KINDS}).")
+        self.kind = kind
+        self.check = check
+        self.scopes = tuple(scopes)
+
+    def __call__(self, x1, a, x2, b) -> bool:
+        return self.check(x1, a, x2, b)
+
+    def __repr__(self) -> str:
+        scopes = f", scopes={len(self.scopes)}" if self.scopes else ""
+        return f"Constraint({self.kind}, {getattr(self.check, '__name__', self.check)}{scopes})"
+
+
+NOT_EQUAL = Constraint(NEQ, binary_neq)
+
+def all_different(scopes: Sequence[Tuple[int, ...]]) -> Constraint:
+    """Pairwise != whose scopes (tuples of variables) are each all-different"""
+    return Constraint(ALLDIFF, binary_neq, scopes)
+
+def predicate(check: Callable) -> Constraint:
+    """An arbitrary check(x1, a, x2, b); engines fall back to calling it"""
+    return Constraint(PREDICATE, check)
+
+def kind_of(constraint: Callable) -> str:
+    if isinstance(constraint, Constraint):
+        return constraint.kind
+    return NEQ if constraint is binary_neq else PREDICATE
 
+def is_neq(constraint: Callable) -> bool:
+    """True if the constraint is plain inequality (NEQ or ALLDIFF), so bitmask kernels apply"""
+    return kind_of(constraint) != PREDICATE
@@ -0,0 +1,251 @@
+"""
+CP468 — dlx.py
+Sudoku as exact cover, solved with Knuth's Algorithm X on dancing links.
+
+An n x n Sudoku (n = box^2) is an exact cover problem with one matrix row per
+(row, column, digit) and 4n^2 columns: every cell holds one digit, and every row,
+column and box holds every digit once. Each matrix row covers exactly four columns.
+Givens only get their own matrix row and are covered up front; the search then
+picks the column with the fewest rows left (the exact cover form of MRV), tries its
+rows top to bottom and undoes a choice by relinking the nodes it unlinked.
+
+The links live in flat lists indexed by node (L / R / U / D / C) instead of node
+objects, and the search keeps its own stack, so 25x25 boards need no recursion.
+With stats, the search adds to nodes (rows tried), backtracks (rows undone) and
+max_depth (rows chosen at once).
+
+Functions / classes:
+    - ExactCover(n_columns): add_row(columns, row_id), select(row_id), solutions(stats)
+    - SudokuCover(grid): consistent, solutions(stats), count(limit, on_solution, stats)
+    - solve(grid, stats) -> Optional[Grid]
+    - count_solutions(grid, limit, on_solution, stats) -> int
+"""
+
+from __future__ import annotations
+import math
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Sequence
+
+if TYPE_CHECKING:
+    from metrics import SolverStats
+
+Grid = List[List[int]]
+
+class ExactCover:
+    """
+    Sparse 0/1 matrix as circular doubly linked lists. Node 0 is the root, nodes
+    1..n_columns the column headers (header of column k is node k + 1), the rest
+    one node per 1 in the matrix. S[c] is the number of rows left in column c.
+    A search pass unlinks nodes as it goes, so each instance is searched once.
+    """
+
+    __slots__ = ("L", "R", "U", "D", "C", "S", "row_of", "rows")
+
+    def __init__(self, n_columns: int) -> None:
+        n = n_columns + 1
+        self.L = [i - 1 for i in range(n)]
+        self.L[0] = n_columns
+        self.R = [i + 1 for i in range(n)]
+        self.R[n_columns] = 0
+        self.U = list(range(n))
+        self.D = list(range(n))
+        self.C = list(range(n))
+        self.S = [0] * n
+        self.row_of = [-1] * n          # node -> row id (-1 for the root and headers)
+        self.rows: Dict[int, int] = {}  # row id -> first node of the row
+
+    def add_row(self, columns: Sequence[int], row_id: int) -> None:
+        """Add a row with 1s in the given columns (0-based), identified by row_id"""
+        if not columns:
+            return
+        L, R, U, D, C = self.L, self.R, self.U, self.D, self.C
+        first = len(C)
+        last = first + len(columns) - 1
+        for k, col in enumerate(columns):
+            node = first + k
+            c = col + 1
+            C.append(c)
+            self.row_of.append(row_id)
+            # Link in at the bottom of the column
+            U.append(U[c])
+            D.append(c)
+            D[U[c]] = node
+            U[c] = node
+            self.S[c] += 1
+            L.append(node - 1 if node > first else last)
+            R.append(node + 1 if node < last else first)
+        self.rows[row_id] = first
+
+    def _cover(self, c: int) -> None:
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        R[L[c]] = R[c]
+        L[R[c]] = L[c]
+        i = D[c]
+        while i != c:
+            j = R[i]
+            while j != i:
+                U[D[j]] = U[j]
+                D[U[j]] = D[j]
+                S[C[j]] -= 1
+                j = R[j]
+            i = D[i]
+
+    def _uncover(self, c: int) -> None:
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        i = U[c]
+        while i != c:
+            j = L[i]
+            while j != i:
+                S[C[j]] += 1
+                U[D[j]] = j
+                D[U[j]] = j
+                j = L[j]
+            i = U[i]
+        R[L[c]] = c
+        L[R[c]] = c
+
+    def select(self, row_id: int) -> bool:
+        """
+        Put row_id in every solution by covering its columns (used for givens).
+        Returns False (and changes nothing) if one of its columns is already covered.
+        """
+        R, L, C = self.R, self.L, self.C
+        first = self.rows[row_id]
+        nodes = [first]
+        j = R[first]
+        while j != first:
+            nodes.append(j)
+            j = R[j]
+        if any(R[L[C[j]]] != C[j] for j in nodes):
+            return False
+        for j in nodes:
+            self._cover(C[j])
+        return True
+
+    def solutions(self, stats: Optional["SolverStats"] = None) -> Iterator[List[int]]:
+        """Yield the row ids of every exact cover of the columns still uncovered"""
+        L, R, D, C, S = self.L, self.R, self.D, self.C, self.S
+        row_of = self.row_of
+        cover, uncover = self._cover, self._uncover
+        stack: List[int] = []  # chosen row node per level
+
+        while True:
+            if R[0] == 0:
+                yield [row_of[r] for r in stack]
+            else:
+                # Column with the fewest rows left, first one on ties; 0 or 1 cannot be beaten
+                c = R[0]
+                best = S[c]
+                j = R[c]
+                while j != 0 and best > 1:
+                    if S[j] < best:
+                        c, best = j, S[j]
+                    j = R[j]
+                if best:
+                    cover(c)
+                    r = D[c]
+                    stack.append(r)
+                    j = R[r]
+                    while j != r:
+                        cover(C[j])
+                        j = R[j]
+                    if stats is not None:
+                        stats.nodes += 1
+                        if len(stack) > stats.max_depth:
+                            stats.max_depth = len(stack)
+                    continue
+
+            # Dead end or solution: undo rows until one has a next row in its column
+            while stack:
+                r = stack.pop()
+                j = L[r]
+                while j != r:
+                    uncover(C[j])
+                    j = L[j]
+                if stats is not None:
+                    stats.backtracks += 1
+                r = D[r]
+                if r != C[r]:
+                    stack.append(r)
+                    j = R[r]
+                    while j != r:
+                        cover(C[j])
+                        j = R[j]
+                    if stats is not None:
+                        stats.nodes += 1
+                    break
+                uncover(r)
+            else:
+                return
+
+
+class SudokuCover:
+    """
+    A Sudoku grid (0 = empty) as an ExactCover. consistent is False when two givens
+    clash, in which case there are no solutions. Like ExactCover, search it once.
+    """
+
+    __slots__ = ("grid", "size", "matrix", "consistent")
+
+    def __init__(self, grid: Grid) -> None:
+        size = len(grid)
+        box = math.isqrt(size)
+        if size == 0 or box * box != size or any(len(row) != size for row in grid):
+            raise ValueError(f"Grid must be n x n with n a perfect square, got {size} rows.")
+        self.grid = grid
+        self.size = size
+        n2 = size * size
+        self.matrix = ExactCover(4 * n2)
+
+        givens = []
+        for r in range(size):
+            for c in range(size):
+                v = grid[r][c]
+                if not 0 <= v <= size:
+                    raise ValueError(f"Value {v} at ({r}, {c}) is out of range for a {size}x{size} grid.")
+                b = (r // box) * box + c // box
+                for d in ([v] if v else range(1, size + 1)):
+                    row_id = (r * size + c) * size + d - 1
+                    self.matrix.add_row((r * size + c, n2 + r * size + d - 1,
+                                         2 * n2 + c * size + d - 1, 3 * n2 + b * size + d - 1), row_id)
+                    if v:
+                        givens.append(row_id)
+        self.consistent = all(self.matrix.select(row_id) for row_id in givens)
+
+    def to_grid(self, row_ids: Sequence[int]) -> Grid:
+        """The grid with the cells of the chosen matrix rows filled in"""
+        size = self.size
+        out = [list(row) for row in self.grid]
+        for row_id in row_ids:
+            cell, d = divmod(row_id, size)
+            out[cell // size][cell % size] = d + 1
+        return out
+
+    def solutions(self, stats: Optional["SolverStats"] = None) -> Iterator[Grid]:
+        """Yield every solution grid"""
+        if not self.consistent:
+            return
+        for row_ids in self.matrix.solutions(stats):
+            yield self.to_grid(row_ids)
+
+    def count(self, limit: Optional[int] = None, on_solution: Optional[Callable[[Grid], None]] = None,
+              stats: Optional["SolverStats"] = None) -> int:
+        """Count solutions, stopping at limit; on_solution gets every solution found"""
+        n = 0
+        for solution in self.solutions(stats):
+            n += 1
+            if on_solution is not None:
+                on_solution(solution)
+            if n == limit:
+                break
+        return n
+
+
+def solve(grid: Grid, stats: Optional["SolverStats"] = None) -> Optional[Grid]:
+    """First solution of grid, or None if it has none"""
+    return next(SudokuCover(grid).solutions(stats), None)
+
+
+def count_solutions(grid: Grid, limit: Optional[int] = None, on_solution: Optional[Callable[[Grid], None]] = None,
+                    stats: Optional["SolverStats"] = None) -> int:
+    """Number of solutions of grid, up to limit (see SudokuCover.count)"""
+    return SudokuCover(grid).count(limit, on_solution, stats)
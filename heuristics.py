@@ -6,57 +6,339 @@ Contributors:
     - Jordan F.
 
 Functions:
-    - select_var_mrv(csp) -> Var
-    - degree_tiebreak(csp, candidates) -> Var
-    - order_values_lcv(csp, var) ->list[int]
+    - select_var_mrv(csp, mrv=None, stats=None, rng=None) -> Var
+    - degree_tiebreak(csp, candidates, rng=None) -> Var
+    - order_values_lcv(csp, var, stats=None, rng=None, counts=None) ->list[int]
+
+Passing rng (a random.Random) breaks the remaining ties at random instead of by
+index / value, so a seeded rng gives a reproducible randomized search.
+
+Classes:
+    - MRVBuckets: incrementally maintained MRV/degree buckets (a Trail listener)
+    - ValueCounts: per-unit value counts for LCV and hidden singles (a Trail listener)
 """
 
-from typing import List, Optional
-from sudoku_csp import CSP, Var
+import random
+from typing import TYPE_CHECKING, List, Optional, Set
+from sudoku_csp import CSP, Domain, Var
+import bitset
+import constraints
+
+if TYPE_CHECKING:
+    from metrics import SolverStats
 
-def select_var_mrv(csp: CSP) -> Optional[Var]:
+def select_var_mrv(csp: CSP, mrv: Optional["MRVBuckets"] = None, stats: Optional["SolverStats"] = None,
+                   rng: Optional[random.Random] = None) -> Optional[Var]:
     """
     Minimum Remaining values heuristic with degree tiebreaker
     Returns unassigned variable with smallest domain and ties are 
      broken by degree heuristic (highest # of constraints on unassigned neighbors).
+    If MRVBuckets are given the answer is read from them instead of scanning all variables.
+    With rng, variables still tied after the degree are picked at random.
     """
+    if stats is not None:
+        stats.var_selections += 1
     
-    unassigned = [v for v in csp.variables if len(csp.domains[v]) > 1]
+    if mrv is not None:
+        return mrv.select(rng)
+
+    sizes = [bitset.popcount(d) for d in csp.domains]
+    unassigned = [v for v in csp.variables if sizes[v] > 1]
     if not unassigned:
         return None
     
-    min_size = min(len(csp.domains[v]) for v in unassigned)
-    candidates = [v for v in unassigned if len(csp.domains[v]) == min_size]
+    min_size = min(sizes[v] for v in unassigned)
+    candidates = [v for v in unassigned if sizes[v] == min_size]
     
     if len(candidates) == 1:
         return candidates[0]
     
-    return degree_tiebreak(csp, candidates)
+    return degree_tiebreak(csp, candidates, rng)
+
+
+
+
+class MRVBuckets:
+    """
+    Unassigned variables bucketed by domain size and then by degree
+    (number of unassigned neighbours), kept in sync through Trail listener calls.
+    select() scans at most (size - 1) x (degree + 1) buckets and picks the same
+    variable as select_var_mrv's full scan.
+    """
 
+    __slots__ = ("csp", "sizes", "degrees", "buckets", "counts", "n_unassigned")
 
+    def __init__(self, csp: CSP) -> None:
+        topo = csp.topology
+        max_degree = max((len(p) for p in topo.peers), default=0)
+        self.csp = csp
+        self.sizes: List[int] = [bitset.popcount(d) for d in csp.domains]
+        self.degrees: List[int] = [
+            sum(1 for nb in topo.peers[v] if self.sizes[nb] > 1) for v in topo.cells
+        ]
+        # buckets[size][degree] -> unassigned vars; counts[size] -> how many vars have that size
+        self.buckets: List[List[Set[Var]]] = [
+            [set() for _ in range(max_degree + 1)] for _ in range(topo.size + 1)
+        ]
+        self.counts: List[int] = [0] * (topo.size + 1)
+        self.n_unassigned = 0
+        for v in topo.cells:
+            if self.sizes[v] > 1:
+                self._add(v)
+                self.n_unassigned += 1
+
+    def _add(self, var: Var) -> None:
+        size = self.sizes[var]
+        self.buckets[size][self.degrees[var]].add(var)
+        self.counts[size] += 1
+
+    def _discard(self, var: Var) -> None:
+        size = self.sizes[var]
+        self.buckets[size][self.degrees[var]].discard(var)
+        self.counts[size] -= 1
+
+    def update(self, var: Var) -> None:
+        """Re-read var's domain and move it (and, if it got (un)assigned, its neighbours)"""
+        old = self.sizes[var]
+        new = bitset.popcount(self.csp.domains[var])
+        if new == old:
+            return
+        if old > 1:
+            self._discard(var)
+        self.sizes[var] = new
+        if new > 1:
+            self._add(var)
+
+        # Crossing the assigned line changes every neighbour's degree
+        if (old > 1) != (new > 1):
+            delta = 1 if new > 1 else -1
+            self.n_unassigned += delta
+            for nb in self.csp.neighbors[var]:
+                if self.sizes[nb] > 1:
+                    self._discard(nb)
+                    self.degrees[nb] += delta
+                    self._add(nb)
+                else:
+                    self.degrees[nb] += delta
+
+    def removed(self, var: Var, mask: Domain) -> None:
+        self.update(var)
+
+    def restored(self, var: Var, mask: Domain) -> None:
+        self.update(var)
+
+    def unassigned(self) -> int:
+        """Number of variables with more than one value left"""
+        return self.n_unassigned
+
+    def select(self, rng: Optional[random.Random] = None) -> Optional[Var]:
+        """Smallest domain, then most unassigned neighbours, then lowest index (or random with rng)"""
+        for size in range(2, len(self.counts)):
+            if self.counts[size]:
+                row = self.buckets[size]
+                for degree in range(len(row) - 1, -1, -1):
+                    if row[degree]:
+                        if rng is not None:
+                            # sorted so the choice only depends on the rng state, not on set order
+                            return rng.choice(sorted(row[degree]))
+                        return min(row[degree])
+        return None
 
 
-def degree_tiebreak(csp: CSP, candidates: List[Var]) -> Var:
+class ValueCounts:
+    """
+    For every unit (row, column, box) and value: how many cells still allow the value
+    (support) and how many hold it as their only value (fixed), kept in sync through
+    Trail listener calls, so an undo restores it with the domains.
+    A removal only touches the three units of the changed cell, one entry per removed
+    value. Per unit, two bitmasks mark the values with at most one cell left (low) and
+    the values already placed (placed): alldiff.hidden_singles only has to look at the
+    cells of a unit with low & ~placed set.
+    open_count gives order_values_lcv the same count as scanning the neighbours.
+    Only meaningful for all-different units (constraints.is_neq).
+    """
+
+    __slots__ = ("csp", "stride", "bases", "overlap", "support", "fixed", "low", "placed")
+
+    def __init__(self, csp: CSP) -> None:
+        topo = csp.topology
+        stride = topo.size + 1
+        self.csp = csp
+        self.stride = stride
+        # Table entry of (unit, value) is unit * stride + value; low / placed use unit * stride
+        self.bases: List[tuple] = [tuple(u * stride for u in units) for units in topo.cell_units]
+        self.support: List[int] = [0] * (len(topo.units) * stride)
+        self.fixed: List[int] = [0] * (len(topo.units) * stride)
+        self.low: List[int] = [0] * (len(topo.units) * stride)
+        self.placed: List[int] = [0] * (len(topo.units) * stride)
+        for u, unit in enumerate(topo.units):
+            base = u * stride
+            for var in unit:
+                d = csp.domains[var]
+                for value in bitset.values(d):
+                    self.support[base + value] += 1
+                if bitset.is_singleton(d):
+                    self.fixed[base + bitset.lowest_value(d)] += 1
+            for value in range(1, topo.size + 1):
+                if self.support[base + value] <= 1:
+                    self.low[base] |= bitset.bit(value)
+                if self.fixed[base + value]:
+                    self.placed[base] |= bitset.bit(value)
+
+        # Peers sharing the box and the row or the column with the variable (counted twice)
+        box = topo.box
+        self.overlap: List[tuple] = []
+        for var, (r, c) in enumerate(topo.coords):
+            self.overlap.append(tuple(
+                nb for nb in topo.peers[var]
+                if (topo.coords[nb][0] == r or topo.coords[nb][1] == c)
+                and topo.coords[nb][0] // box == r // box and topo.coords[nb][1] // box == c // box
+            ))
+
+    def _fix(self, var: Var, value_bit: Domain, delta: int) -> None:
+        """var became (delta 1) or stopped being (delta -1) a singleton {value_bit}"""
+        fixed, placed = self.fixed, self.placed
+        value = value_bit.bit_length()
+        for base in self.bases[var]:
+            n = fixed[base + value] + delta
+            fixed[base + value] = n
+            if n:
+                placed[base] |= value_bit
+            else:
+                placed[base] &= ~value_bit
+
+    def removed(self, var: Var, mask: Domain) -> None:
+        support, low = self.support, self.low
+        b0, b1, b2 = self.bases[var]
+        rest = mask
+        while rest:
+            b = rest & -rest
+            rest ^= b
+            value = b.bit_length()
+            # Unrolled over the three units: this runs for every trail entry
+            i = b0 + value
+            support[i] -= 1
+            if support[i] == 1:
+                low[b0] |= b
+            i = b1 + value
+            support[i] -= 1
+            if support[i] == 1:
+                low[b1] |= b
+            i = b2 + value
+            support[i] -= 1
+            if support[i] == 1:
+                low[b2] |= b
+        # Only a var that is or was a singleton changes the fixed counts
+        new = self.csp.domains[var]
+        old = new | mask
+        if not old & (old - 1):
+            self._fix(var, old, -1)
+        elif new and not new & (new - 1):
+            self._fix(var, new, 1)
+
+    def restored(self, var: Var, mask: Domain) -> None:
+        support, low = self.support, self.low
+        b0, b1, b2 = self.bases[var]
+        rest = mask
+        while rest:
+            b = rest & -rest
+            rest ^= b
+            value = b.bit_length()
+            i = b0 + value
+            support[i] += 1
+            if support[i] == 2:
+                low[b0] &= ~b
+            i = b1 + value
+            support[i] += 1
+            if support[i] == 2:
+                low[b1] &= ~b
+            i = b2 + value
+            support[i] += 1
+            if support[i] == 2:
+                low[b2] &= ~b
+        new = self.csp.domains[var]
+        old = new & ~mask
+        if old and not old & (old - 1):
+            self._fix(var, old, -1)
+        elif not new & (new - 1):
+            self._fix(var, new, 1)
+
+    def open_count(self, var: Var, value: int) -> int:
+        """Unassigned peers of var that still allow value (var itself not counted)"""
+        support, fixed = self.support, self.fixed
+        n = -3  # var itself, in each of its three units
+        for base in self.bases[var]:
+            n += support[base + value] - fixed[base + value]
+        value_bit = 1 << (value - 1)
+        domains = self.csp.domains
+        for nb in self.overlap[var]:
+            d = domains[nb]
+            if d & value_bit and d != value_bit:
+                n -= 1
+        return n
+
+
+def degree_tiebreak(csp: CSP, candidates: List[Var], rng: Optional[random.Random] = None) -> Var:
     """
     For MRV ties, select var with most unassigned neighbors
     """
     def count_unassigned_neighbors(var: Var) -> int:
-        return sum(1 for nb in csp.neighbors[var] if len(csp.domains[nb]) > 1)
+        return sum(1 for nb in csp.neighbors[var] if not bitset.is_singleton(csp.domains[nb]))
     
+    if rng is not None:
+        degrees = [count_unassigned_neighbors(v) for v in candidates]
+        best = max(degrees)
+        return rng.choice([v for v, d in zip(candidates, degrees) if d == best])
     return max(candidates,key=count_unassigned_neighbors)
 
 
-def order_values_lcv(csp: CSP, var: Var) -> List[int]:
+def order_values_lcv(csp: CSP, var: Var, stats: Optional["SolverStats"] = None,
+                     rng: Optional[random.Random] = None, counts: Optional[ValueCounts] = None) -> List[int]:
     """
     Least Constraining Value heuristic which orders values by how many other domain vlaues they eliminate
+    With rng, values with the same count come in random order instead of ascending.
+    For != constraints (constraints.is_neq) a value eliminates itself from each unassigned
+    neighbour holding it; other constraints count the neighbour values the check rejects.
+    With counts (a ValueCounts in sync with csp) the != counts are read from the table
+    instead of scanning the neighbours; the order is the same.
     """
+    neq = constraints.is_neq(csp.constraint)
+    if stats is not None:
+        # every value looks at every neighbour once, or at 3 table entries and the overlap cells
+        looked_at = 3 + len(counts.overlap[var]) if counts is not None and neq else len(csp.neighbors[var])
+        stats.lcv_checks += looked_at * bitset.popcount(csp.domains[var])
     def count_conflicts(value: int) -> int:
         """
         helper to count least number of conflicts
         """
+        value_bit = bitset.bit(value)
         cons = 0
         for n in csp.neighbors[var]:
-            if len(csp.domains[n])> 1 and value in csp.domains[n]:
+            domain = csp.domains[n]
+            if domain & value_bit and not bitset.is_singleton(domain):
                 cons += 1
         return cons
-    return sorted(csp.domains[var], key=count_conflicts)
+
+    def count_rejected(value: int) -> int:
+        """
+        same count for a generic constraint: neighbour values the check rejects
+        """
+        cons = 0
+        for n in csp.neighbors[var]:
+            domain = csp.domains[n]
+            if not bitset.is_singleton(domain):
+                cons += sum(1 for k in bitset.values(domain) if not csp.constraint(var, value, n, k))
+        return cons
+
+    if not neq:
+        key = count_rejected
+    elif counts is not None:
+        def key(value: int) -> int:
+            return counts.open_count(var, value)
+    else:
+        key = count_conflicts
+    if rng is not None:
+        values = list(bitset.values(csp.domains[var]))
+        rng.shuffle(values)
+        return sorted(values, key=key)  # stable sort keeps the shuffled order within ties
+    return sorted(bitset.values(csp.domains[var]), key=key)
@@ -6,59 +6,229 @@ Author: Anton Nemchinski
 """
 
 
+import math
+import mmap
 from pathlib import Path
-from typing import List
+from typing import Callable, Iterator, List
 
 def read_puzzle(path: str) -> list[list[int]]:
     """
     Read a Sudoku puzzle from a text file
-    Return it as a 9x9 list of integers
+    Return it as a size x size list of integers (9x9, 16x16, 25x25, ...)
+    Rows are either compact ("530070000", boards up to 9x9) or whitespace-separated
+    numbers ("12 0 5 . 16 ...") for larger boards; the number of rows sets the size.
     """
-
-    grid = []
     with open(path, 'r') as file:
-        lines = file.readlines()
-        assert len(lines) == 9, "Puzzle must have exactly 9 lines."
-        for line in lines:
-            line = line.strip()
-            assert len(line) == 9, " make sure each line must have exactly 9 characters."
-            row = []
-            for char in line:
-                # Convert digits 1–9 to integers and treat '0' or '.' as blanks
-                if char in '123456789':
-                    row.append(int(char))
-                elif char in '0.':
-                    row.append(0)
-                else:
-                    raise ValueError(f"Invalid character '{char}' in puzzle.")
-            grid.append(row)
+        return parse_puzzle(file.read())
 
+
+def parse_puzzle(text: str) -> list[list[int]]:
+    """
+    Parse a puzzle in read_puzzle's format from a string (blank lines are ignored).
+    A single 81-character line is read as a 9x9 puzzle too. Raises ValueError on bad input.
+    """
+    lines = [line for line in text.splitlines() if line.strip()]
+    if len(lines) == 1 and len(lines[0].split()[0]) == 81:
+        cells = lines[0].split()[0]
+        lines = [cells[r * 9:(r + 1) * 9] for r in range(9)]
+    size = len(lines)
+    if size == 0 or math.isqrt(size) ** 2 != size:
+        raise ValueError("Puzzle must have a square number of lines (9, 16, 25, ...).")
+    grid = []
+    for line in lines:
+        row = _parse_row(line, size)
+        if len(row) != size:
+            raise ValueError(f"Every line must have exactly {size} cells, got {len(row)}.")
+        grid.append(row)
     return grid
 
 
+def _parse_row(line: str, size: int = 9) -> list[int]:
+    # Whitespace-separated numbers for big boards, one character per cell otherwise;
+    # '0' or '.' are blanks
+    tokens = line.split()
+    if len(tokens) == 1:
+        tokens = list(tokens[0])
+    row = []
+    for token in tokens:
+        if token in ('0', '.'):
+            row.append(0)
+        elif token.isdigit() and 1 <= int(token) <= size:
+            row.append(int(token))
+        else:
+            raise ValueError(f"Invalid cell '{token}' in puzzle (expected 1..{size}, 0 or .).")
+    return row
+
+
+def _iter_lines(path: Path, use_mmap: bool) -> Iterator[tuple[int, str]]:
+    # Yield (line number, text) one line at a time; mmap lets the OS page a huge file in
+    if use_mmap and path.stat().st_size > 0:
+        with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line_no, raw in enumerate(iter(mm.readline, b""), 1):
+                yield line_no, raw.decode('ascii', errors='replace')
+    else:
+        with open(path, 'r') as file:
+            yield from enumerate(file, 1)
+
+
+def iter_puzzles(path: str, use_mmap: bool = False, errors: str = "raise") -> Iterator[tuple[str, list[list[int]]]]:
+    """
+    Lazily yield (label, grid) pairs from a directory (every *.txt in name order) or
+    from one multi-puzzle file, so memory does not grow with the corpus size.
+    Binary archives (puzzle_archive.py) are detected by their header and decoded lazily.
+    A file can hold one 81-character puzzle per line (anything after the first
+    whitespace is ignored, '#' lines are comments) or size-line grids separated by
+    blank lines, with compact rows ("530070000") or whitespace-separated numbers
+    for 16x16 and 25x25 boards. Labels are "<file>:<line>", or just "<file>" for a
+    file in a directory that holds one puzzle. Bad input raises ValueError naming
+    the file and line; with errors="skip" the puzzle is reported and skipped instead
+    (a grid with a bad row is skipped up to the next blank line).
+    """
+
+    if errors not in ("raise", "skip"):
+        raise ValueError("errors must be 'raise' or 'skip'.")
+
+    import puzzle_archive  # imports io_utils itself
+    if puzzle_archive.is_archive(path):
+        with puzzle_archive.ArchiveReader(path) as reader:
+            yield from reader.iter_range()
+        return
+
+    def report(where: str, message: str) -> None:
+        if errors == "raise":
+            raise ValueError(f"{where}: {message}")
+        print(f"[WARN] {where}: {message} (skipped)")
+
+    p = Path(path)
+    if not p.is_dir():
+        yield from _iter_file(p, use_mmap, report)
+        return
+
+    for f in sorted(p.glob("*.txt")):
+        if not f.is_file():
+            continue
+        # Read two puzzles ahead: a file holding only one is labelled by its name
+        puzzles = _iter_file(f, use_mmap, report)
+        first = next(puzzles, None)
+        second = next(puzzles, None)
+        if first is not None and second is None:
+            yield f.name, first[1]
+            continue
+        for item in (first, second):
+            if item is not None:
+                yield item
+        yield from puzzles
+
+
+def _iter_file(p: Path, use_mmap: bool, report: Callable[[str, str], None]) -> Iterator[tuple[str, list[list[int]]]]:
+    # The line-by-line parser behind iter_puzzles for one file; report(where, message)
+    # raises or warns about bad input
+    block: list[list[int]] = []
+    start = 0
+    skipping = False  # after a bad row with errors="skip": drop the rest of its grid
+
+    for line_no, line in _iter_lines(p, use_mmap):
+        fields = line.split(None, 1)
+        if not fields:
+            # A blank line ends a grid, so one cut short is reported here
+            if block:
+                report(f"{p.name}:{start}", f"puzzle has only {len(block)} of {len(block[0])} rows.")
+                block = []
+            skipping = False
+            continue
+        if fields[0].startswith('#') or skipping:
+            continue
+        token = fields[0]
+        if len(token) == 81 and block:
+            # A one-line puzzle also starts a new record
+            report(f"{p.name}:{start}", f"puzzle has only {len(block)} of {len(block[0])} rows.")
+            block = []
+        try:
+            if len(token) == 81:
+                yield f"{p.name}:{line_no}", [_parse_row(token[i:i + 9]) for i in range(0, 81, 9)]
+                continue
+            if len(token) <= 2 and len(line.split()) > 1:
+                cells = line.split()  # one whitespace-separated row of a big board
+            elif len(token) <= 9:
+                cells = list(token)
+            else:
+                raise ValueError(f"expected a row of up to 9 characters or an 81-character puzzle, got {len(token)}.")
+            size = len(block[0]) if block else len(cells)
+            if math.isqrt(size) ** 2 != size:
+                raise ValueError(f"rows must have a square number of cells (4, 9, 16, 25, ...), got {size}.")
+            if len(cells) != size:
+                raise ValueError(f"expected {size} cells, got {len(cells)}.")
+            row = _parse_row(" ".join(cells), size)
+        except ValueError as e:
+            error = str(e)
+        else:
+            if not block:
+                start = line_no
+            block.append(row)
+            if len(block) == len(block[0]):
+                yield f"{p.name}:{start}", block
+                block = []
+            continue
+        # A bad row spoils its grid: the rows read so far and the rest up to the next
+        # blank line are dropped. A bad one-line puzzle only loses its own line.
+        skipping = bool(block) or len(token) <= 9
+        block = []
+        report(f"{p.name}:{line_no}", error)
+    if block:
+        report(f"{p.name}:{start}", f"last puzzle has only {len(block)} of {len(block[0])} rows.")
+
+
+def load_puzzles(path: str) -> List[tuple[str, list[list[int]]]]:
+    """
+    Load every puzzle from a directory or multi-puzzle file into a list
+    (see iter_puzzles for the accepted formats).
+    """
+
+    return list(iter_puzzles(path))
+
+
 def _puzzle_dir() -> Path:
     # Return absolute path to the test_puzzles directory.
     return (Path(__file__).resolve().parent / "test_puzzles")
 
 def _load_dir(dir_path: Path, label: str) -> List[List[List[int]]]:
     """
-    Load all puzzles from a folder using read_puzzle()
+    Load all puzzles from a folder using iter_puzzles()
     Print how many puzzles were found. Sorted by filename for deterministic order.
     """
 
-    grids: List[List[List[int]]] = []
     if not dir_path.exists():
         print(f"[WARN] Directory not found: {dir_path}")
-        return grids
-
-    for f in sorted(dir_path.glob("*.txt")):
-        if f.is_file():
-            grids.append(read_puzzle(str(f)))
+        return []
 
+    grids = [grid for _, grid in iter_puzzles(str(dir_path))]
     print(f"[INFO] Loaded {len(grids):>2} {label} puzzle(s) from {dir_path.name}/")
     return grids
 
 
+# test_puzzles/ folders behind each category of get_*_puzzles
+CATEGORIES = {
+    "valid": ("valid",),
+    "unsolvable": ("unsolvable",),
+    "unofficial": ("solved", "multiple_solutions"),
+}
+
+
+def iter_test_puzzles(category: str, errors: str = "raise") -> Iterator[tuple[str, list[list[int]]]]:
+    """
+    Stream (label, grid) pairs of one category of test_puzzles/ (see CATEGORIES) through
+    iter_puzzles, one puzzle in memory at a time; labels are "<folder>/<file>".
+    """
+
+    for folder in CATEGORIES[category]:
+        dir_path = _puzzle_dir() / folder
+        if not dir_path.exists():
+            print(f"[WARN] Directory not found: {dir_path}")
+            continue
+        for label, grid in iter_puzzles(str(dir_path), errors=errors):
+            yield f"{folder}/{label}", grid
+
+
 def get_valid_puzzles() -> List[List[List[int]]]:
     """
     Return list of valid Sudoku puzzles from test_puzzles/valid/*.txt.
@@ -106,20 +276,26 @@ def print_grid(grid: list[list[int]]) -> None:
     """
     Print the Sudoku grid in a readable format
     Show '.' for blank cells and adds lines to seperate subgrids
+    Works for any box size; cells are right-aligned to the widest value (2 chars for 16x16)
     """
 
-    # Create 3 x 3 subgrids
+    box = math.isqrt(len(grid))
+    width = len(str(len(grid)))
+    # Horizontal separator, e.g. " - - - + - - - + - - -" for 9x9
+    separator = " +".join(["".join(" " + "-" * width for _ in range(box))] * box)
+
+    # Create box x box subgrids
     for i, row in enumerate(grid):
-        # Draw a line every 3 rows to seperate subgrids
-        if i > 0 and i % 3 == 0:
-            print(" - - - + - - - + - - -")
+        # Draw a line every box rows to seperate subgrids
+        if i > 0 and i % box == 0:
+            print(separator)
 
         row_str = ""
         for j, val in enumerate(row):
-            # Draw a vertical line every 3 columns to seperate subgrids
-            if j > 0 and j % 3 == 0:
+            # Draw a vertical line every box columns to seperate subgrids
+            if j > 0 and j % box == 0:
                 row_str += " |"
-            row_str += f" {val if val != 0 else '.'}"
+            row_str += f" {val if val != 0 else '.':>{width}}"
 
         print(row_str)
 
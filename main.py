@@ -8,64 +8,332 @@ Contributors:
 """
 
 import argparse
+import os
 import sys
-from io_utils import read_puzzle, print_grid, print_status
+import time
+from io_utils import iter_puzzles, read_puzzle, print_grid, print_status
 from sudoku_csp import sudoku_csp_from_grid
+from metrics import SolverStats
 import ac3
+import alldiff
 import backtracking
+import parallel
+import canon
+import sat
+import puzzle_archive
+import queue_trace
   
 
-def solve_puzzle(puzzle_path: str, track_queue: bool = False, show_queue: bool = False):
+def solve_puzzle(puzzle_path: str, track_queue: bool = False, show_queue: bool = False, ac3_engine: str = "ac3", propagation: str = "ac3", count_limit=None, show_solutions: bool = False, show_stats: bool = False, trace_every: int = 0, trace_file=None, cache=None, search: str = "chronological", max_nogood_size: int = 0, restarts: str = "none", restart_base: int = backtracking.RESTART_BASE, seed=None, split_workers=None, solver: str = "csp", dimacs=None, value_counts: bool = False):
     """
     Main solver: read puzzle → AC-3 → backtracking (if AC-3 can't solve)
+    ac3_engine picks the arc consistency engine (see ac3.ENGINES; --ac3-engine), solver the
+    solving engine (see parallel.SOLVERS; --engine)
+    propagation adds all-different unit rules on top of AC-3 (see alldiff.STRENGTHS)
+    count_limit counts solutions up to that cap instead of stopping at the first (2 = uniqueness check)
+    show_stats prints the propagation / search counters (metrics.SolverStats) at the end
+    trace_every prints every n-th AC-3 queue pop live, trace_file writes all queue lengths to a file
+    (see queue_trace); the queue summary kept for show_queue has a fixed size
+    cache (canon.SolutionCache) is checked before solving and filled afterwards; puzzles that are
+    a relabeling / row, column, band, stack swap / transpose of a cached one count as hits.
+    Solution counting (count_limit) always solves.
+    search / max_nogood_size pick chronological backtracking (recursive or iterative) or backjumping with nogoods (see backtracking.SEARCHES)
+    restarts / restart_base / seed add a restart schedule with seeded random tie-breaking (see backtracking.RESTARTS)
+    split_workers spreads the search tree over that many processes (parallel.split_solve; search
+    options and counters do not apply)
+    solver="dlx" / "sat" replaces propagation + backtracking with exact cover search (dlx.py) /
+    CDCL on the CNF encoding (sat.py); only count_limit, show_solutions, show_stats and cache apply
+    dimacs writes the puzzle's CNF encoding to that file (sat.write_dimacs) before solving
+    value_counts keeps per-unit value counts on the search trail (heuristics.ValueCounts)
     """
     print(f"\n\nSolving {puzzle_path}\n\n")
 
     p = read_puzzle(puzzle_path)
     print("Initial puzzle:")
     print_grid(p)
+    if dimacs:
+        sat.write_dimacs(dimacs, p)
+        print(f"\nCNF encoding written to {dimacs}")
+
+    canonical = None
+    if cache is not None and count_limit is None:
+        canonical = canon.canonicalize(p)
+        hit, solution = cache.get(canonical)
+        if hit:
+            if solution is None:
+                print("\nPuzzle is unsolvable (from the solution cache)")
+                print_status(is_consistent=False, solved=False)
+            else:
+                print("\nPuzzle solved from the solution cache!\n")
+                print_status(is_consistent=True, solved=True)
+                print("Solution:")
+                print_grid(solution)
+            print(f"\n{cache}")
+            return
     
+    stats = SolverStats() if show_stats or restarts != "none" else None
+    if solver != "csp":
+        solution = solve_encoded(p, solver, count_limit, show_solutions, stats)
+        if canonical is not None:
+            cache.put(canonical, solution)
+            print(f"\n{cache}")
+        if show_stats:
+            print_stats(stats)
+        return
+
+    summary = queue_trace.QueueStats() if track_queue or show_queue else None
+    sinks = [summary] if summary is not None else []
+    if trace_every:
+        sinks.append(queue_trace.QueuePrinter(every=trace_every))
+    if trace_file:
+        sinks.append(queue_trace.QueueFile(trace_file))
+    tracker = queue_trace.QueueTee(*sinks) if len(sinks) > 1 else (sinks[0] if sinks else None)
+
     csp = sudoku_csp_from_grid(p)
-    is_consistent, queue_lengths = ac3.ac3(csp,track_queue=track_queue)
+    try:
+        is_consistent, _ = alldiff.propagate(csp, propagation, track_queue=tracker, engine=ac3_engine, stats=stats)
+    finally:
+        if trace_file:
+            sinks[-1].close()
     
-    if show_queue and queue_lengths:
-        print(f"\nAC-3 queue lengths: {queue_lengths}")
-        print(f"Total AC-3 iterations: {len(queue_lengths)}")
+    if show_queue and summary:
+        print(f"\nAC-3 queue lengths: {summary}")
+        print(summary.format_histogram())
+        print(f"Total AC-3 iterations: {len(summary)}")
     
     if not is_consistent:
         print("\nPuzzle is unsolvable (AC3 detected inconsistency)")
         print_status(is_consistent=False, solved=False)
-        return
-    
-    solved = csp.is_solved()
-    
-    if solved:
+    elif csp.is_solved():
         print("\nPuzzle solved by AC-3!\n")
         print_status(is_consistent=True, solved=True)
         print("Solution:")
         print_grid(csp.to_grid())
-        return
-    
-    print("\nAC-3 was not able to solve, running backtracking search")
-    
-    if backtracking.solve(csp):
-        print("\nPuzzle solved by backtracking!\n")
-        print_status(is_consistent=True, solved=True)
-        print("\nSolution:")
-        print_grid(csp.to_grid())
+        if count_limit is not None:
+            print("\nSolutions found: 1\nPuzzle has a unique solution")
     else:
+        print("\nAC-3 was not able to solve, running backtracking search")
+        if count_limit is not None:
+            count_puzzle_solutions(csp, count_limit, show_solutions, ac3_engine, propagation, stats, split_workers, value_counts)
+        elif split_workers:
+            found = []
+            if parallel.split_solve(csp, split_workers, 1, found.append, ac3_engine, propagation):
+                print(f"\nPuzzle solved by parallel search on {split_workers} worker(s)!\n")
+                print_status(is_consistent=True, solved=True)
+                print("\nSolution:")
+                print_grid(found[0])
+                csp.domains = sudoku_csp_from_grid(found[0]).domains  # so the cache below sees the solution
+            else:
+                print("\nNo solution found")
+                print_status(is_consistent=True, solved=False)
+        elif backtracking.solve(csp, engine=ac3_engine, propagation=propagation, stats=stats, search=search,
+                                max_nogood_size=max_nogood_size, restarts=restarts, restart_base=restart_base,
+                                seed=seed, value_counts=value_counts):
+            print("\nPuzzle solved by backtracking!\n")
+            print_status(is_consistent=True, solved=True)
+            print("\nSolution:")
+            print_grid(csp.to_grid())
+        else:
+            print("\nNo solution found")
+            print_status(is_consistent=True, solved=False)
+        if restarts != "none" and count_limit is None and not split_workers:
+            print(f"\nRestarts used: {stats.restarts}")
+
+    if canonical is not None:
+        cache.put(canonical, csp.to_grid() if is_consistent and csp.is_solved() else None)
+        print(f"\n{cache}")
+    if show_stats:
+        print_stats(stats)
+
+def print_stats(stats: SolverStats):
+    """Print the SolverStats counters, one per line"""
+    print("\nSolver counters:")
+    for name, value in stats.as_dict().items():
+        print(f"  {name:<20}: {value}")
+
+def solve_encoded(grid, solver: str, count_limit=None, show_solutions: bool = False, stats=None):
+    """
+    Solve (or count, with count_limit) with exact cover search ("dlx") or CDCL ("sat");
+    returns the solution (None when counting)
+    """
+    cover = parallel.encoded(grid, solver)
+    if not cover.consistent:
+        print("\nPuzzle is unsolvable (givens clash)" if solver == "dlx" else
+              "\nPuzzle is unsolvable (unit propagation of the givens failed)")
+        print_status(is_consistent=False, solved=False)
+        return None
+    print("\nRunning exact cover search (dancing links)" if solver == "dlx" else
+          "\nRunning CDCL on the CNF encoding")
+    if count_limit is not None:
+        solutions = []
+        n = cover.count(count_limit, solutions.append if show_solutions else None, stats)
+        report_solution_count(n, count_limit, solutions)
+        return None
+    solution = next(cover.solutions(stats), None)
+    if solution is None:
         print("\nNo solution found")
         print_status(is_consistent=True, solved=False)
+    else:
+        print(f"\nPuzzle solved by {solver.upper()}!\n")
+        print_status(is_consistent=True, solved=True)
+        print("\nSolution:")
+        print_grid(solution)
+    return solution
+
+def count_puzzle_solutions(csp, count_limit, show_solutions: bool = False, ac3_engine: str = "ac3", propagation: str = "ac3", stats=None, split_workers=None, value_counts: bool = False):
+    """Count (and optionally print) the solutions of a propagated CSP, stopping at count_limit"""
+    solutions = []
+    if split_workers:
+        n = parallel.split_solve(csp, split_workers, count_limit, solutions.append if show_solutions else None,
+                                 ac3_engine, propagation)
+    else:
+        n = backtracking.count_solutions(csp, count_limit, solutions.append if show_solutions else None,
+                                         engine=ac3_engine, propagation=propagation, stats=stats,
+                                         value_counts=value_counts)
+    report_solution_count(n, count_limit, solutions)
+
+def report_solution_count(n: int, count_limit: int, solutions=()):
+    """Print the solutions kept (if any), the status and how many solutions were found"""
+    for i, grid in enumerate(solutions, 1):
+        print(f"\nSolution {i}:")
+        print_grid(grid)
+
+    print_status(is_consistent=True, solved=n > 0)
+    if n == count_limit:
+        print(f"\nSolutions found: {n} (stopped at the limit of {count_limit})")
+    else:
+        print(f"\nSolutions found: {n}")
+    if n == 1:
+        print("Puzzle has a unique solution")
+    elif n > 1:
+        print("Puzzle does NOT have a unique solution")
+
+def solve_batch(path: str, workers=None, chunksize: int = 16, ordered: bool = True, ac3_engine: str = "ac3", propagation: str = "ac3", use_mmap: bool = False, count_limit=None, show_stats: bool = False, search: str = "chronological", max_nogood_size: int = 0, restarts: str = "none", restart_base: int = backtracking.RESTART_BASE, seed=None, solver: str = "csp"):
+    """
+    Batch solver: every puzzle of a directory, multi-puzzle file or binary archive, fanned out over
+    a process pool (see parallel.solve_many). Puzzles are streamed from disk and
+    results printed as they arrive, so memory stays flat for any corpus size.
+    solver picks propagation + backtracking ("csp"), exact cover search ("dlx") or CDCL ("sat")
+    per puzzle (see parallel.SOLVERS); ac3_engine is the arc consistency engine for "csp".
+    """
+    n_workers = workers or os.cpu_count() or 1
+    print(f"\n\nSolving puzzles from {path} on {n_workers} worker(s)\n")
+
+    if puzzle_archive.is_archive(path):
+        # Workers read their record ranges straight from the shared archive
+        results = parallel.solve_archive(path, workers=n_workers, chunksize=chunksize, ordered=ordered,
+                                         engine=ac3_engine, propagation=propagation, count_limit=count_limit,
+                                         collect_stats=show_stats, search=search, max_nogood_size=max_nogood_size,
+                                         restarts=restarts, restart_base=restart_base, seed=seed, solver=solver)
+    else:
+        items = iter_puzzles(path, use_mmap=use_mmap)
+        results = parallel.solve_many(items, workers=n_workers, chunksize=chunksize, ordered=ordered,
+                                      engine=ac3_engine, propagation=propagation, count_limit=count_limit,
+                                      collect_stats=show_stats, search=search, max_nogood_size=max_nogood_size,
+                                      restarts=restarts, restart_base=restart_base, seed=seed, solver=solver)
+    counts = {}
+    total = 0
+    multiple = 0
+    total_restarts = 0
+    totals = SolverStats()
+    t0 = time.perf_counter()
+    for r in results:
+        total += 1
+        counts[r["result_str"]] = counts.get(r["result_str"], 0) + 1
+        line = f"  {r['label']:<35} : {r['result_str']:<22} | {r['time_sec']:.4f} s"
+        if count_limit is not None:
+            n = r["solutions"]
+            line += f" | solutions: {n}{'+' if n == count_limit else ''}"
+            if n > 1:
+                multiple += 1
+        if "restarts" in r:
+            line += f" | restarts: {r['restarts']}"
+            total_restarts += r["restarts"]
+        if show_stats:
+            totals.merge(SolverStats.from_dict(r["stats"]))
+        print(line)
+    elapsed = time.perf_counter() - t0
+
+    print("\n==================== SUMMARY ====================")
+    print(f"Total puzzles run     : {total}")
+    for result_str, n in sorted(counts.items()):
+        print(f"  {result_str:<20}: {n}")
+    if count_limit is not None:
+        print(f"Not unique            : {multiple}")
+    if restarts != "none":
+        print(f"Restarts              : {total_restarts}")
+    rate = total / elapsed if elapsed > 0 else 0.0
+    print(f"Wall time (s)         : {elapsed:.4f} ({rate:.1f} puzzles/s)")
+    if show_stats:
+        print_stats(totals)
 
 def main():
     parser = argparse.ArgumentParser(description="Sudoku CSP Solver with AC-3 algorithm")
     parser.add_argument("puzzle_path")
     parser.add_argument("--track-queue", action="store_true")
-    parser.add_argument("--show-queue", action="store_true")
+    parser.add_argument("--show-queue", action="store_true", help="print a summary and histogram of the AC-3 queue lengths")
+    parser.add_argument("--trace-every", type=int, default=0, metavar="N", help="print every N-th AC-3 queue pop live")
+    parser.add_argument("--trace-file", help="write every AC-3 queue length to this file")
+    parser.add_argument("--engine", choices=parallel.SOLVERS, default="csp",
+                        help="csp: propagation + backtracking, dlx: exact cover search with dancing links, "
+                             "sat: clause learning (CDCL) on a CNF encoding")
+    parser.add_argument("--dimacs", metavar="FILE", help="also write the puzzle's CNF encoding in DIMACS format")
+    parser.add_argument("--ac3-engine", choices=ac3.ENGINES, default="ac3",
+                        help="arc consistency engine used before and during search")
+    parser.add_argument("--propagation", choices=alldiff.STRENGTHS, default="ac3",
+                        help="extra all-different unit rules: hidden singles, naked subsets or Regin matching")
+    parser.add_argument("--search", choices=backtracking.SEARCHES, default="chronological",
+                        help="backtracking mode: chronological, iterative (chronological without recursion, "
+                             "for very deep searches) or conflict-directed backjumping")
+    parser.add_argument("--nogoods", type=int, default=0, metavar="N",
+                        help="with --search cbj, record nogoods of up to N assignments")
+    parser.add_argument("--restarts", choices=backtracking.RESTARTS, default="none",
+                        help="restart the search on a Luby or geometric node-budget schedule")
+    parser.add_argument("--restart-base", type=int, default=backtracking.RESTART_BASE, metavar="N",
+                        help="node budget of the first restart run")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed for the randomized tie-breaking (reproducible runs)")
+    parser.add_argument("--value-counts", action="store_true",
+                        help="single puzzle: keep per-unit value counts for LCV and hidden singles "
+                             "(pays off with --propagation hidden on 16x16 and larger)")
+    parser.add_argument("--split", action="store_true",
+                        help="single puzzle: split the search tree over --workers processes")
+    parser.add_argument("--batch", action="store_true",
+                        help="puzzle_path is a multi-puzzle file (directories and archives always run as a batch)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes for batch mode (default: all cores)")
+    parser.add_argument("--chunksize", type=int, default=16, help="puzzles sent to a worker at a time")
+    parser.add_argument("--unordered", action="store_true", help="collect batch results as they finish")
+    parser.add_argument("--mmap", action="store_true", help="memory-map the multi-puzzle file in batch mode")
+    parser.add_argument("--count", type=int, default=None, metavar="N",
+                        help="count solutions up to N instead of stopping at the first (2 = uniqueness check)")
+    parser.add_argument("--show-solutions", action="store_true", help="print every solution found with --count")
+    parser.add_argument("--stats", action="store_true",
+                        help="print propagation / search counters (revisions, checks, nodes, backtracks, ...)")
+    parser.add_argument("--cache-file", help="solution cache kept on disk between runs (JSON, keyed on canonical form)")
+    parser.add_argument("--cache-size", type=int, default=4096, help="most puzzles kept in the solution cache")
     args = parser.parse_args()
+    if args.count is not None and args.count < 1:
+        parser.error("--count must be at least 1")
+    if args.restart_base < 1:
+        parser.error("--restart-base must be at least 1")
+    if args.nogoods < 0:
+        parser.error("--nogoods must be at least 0")
+    if args.cache_size < 1:
+        parser.error("--cache-size must be at least 1")
     
     try:
-        solve_puzzle(args.puzzle_path, args.track_queue, args.show_queue)
+        if args.batch or os.path.isdir(args.puzzle_path) or puzzle_archive.is_archive(args.puzzle_path):
+            solve_batch(args.puzzle_path, args.workers, args.chunksize, not args.unordered, args.ac3_engine, args.propagation, args.mmap, args.count, args.stats,
+                        args.search, args.nogoods, args.restarts, args.restart_base, args.seed, args.engine)
+        else:
+            cache = canon.SolutionCache(args.cache_size, args.cache_file) if args.cache_file else None
+            solve_puzzle(args.puzzle_path, args.track_queue, args.show_queue, args.ac3_engine, args.propagation,
+                         args.count, args.show_solutions, args.stats, args.trace_every, args.trace_file, cache,
+                         args.search, args.nogoods, args.restarts, args.restart_base, args.seed,
+                         (args.workers or os.cpu_count() or 1) if args.split else None, args.engine, args.dimacs,
+                         args.value_counts)
+            if cache is not None:
+                cache.save()
     except FileNotFoundError:
         print(f"File not found: {args.puzzle_path}")
         sys.exit(1)
@@ -77,6 +345,8 @@ if __name__ == "__main__":
     if len(sys.argv) == 1:
         print("No arguments provided, running demo mode")
         print("For solver mode use: python main.py <puzzle_path> [--track-queue] [--show-queue]")
+        print("For batch mode use: python main.py <directory | multi-puzzle file --batch> [--workers N]")
+        print("For a uniqueness check add: --count 2")
         print("\nExample: python main.py test_puzzles/valid/puzzle1.txt --track-queue --show-queue")
     else:
         main()
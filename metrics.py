@@ -0,0 +1,97 @@
+"""
+CP468 — metrics.py
+Search and propagation counters.
+
+A SolverStats object is passed down as stats=... to ac3, alldiff, backtracking and
+heuristics, which add to it as they run. Every counter site is guarded by
+`if stats is not None`, so leaving it out (the default) costs one comparison.
+
+Counters:
+    - revise_calls      : revise / revise_residual calls
+    - constraint_checks : csp.constraint(...) evaluations inside revise (none for != constraints,
+                          which use ac3.revise_neq)
+    - values_pruned     : values removed from domains by propagation (AC-3 and unit rules)
+    - queue_pops        : arcs / variables taken off an AC-3 worklist
+    - nodes             : search nodes (calls of the recursive search)
+    - backtracks        : values that were tried and undone because they failed
+    - max_trail_depth   : most (var, removed) entries on the trail at once
+    - max_depth         : deepest recursion level reached
+    - var_selections    : select_var_mrv calls
+    - lcv_checks        : neighbour domains (or ValueCounts entries) looked at by order_values_lcv
+    - backjumps         : failures returned past a decision that did not cause them (search="cbj")
+    - nogoods           : nogoods recorded (search="cbj" with max_nogood_size)
+    - nogood_prunes     : values skipped because they would complete a recorded nogood
+    - restarts          : search runs abandoned at their node budget (backtracking restarts)
+
+Classes:
+    - SolverStats: counters, merge(other), as_dict()
+
+Functions:
+    - percentile(values, q): nearest-rank percentile, for timing reports (benchmark, server)
+"""
+
+from __future__ import annotations
+import math
+from typing import Dict, Iterable, Sequence
+
+
+class SolverStats:
+    """Plain counters; the max_* fields keep the maximum when merged, the rest are summed"""
+
+    __slots__ = (
+        "revise_calls",
+        "constraint_checks",
+        "values_pruned",
+        "queue_pops",
+        "nodes",
+        "backtracks",
+        "max_trail_depth",
+        "max_depth",
+        "var_selections",
+        "lcv_checks",
+        "backjumps",
+        "nogoods",
+        "nogood_prunes",
+        "restarts",
+    )
+
+    def __init__(self) -> None:
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+    def merge(self, other: "SolverStats") -> "SolverStats":
+        """Add other's counters to this one (in place) and return self"""
+        for name in self.__slots__:
+            if name.startswith("max_"):
+                setattr(self, name, max(getattr(self, name), getattr(other, name)))
+            else:
+                setattr(self, name, getattr(self, name) + getattr(other, name))
+        return self
+
+    def as_dict(self) -> Dict[str, int]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, values: Dict[str, int]) -> "SolverStats":
+        stats = cls()
+        for name in cls.__slots__:
+            setattr(stats, name, int(values.get(name, 0)))
+        return stats
+
+    @classmethod
+    def total(cls, many: Iterable["SolverStats"]) -> "SolverStats":
+        stats = cls()
+        for s in many:
+            stats.merge(s)
+        return stats
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)}" for name in self.__slots__)
+        return f"SolverStats({fields})"
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0..100) of a non-empty sequence"""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
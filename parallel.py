@@ -0,0 +1,440 @@
+"""
+CP468 — parallel.py
+Multi-core batch solving: fan puzzles out over a process pool.
+
+Each worker runs the usual pipeline (build CSP -> propagation -> backtracking)
+on one puzzle and returns the same metrics dict as run_demo.run_one_puzzle,
+without printing anything.
+
+For a single hard puzzle, split_solve spreads one search tree over the pool instead:
+the top levels are expanded breadth-first into domain snapshots, each worker searches
+a snapshot for at most task_nodes nodes and hands back whatever it did not get to
+(backtracking.explore), and those branches are queued again for idle workers. The
+pool is terminated as soon as enough solutions are in.
+
+Constants:
+    - SOLVERS: the engines solve_grid (and main.py / run_demo.py --engine) pick between
+
+Functions:
+    - solve_grid(label, grid, engine, propagation, count_limit, collect_stats, search, max_nogood_size, restarts, restart_base, seed, solver) -> dict
+    - solve_many(items, workers, chunksize, ordered, engine, propagation, count_limit, collect_stats, search, max_nogood_size, restarts, restart_base, seed, solver) -> Iterator[dict]
+    - encoded(grid, solver) -> dlx.SudokuCover | sat.SudokuSAT
+    - split_solve(csp, workers, limit, on_solution, engine, propagation, task_nodes) -> int
+    - solve_archive(path, workers, chunksize, ordered, engine, propagation, count_limit, collect_stats, search, max_nogood_size, restarts, restart_base, seed, solver) -> Iterator[dict]
+"""
+
+from __future__ import annotations
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from functools import partial
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from sudoku_csp import CSP, sudoku_csp_from_grid
+from topology import get_topology
+from metrics import SolverStats
+import alldiff
+import backtracking
+import dlx
+import heuristics
+import puzzle_archive
+import sat
+
+Item = Tuple[str, List[List[int]]]  # (label, grid)
+
+# "csp": propagation + backtracking on sudoku_csp.CSP, "dlx": exact cover (dlx.py), "sat": CNF + CDCL (sat.py)
+SOLVERS = ("csp", "dlx", "sat")
+
+
+def solve_grid(
+    label: str,
+    grid: List[List[int]],
+    engine: str = "ac3",
+    propagation: str = "ac3",
+    count_limit: Optional[int] = None,
+    collect_stats: bool = False,
+    search: str = "chronological",
+    max_nogood_size: int = 0,
+    restarts: str = "none",
+    restart_base: int = backtracking.RESTART_BASE,
+    seed: Optional[int] = None,
+    solver: str = "csp",
+) -> dict:
+    """
+    Solve one puzzle quietly and return its metrics.
+    With count_limit, solutions are counted up to that cap (backtracking.count_solutions)
+    and stored under "solutions"; "solution" is then the first one found.
+    With collect_stats, metrics["stats"] holds the SolverStats counters as a dict.
+    search / max_nogood_size pick the backtracking mode and restarts / restart_base / seed
+    the restart schedule (see backtracking.solve); with restarts, metrics["restarts"] is
+    the number of restarts the search used.
+    solver="dlx" / "sat" solves (or counts) with dlx.SudokuCover / sat.SudokuSAT instead of
+    propagation + backtracking; the CSP options are then ignored and only the search counters are filled.
+    """
+    metrics = {
+        "label": label,
+        "ac3_used": True,
+        "ac3_pops": 0,
+        "ac3_consistent": False,
+        "bt_used": False,
+        "solved": False,
+        "time_sec": 0.0,
+        "result_str": "",
+        "solution": None,
+    }
+    if count_limit is not None:
+        metrics["solutions"] = 0
+    stats = SolverStats() if collect_stats or restarts != "none" else None
+
+    t0 = time.perf_counter()
+    if solver != "csp":
+        _solve_grid_encoded(metrics, grid, solver, count_limit, stats)
+        if collect_stats:
+            metrics["stats"] = stats.as_dict()
+        metrics["time_sec"] = time.perf_counter() - t0
+        return metrics
+
+    csp = sudoku_csp_from_grid(grid)
+    consistent, q_lengths = alldiff.propagate(csp, propagation, engine=engine, track_queue=True, stats=stats)
+    metrics["ac3_consistent"] = bool(consistent)
+    metrics["ac3_pops"] = len(q_lengths) if q_lengths is not None else 0
+
+    if not consistent:
+        metrics["result_str"] = "UNSOLVABLE"
+    elif csp.is_solved():
+        metrics["solved"] = True
+        metrics["result_str"] = "SOLVED BY AC-3"
+    elif count_limit is not None:
+        metrics["bt_used"] = True
+        found: List[List[List[int]]] = []
+
+        def keep_first(solution: List[List[int]]) -> None:
+            if not found:
+                found.append(solution)
+
+        metrics["solutions"] = backtracking.count_solutions(csp, count_limit, keep_first, engine=engine,
+                                                            propagation=propagation, stats=stats)
+        metrics["solved"] = bool(found)
+        metrics["result_str"] = "SOLVED BY BACKTRACKING" if found else "NO SOLUTION"
+        if found:
+            metrics["solution"] = found[0]
+    else:
+        metrics["bt_used"] = True
+        metrics["solved"] = backtracking.solve(csp, engine=engine, propagation=propagation, stats=stats,
+                                               search=search, max_nogood_size=max_nogood_size,
+                                               restarts=restarts, restart_base=restart_base, seed=seed)
+        metrics["result_str"] = "SOLVED BY BACKTRACKING" if metrics["solved"] else "NO SOLUTION"
+
+    if metrics["solved"] and metrics["solution"] is None:
+        metrics["solution"] = csp.to_grid()
+        if count_limit is not None:
+            metrics["solutions"] = 1
+    if restarts != "none":
+        metrics["restarts"] = stats.restarts
+    if collect_stats:
+        metrics["stats"] = stats.as_dict()
+    metrics["time_sec"] = time.perf_counter() - t0
+    return metrics
+
+
+def encoded(grid: List[List[int]], solver: str):
+    """The grid as a dlx.SudokuCover or sat.SudokuSAT (both: consistent, solutions(stats), count(...))"""
+    if solver == "dlx":
+        return dlx.SudokuCover(grid)
+    if solver == "sat":
+        return sat.SudokuSAT(grid)
+    raise ValueError(f"Unknown solver {solver!r}, expected one of {SOLVERS}.")
+
+
+def _solve_grid_encoded(metrics: dict, grid: List[List[int]], solver: str, count_limit: Optional[int],
+                        stats: Optional[SolverStats]) -> None:
+    """solve_grid's dlx / sat path: fill in metrics from the encoded grid's search"""
+    metrics["ac3_used"] = False
+    cover = encoded(grid, solver)
+    metrics["ac3_consistent"] = cover.consistent
+    if not cover.consistent:
+        metrics["result_str"] = "UNSOLVABLE"
+        return
+    if count_limit is not None:
+        found: List[List[List[int]]] = []
+
+        def keep_first(solution: List[List[int]]) -> None:
+            if not found:
+                found.append(solution)
+
+        metrics["solutions"] = cover.count(count_limit, keep_first, stats)
+        solution = found[0] if found else None
+    else:
+        solution = next(cover.solutions(stats), None)
+    metrics["solved"] = solution is not None
+    metrics["solution"] = solution
+    metrics["result_str"] = f"SOLVED BY {solver.upper()}" if solution is not None else "NO SOLUTION"
+
+
+def _solve_item(item: Item, engine: str, propagation: str, count_limit: Optional[int], collect_stats: bool,
+                search: str, max_nogood_size: int, restarts: str, restart_base: int, seed: Optional[int],
+                solver: str) -> dict:
+    label, grid = item
+    return solve_grid(label, grid, engine, propagation, count_limit, collect_stats, search, max_nogood_size,
+                      restarts, restart_base, seed, solver)
+
+
+def solve_many(
+    items: Iterable[Item],
+    workers: Optional[int] = None,
+    chunksize: int = 16,
+    ordered: bool = True,
+    engine: str = "ac3",
+    propagation: str = "ac3",
+    count_limit: Optional[int] = None,
+    collect_stats: bool = False,
+    search: str = "chronological",
+    max_nogood_size: int = 0,
+    restarts: str = "none",
+    restart_base: int = backtracking.RESTART_BASE,
+    seed: Optional[int] = None,
+    solver: str = "csp",
+) -> Iterator[dict]:
+    """
+    Solve (label, grid) pairs on `workers` processes (default: all cores) and yield
+    their metrics. Puzzles are sent to workers in chunks of `chunksize`; with
+    ordered=False results come back as soon as they are done instead of in input order.
+    count_limit switches every puzzle to solution counting and collect_stats adds
+    the SolverStats counters (see solve_grid); search, max_nogood_size, restarts, restart_base
+    and seed pick the backtracking mode, solver the engine (SOLVERS).
+    items can be a lazy iterator (io_utils.iter_puzzles); only a bounded number of
+    puzzles is read ahead. workers=1 solves in this process, without a pool.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 1:
+        raise ValueError("workers must be at least 1.")
+    if chunksize < 1:
+        raise ValueError("chunksize must be at least 1.")
+
+    task = partial(_solve_item, engine=engine, propagation=propagation, count_limit=count_limit,
+                   collect_stats=collect_stats, search=search, max_nogood_size=max_nogood_size,
+                   restarts=restarts, restart_base=restart_base, seed=seed, solver=solver)
+    if workers == 1:
+        yield from map(task, items)
+        return
+
+    # Pool.imap pulls its whole input up front; a semaphore keeps at most
+    # max_pending puzzles in flight so a streamed corpus stays streamed.
+    max_pending = workers * chunksize * 2
+    pending = threading.Semaphore(max_pending)
+    stop = threading.Event()
+
+    def throttled() -> Iterator[Item]:
+        for item in items:
+            while not pending.acquire(timeout=0.1):
+                if stop.is_set():
+                    return
+            yield item
+
+    with multiprocessing.Pool(processes=workers) as pool:
+        try:
+            if ordered:
+                results = pool.imap(task, throttled(), chunksize=chunksize)
+            else:
+                results = pool.imap_unordered(task, throttled(), chunksize=chunksize)
+            for result in results:
+                pending.release()
+                yield result
+        finally:
+            stop.set()
+
+
+# One open reader per worker process and archive, so each task is just a record range
+_readers: dict = {}
+
+
+def _solve_range(task: Tuple[str, int, int], engine: str, propagation: str, count_limit: Optional[int],
+                 collect_stats: bool, search: str, max_nogood_size: int, restarts: str, restart_base: int,
+                 seed: Optional[int], solver: str) -> List[dict]:
+    path, start, stop = task
+    reader = _readers.get(path)
+    if reader is None:
+        reader = _readers[path] = puzzle_archive.ArchiveReader(path)
+    return [
+        solve_grid(label, grid, engine, propagation, count_limit, collect_stats, search, max_nogood_size,
+                   restarts, restart_base, seed, solver)
+        for label, grid in reader.iter_range(start, stop)
+    ]
+
+
+def solve_archive(
+    path: str,
+    workers: Optional[int] = None,
+    chunksize: int = 16,
+    ordered: bool = True,
+    engine: str = "ac3",
+    propagation: str = "ac3",
+    count_limit: Optional[int] = None,
+    collect_stats: bool = False,
+    search: str = "chronological",
+    max_nogood_size: int = 0,
+    restarts: str = "none",
+    restart_base: int = backtracking.RESTART_BASE,
+    seed: Optional[int] = None,
+    solver: str = "csp",
+) -> Iterator[dict]:
+    """
+    Like solve_many, for a binary archive: workers are only sent (path, start, stop)
+    record ranges of `chunksize` puzzles and read the records from their own memory
+    map of the shared file, so no grids are parsed or pickled on the way in.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 1:
+        raise ValueError("workers must be at least 1.")
+    if chunksize < 1:
+        raise ValueError("chunksize must be at least 1.")
+
+    with puzzle_archive.ArchiveReader(path) as reader:
+        count = len(reader)
+    tasks = [(str(path), start, min(start + chunksize, count)) for start in range(0, count, chunksize)]
+    task = partial(_solve_range, engine=engine, propagation=propagation, count_limit=count_limit,
+                   collect_stats=collect_stats, search=search, max_nogood_size=max_nogood_size,
+                   restarts=restarts, restart_base=restart_base, seed=seed, solver=solver)
+
+    if workers == 1:
+        for batch in map(task, tasks):
+            yield from batch
+        return
+
+    with multiprocessing.Pool(processes=workers) as pool:
+        results = pool.imap(task, tasks) if ordered else pool.imap_unordered(task, tasks)
+        for batch in results:
+            yield from batch
+
+
+# split_solve: search nodes per task before a worker hands its remaining branches back,
+# and how many open subproblems per worker the breadth-first expansion aims for
+TASK_NODES = 200
+SPLIT_FACTOR = 4
+
+# Longest split_solve waits for a result before checking again that its workers are alive
+WORKER_POLL_SEC = 1.0
+
+
+def _expand(csp: CSP, target: int, limit: Optional[int], on_solution, engine: str, propagation: str,
+            found: List[int]) -> List[backtracking.Branch]:
+    """
+    Breadth-first expansion of the search tree below csp (MRV variable, LCV value order)
+    until there are at least target open subproblems. Solutions met on the way are
+    reported and counted in found[0]; returns [] once the limit is reached.
+    """
+    frontier = [list(csp.domains)]
+    while frontier and len(frontier) < target:
+        deeper = []
+        for domains in frontier:
+            node = CSP(csp.topology, domains, csp.constraint)
+            var = heuristics.select_var_mrv(node)
+            if var is None:
+                if node.is_solved():
+                    found[0] += 1
+                    if on_solution is not None:
+                        on_solution(node.to_grid())
+                    if limit is not None and found[0] >= limit:
+                        return []
+                continue
+            for value in heuristics.order_values_lcv(node, var):
+                child = node.copy()
+                if backtracking._assign_and_infer(child, var, value, backtracking.Trail(), engine, propagation):
+                    deeper.append(child.domains)
+        frontier = deeper
+    return [(domains, None, 0) for domains in frontier]
+
+
+def _explore_task(branch: backtracking.Branch, limit: Optional[int], box: int, constraint: Callable, engine: str,
+                  propagation: str, task_nodes: int) -> Tuple[List[List[List[int]]], List[backtracking.Branch]]:
+    """Worker side of split_solve: (solutions found, branches left over) for one branch"""
+    domains, var, value = branch
+    csp = CSP(get_topology(box), list(domains), constraint)
+    if var is not None and not backtracking._assign_and_infer(csp, var, value, backtracking.Trail(), engine, propagation):
+        return [], []
+    solutions: List[List[List[int]]] = []
+    _, branches = backtracking.explore(csp, task_nodes, limit, solutions.append, engine, propagation)
+    return solutions, branches
+
+
+def split_solve(
+    csp: CSP,
+    workers: Optional[int] = None,
+    limit: Optional[int] = 1,
+    on_solution: Optional[Callable[[List[List[int]]], None]] = None,
+    engine: str = "ac3",
+    propagation: str = "ac3",
+    task_nodes: int = TASK_NODES,
+) -> int:
+    """
+    Search one (already propagated) CSP on `workers` processes and return how many
+    solutions were found, up to limit (1: first solution, 2: uniqueness check,
+    None: count them all). on_solution(grid) gets every solution as it arrives, so
+    with several workers the first one reported is not necessarily the one a
+    sequential search would find first. csp.domains are left as they were.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 1:
+        raise ValueError("workers must be at least 1.")
+    if limit is not None and limit < 1:
+        raise ValueError("limit must be at least 1 (or None for no limit).")
+    if task_nodes < 1:
+        raise ValueError("task_nodes must be at least 1.")
+
+    if workers == 1:
+        n, _ = backtracking.explore(csp.copy(), None, limit, on_solution, engine, propagation)
+        return n
+
+    found = [0]
+    branches = _expand(csp, workers * SPLIT_FACTOR, limit, on_solution, engine, propagation, found)
+    if not branches:
+        return found[0]
+
+    # The constraint goes along with every task (it has to pickle, so no lambdas)
+    task = partial(_explore_task, box=csp.topology.box, constraint=csp.constraint, engine=engine,
+                   propagation=propagation, task_nodes=task_nodes)
+    results: "queue.Queue" = queue.Queue()
+    pending = 0
+    others = set(multiprocessing.active_children())
+    # Leaving the with block terminates the pool, which cancels every task still running
+    with multiprocessing.Pool(processes=workers) as pool:
+        # The pool replaces a worker that dies, but the task it was running never reports
+        # back, so the loop below gives up once one of these has exited
+        pool_workers = set(multiprocessing.active_children()) - others
+
+        def submit(branch: backtracking.Branch) -> None:
+            nonlocal pending
+            pending += 1
+            remaining = None if limit is None else limit - found[0]
+            pool.apply_async(task, (branch, remaining), callback=results.put, error_callback=results.put)
+
+        for branch in branches:
+            submit(branch)
+        while pending:
+            try:
+                result = results.get(timeout=WORKER_POLL_SEC)
+            except queue.Empty:
+                result = None
+            if any(worker.exitcode is not None for worker in pool_workers):
+                raise RuntimeError("a split_solve worker process died; its branch is lost")
+            if result is None:
+                continue
+            pending -= 1
+            if isinstance(result, BaseException):
+                raise result
+            solutions, left_over = result
+            for grid in solutions:
+                found[0] += 1
+                if on_solution is not None:
+                    on_solution(grid)
+                if limit is not None and found[0] >= limit:
+                    return found[0]
+            # Dynamic re-splitting: whatever a task did not finish goes back in the queue
+            for branch in left_over:
+                submit(branch)
+    return found[0]
@@ -0,0 +1,274 @@
+"""
+CP468 — puzzle_archive.py
+Packed binary puzzle archive with a random-access index.
+
+Layout of an archive file:
+    header  : magic b"SDKA", version, box size, bits per cell, record size, record count
+    records : one fixed-size record per puzzle, cells packed row-major at `bits`
+              bits each (4 bits for 9x9, so 41 bytes per puzzle), 0 = blank
+The record offset is HEADER_SIZE + i * record_size, so any range of records can be
+sliced out of a memory map without decoding anything else.
+
+A text sidecar "<archive>.idx" holds the offset index of the sources the archive
+was built from, one line per source: first record, count, byte offset, label.
+
+Usage:
+    python puzzle_archive.py <text dir or multi-puzzle file> <archive>   # convert
+    python puzzle_archive.py --info <archive>
+
+Functions / classes:
+    - pack_grid(grid, box, bits) -> bytes
+    - unpack_record(record, box, bits) -> grid
+    - write_archive(path, items, box=None) -> int
+    - convert(src, dst, box=None) -> int
+    - is_archive(path) -> bool
+    - ArchiveReader(path): len(), [i], records(start, stop), iter_range(start, stop), split(n)
+"""
+
+from __future__ import annotations
+import argparse
+import mmap
+import struct
+from itertools import chain
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import io_utils
+from sudoku_csp import box_size
+
+MAGIC = b"SDKA"
+VERSION = 1
+_HEADER = struct.Struct("<4sBBBxIQ")
+HEADER_SIZE = _HEADER.size
+
+Grid = List[List[int]]
+
+# byte -> (high nibble, low nibble), the fast path for 4-bit cells
+_NIBBLES = [(b >> 4, b & 0x0F) for b in range(256)]
+
+
+def cell_bits(box: int) -> int:
+    """Bits per cell: enough for 0..size, and never less than a nibble"""
+    return max(4, (box * box).bit_length())
+
+
+def record_size(box: int, bits: int) -> int:
+    return ((box ** 4) * bits + 7) // 8
+
+
+def pack_grid(grid: Grid, box: int = 3, bits: Optional[int] = None) -> bytes:
+    """Pack a grid into one fixed-size record"""
+    bits = bits or cell_bits(box)
+    size = box * box
+    cells = [v for row in grid for v in row]
+    if len(grid) != size or len(cells) != size * size:
+        raise ValueError(f"Grid must be {size}x{size}.")
+    if any(not 0 <= v <= size for v in cells):
+        raise ValueError(f"Grid values must be integers in 0..{size}.")
+
+    n_bytes = record_size(box, bits)
+    if bits == 4:
+        if len(cells) % 2:
+            cells.append(0)
+        return bytes((cells[i] << 4) | cells[i + 1] for i in range(0, len(cells), 2))
+
+    packed = 0
+    for v in cells:
+        packed = (packed << bits) | v
+    packed <<= n_bytes * 8 - len(cells) * bits
+    return packed.to_bytes(n_bytes, "big")
+
+
+def unpack_record(record: bytes, box: int = 3, bits: Optional[int] = None) -> Grid:
+    """Decode one record back into a grid"""
+    bits = bits or cell_bits(box)
+    size = box * box
+    n_cells = size * size
+
+    if bits == 4:
+        cells = [v for b in record for v in _NIBBLES[b]]
+    else:
+        packed = int.from_bytes(record, "big") >> (len(record) * 8 - n_cells * bits)
+        mask = (1 << bits) - 1
+        cells = [(packed >> (bits * (n_cells - 1 - i))) & mask for i in range(n_cells)]
+    return [cells[r * size:(r + 1) * size] for r in range(size)]
+
+
+def write_archive(path: str, items: Iterable[Tuple[str, Grid]], box: Optional[int] = None) -> int:
+    """
+    Write (label, grid) pairs to an archive plus its .idx sidecar.
+    All grids share one box size, taken from the first grid unless given.
+    Consecutive labels from the same source file ("file:line") share one index entry.
+    Returns the number of records written.
+    """
+    items = iter(items)
+    first = next(items, None)
+    if box is None:
+        box = box_size(len(first[1])) if first is not None else 3
+    if first is not None:
+        items = chain([first], items)
+    bits = cell_bits(box)
+    size = record_size(box, bits)
+    count = 0
+    sections: List[List] = []  # [first record, count, source]
+
+    with open(path, "wb") as out:
+        out.write(_HEADER.pack(MAGIC, VERSION, box, bits, size, 0))
+        for label, grid in items:
+            source = label.rsplit(":", 1)[0]
+            if not sections or sections[-1][2] != source:
+                sections.append([count, 0, source])
+            sections[-1][1] += 1
+            out.write(pack_grid(grid, box, bits))
+            count += 1
+        # Patch the record count now that it is known
+        out.seek(0)
+        out.write(_HEADER.pack(MAGIC, VERSION, box, bits, size, count))
+
+    with open(str(path) + ".idx", "w") as idx:
+        for first, n, source in sections:
+            idx.write(f"{first}\t{n}\t{HEADER_SIZE + first * size}\t{source}\n")
+    return count
+
+
+def convert(src: str, dst: str, box: Optional[int] = None) -> int:
+    """Convert a text puzzle directory or multi-puzzle file into an archive"""
+    return write_archive(dst, io_utils.iter_puzzles(src), box)
+
+
+def is_archive(path: str) -> bool:
+    """True if path is a file starting with the archive magic"""
+    p = Path(path)
+    if not p.is_file():
+        return False
+    with open(p, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class ArchiveReader:
+    """
+    Memory-mapped, read-only view of an archive. Records are only decoded when
+    asked for; records(start, stop) hands out a zero-copy memoryview of the raw bytes.
+    The map cannot be closed while such a view is alive, so release() the views (or use
+    them in a with block) before close(); [i] and iter_range release their own.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = str(path)
+        self._file = open(self.path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, box, bits, size, count = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{self.path}: not a puzzle archive.")
+        if version != VERSION:
+            self.close()
+            raise ValueError(f"{self.path}: unsupported archive version {version}.")
+        if len(self._mm) < HEADER_SIZE + count * size:
+            self.close()
+            raise ValueError(f"{self.path}: truncated archive.")
+        self.box = box
+        self.bits = bits
+        self.record_size = size
+        self.count = count
+        self.sections = self._read_index()
+
+    def _read_index(self) -> List[Tuple[int, int, int, str]]:
+        idx = Path(self.path + ".idx")
+        if not idx.exists():
+            return [(0, self.count, HEADER_SIZE, Path(self.path).name)]
+        sections = []
+        with open(idx) as f:
+            for line in f:
+                first, n, offset, label = line.rstrip("\n").split("\t", 3)
+                sections.append((int(first), int(n), int(offset), label))
+        return sections
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> Grid:
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError("record index out of range")
+        with self.records(i, i + 1) as view:
+            return unpack_record(view, self.box, self.bits)
+
+    def byte_range(self, start: int, stop: int) -> Tuple[int, int]:
+        """(offset, length) of records [start, stop) in the file"""
+        start = max(0, min(start, self.count))
+        stop = max(start, min(stop, self.count))
+        return HEADER_SIZE + start * self.record_size, (stop - start) * self.record_size
+
+    def records(self, start: int, stop: int) -> memoryview:
+        """Raw bytes of records [start, stop), without copying"""
+        offset, length = self.byte_range(start, stop)
+        return memoryview(self._mm)[offset:offset + length]
+
+    def iter_range(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[str, Grid]]:
+        """Decode records [start, stop) lazily as (label, grid) pairs"""
+        stop = self.count if stop is None else stop
+        name = Path(self.path).name
+        size = self.record_size
+        # released when the generator finishes or is closed, so close() can unmap the file
+        with self.records(start, stop) as view:
+            for k in range(len(view) // size):
+                with view[k * size:(k + 1) * size] as record:
+                    grid = unpack_record(record, self.box, self.bits)
+                yield f"{name}#{start + k}", grid
+
+    def split(self, n: int) -> List[Tuple[int, int]]:
+        """Cut the archive into n contiguous (start, stop) record ranges of near-equal size"""
+        n = max(1, n)
+        step, extra = divmod(self.count, n)
+        ranges = []
+        start = 0
+        for k in range(n):
+            stop = start + step + (1 if k < extra else 0)
+            if stop > start:
+                ranges.append((start, stop))
+            start = stop
+        return ranges
+
+    def close(self) -> None:
+        """
+        Unmap and close the file. Raises BufferError if a view from records() is still
+        alive; the file handle is closed either way.
+        """
+        try:
+            self._mm.close()
+        finally:
+            self._file.close()
+
+    def __enter__(self) -> "ArchiveReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __repr__(self) -> str:
+        return f"ArchiveReader({self.path!r}, records={self.count}, box={self.box}, record_size={self.record_size})"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert Sudoku text puzzles to a packed binary archive")
+    parser.add_argument("src", help="text directory / multi-puzzle file, or an archive with --info")
+    parser.add_argument("dst", nargs="?", help="archive to write")
+    parser.add_argument("--info", action="store_true", help="print the header and index of an archive")
+    args = parser.parse_args()
+
+    if args.info:
+        with ArchiveReader(args.src) as reader:
+            print(reader)
+            for first, n, offset, label in reader.sections:
+                print(f"  records {first:>8} - {first + n - 1:<8} @ byte {offset:<10} {label}")
+        return
+    if not args.dst:
+        parser.error("dst is required when converting")
+    n = convert(args.src, args.dst)
+    print(f"Wrote {n} puzzle(s) to {args.dst}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+CP468 — queue_trace.py
+Pluggable sinks for AC-3 queue telemetry.
+
+ac3.ac3 / alldiff.propagate take track_queue=<sink> (or True for a QueueStats)
+and call sink.record(length, queue) once per pop, before the pop. The sink decides
+what to keep, so memory does not grow with the number of pops:
+    - QueueStats   : streaming count / min / max / mean and a fixed power-of-two histogram
+    - QueuePrinter : sampled, rate-limited live printing of the queue size and its first entries
+    - QueueFile    : write-through "step <tab> length" lines to a file
+    - QueueTee     : fan one stream out to several sinks
+Anything with a record(length, queue=None) method works as a sink.
+
+Functions / classes:
+    - make_sink(track_queue) -> sink or None
+    - QueueStats, QueuePrinter, QueueFile, QueueTee
+"""
+
+from __future__ import annotations
+import time
+from itertools import islice
+from typing import Callable, Iterable, List, Optional, TextIO, Union
+
+# Histogram bucket b counts lengths with bit_length() == b: 0, 1, 2-3, 4-7, ... (the last one is open-ended)
+HISTOGRAM_BUCKETS = 24
+
+
+class QueueStats:
+    """
+    Streaming summary of queue lengths in constant memory.
+    len() is the number of recorded pops, so it can stand in for the old list of lengths.
+    """
+
+    __slots__ = ("count", "total", "min", "max", "histogram")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+        self.histogram: List[int] = [0] * HISTOGRAM_BUCKETS
+
+    def record(self, length: int, queue: Optional[Iterable] = None) -> None:
+        if self.count == 0 or length < self.min:
+            self.min = length
+        if length > self.max:
+            self.max = length
+        self.count += 1
+        self.total += length
+        self.histogram[min(length.bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+
+    def merge(self, other: "QueueStats") -> "QueueStats":
+        """Fold other's pops into this summary (in place) and return self"""
+        if other.count:
+            self.min = other.min if self.count == 0 else min(self.min, other.min)
+            self.max = max(self.max, other.max)
+            self.count += other.count
+            self.total += other.total
+            self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+        return self
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def buckets(self) -> List[tuple]:
+        """Non-empty histogram buckets as (low, high, count); high is None for the last bucket"""
+        rows = []
+        for b, n in enumerate(self.histogram):
+            if n:
+                low = 0 if b == 0 else 1 << (b - 1)
+                high = None if b == HISTOGRAM_BUCKETS - 1 else (0 if b == 0 else (1 << b) - 1)
+                rows.append((low, high, n))
+        return rows
+
+    def format_histogram(self, width: int = 40) -> str:
+        rows = self.buckets()
+        peak = max((n for _, _, n in rows), default=0)
+        lines = []
+        for low, high, n in rows:
+            label = f"{low}+" if high is None else (f"{low}" if low == high else f"{low}-{high}")
+            bar = "#" * max(1, n * width // peak)
+            lines.append(f"  {label:>13} | {n:>9} {bar}")
+        return "\n".join(lines)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __repr__(self) -> str:
+        return f"QueueStats(pops={self.count}, min={self.min}, max={self.max}, mean={self.mean:.1f})"
+
+
+class QueuePrinter:
+    """
+    Live trace of the queue: prints every `every`-th pop, at most once per `interval`
+    seconds and at most `max_lines` lines in total. Only the first `preview` entries
+    of the queue are looked at (formatted with fmt), so a line costs O(preview).
+    """
+
+    def __init__(
+        self,
+        every: int = 1,
+        preview: int = 12,
+        interval: float = 0.0,
+        max_lines: Optional[int] = None,
+        fmt: Callable[[object], str] = str,
+        out: Optional[TextIO] = None,
+        prefix: str = "[AC-3]",
+    ) -> None:
+        if every < 1:
+            raise ValueError("every must be at least 1.")
+        self.every = every
+        self.preview = preview
+        self.interval = interval
+        self.max_lines = max_lines
+        self.fmt = fmt
+        self.out = out
+        self.prefix = prefix
+        self.step = 0
+        self.lines = 0
+        self._last = float("-inf")
+
+    def record(self, length: int, queue: Optional[Iterable] = None) -> None:
+        self.step += 1
+        if self.step % self.every:
+            return
+        if self.max_lines is not None and self.lines >= self.max_lines:
+            if self.lines == self.max_lines:
+                print(f"{self.prefix} ... (line limit reached, tracing muted)", file=self.out)
+                self.lines += 1
+            return
+        if self.interval:
+            now = time.monotonic()
+            if now - self._last < self.interval:
+                return
+            self._last = now
+
+        line = f"{self.prefix} Step {self.step:03d} | Queue size={length}"
+        if self.preview and queue is not None:
+            shown = ", ".join(self.fmt(item) for item in islice(queue, self.preview))
+            extra = "" if length <= self.preview else f" ... (+{length - self.preview} more)"
+            line += f" | {shown}{extra}"
+        print(line, file=self.out)
+        self.lines += 1
+
+
+class QueueFile:
+    """Write-through sink: one "step<TAB>length" line per pop, nothing kept in memory; close() flushes"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.step = 0
+        self._file = open(path, "w")
+
+    def record(self, length: int, queue: Optional[Iterable] = None) -> None:
+        self.step += 1
+        self._file.write(f"{self.step}\t{length}\n")
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "QueueFile":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class QueueTee:
+    """Forward every record to several sinks; len() is taken from the first one"""
+
+    def __init__(self, *sinks) -> None:
+        self.sinks = sinks
+
+    def record(self, length: int, queue: Optional[Iterable] = None) -> None:
+        for sink in self.sinks:
+            sink.record(length, queue)
+
+    def __len__(self) -> int:
+        return len(self.sinks[0]) if self.sinks else 0
+
+
+def make_sink(track_queue: Union[bool, object, None]):
+    """track_queue=True -> a new QueueStats, False/None -> None, a sink -> itself"""
+    if track_queue is True:
+        return QueueStats()
+    if track_queue is None or track_queue is False:
+        return None
+    return track_queue
@@ -8,6 +8,12 @@ Modes:
   - short  : run 1 example from each category; print AC-3 queue contents live
   - full   : run all available puzzles from all categories
   - manual : prompt for a puzzle; print AC-3 queue contents live
+  - vector : run all puzzles as one NumPy batch (batch_numpy), backtracking only the leftovers
+  - batch  : run a directory / multi-puzzle file (--path) on a process pool (parallel.solve_many);
+             with --cache, puzzles equivalent to an earlier one are answered from canon.SolutionCache
+
+--engine dlx / sat swaps AC-3 + backtracking for exact cover search (dlx.py) / CDCL on a CNF
+encoding (sat.py) in every mode but vector, so the engines can be timed on the same puzzles.
 
 Outputs:
   - AC-3 queue trace (in short/manual)
@@ -19,62 +25,49 @@ Outputs:
 from __future__ import annotations
 import argparse
 import time
-from collections import deque
-from typing import Iterable, List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from pathlib import Path
 
 import io_utils
 from sudoku_csp import sudoku_csp_from_grid, CSP, Var
 import ac3 as ac3_mod
 import backtracking as bt
+import canon
+import parallel
+from metrics import SolverStats
+import queue_trace
 
 
 # ---------- Verbose AC-3 (local) ----------
-def ac3_verbose(csp: CSP, queue: Optional[Iterable[Tuple[Var, Var]]] = None) -> Tuple[bool, int]:
-    """AC-3 with live queue CONTENT printing."""
-    arc_queue = deque(queue or csp.all_arcs())
-    pops = 0
-
-    def revise(Xi: Var, Xj: Var) -> bool:
-        revised = False
-        di = csp.domains[Xi]
-        dj = csp.domains[Xj]
-        to_remove = set()
-        for x in di:
-            if not any(csp.constraint(Xi, x, Xj, y) for y in dj):
-                to_remove.add(x)
-        if to_remove:
-            di -= to_remove
-            revised = True
-        return revised
-
-    step = 0
-    while arc_queue:
-        step += 1
-        q_list = list(arc_queue)
-        preview = ", ".join([f"{a}->{b}" for (a, b) in q_list[:12]])
-        extra = "" if len(q_list) <= 12 else f" ... (+{len(q_list)-12} more)"
-        print(f"[AC-3] Step {step:03d} | Queue size={len(q_list)} | {preview}{extra}")
-
-        Xi, Xj = arc_queue.popleft()
-        pops += 1
-
-        if revise(Xi, Xj):
-            if len(csp.domains[Xi]) == 0:
-                print("[AC-3] Domain wipe-out -> inconsistent")
-                return False, pops
-            for Xk in csp.neighbors[Xi]:
-                if Xk != Xj:
-                    arc_queue.append((Xk, Xi))
-    return True, pops
+def ac3_verbose(csp: CSP, queue: Optional[Iterable[Tuple[Var, Var]]] = None, stats: Optional[SolverStats] = None,
+                every: int = 1, interval: float = 0.0) -> Tuple[bool, int]:
+    """
+    AC-3 with live queue CONTENT printing, through a queue_trace.QueuePrinter:
+    every n-th pop at most once per interval seconds, and only the first 12 arcs
+    of the queue are formatted, so a step costs the same for any queue size.
+    """
+    coords = csp.topology.coords
+
+    def fmt(arc: Tuple[Var, Var]) -> str:
+        return f"{coords[arc[0]]}->{coords[arc[1]]}"
+
+    pops = queue_trace.QueueStats()
+    printer = queue_trace.QueuePrinter(every=every, interval=interval, fmt=fmt)
+    consistent, _ = ac3_mod.ac3(csp, queue, queue_trace.QueueTee(pops, printer), stats=stats)
+    if not consistent:
+        print("[AC-3] Domain wipe-out -> inconsistent")
+    return consistent, len(pops)
 
 
 # ---------- Helper: run one puzzle ----------
 
-def run_one_puzzle(grid: List[List[int]], *, verbose_queue: bool, label: str) -> dict:
+def run_one_puzzle(grid: List[List[int]], *, verbose_queue: bool, label: str, count_limit: Optional[int] = None,
+                   trace_every: int = 1, trace_interval: float = 0.0, solver: str = "csp") -> dict:
     """
     Run AC-3 (verbose or standard), then backtracking if needed.
-    Returns a metrics dict.
+    With count_limit, backtracking counts solutions up to that cap (metrics["solutions"]).
+    solver="dlx" / "sat" runs that engine (parallel.solve_grid) instead and prints its result.
+    Returns a metrics dict; metrics["stats"] holds the SolverStats counters as a dict.
     """
     metrics = {
         "label": label,              # >>> added
@@ -86,23 +79,40 @@ def run_one_puzzle(grid: List[List[int]], *, verbose_queue: bool, label: str) ->
         "time_sec": 0.0,
         "result_str": "",            # >>> added
     }
+    if count_limit is not None:
+        metrics["solutions"] = 0
+    stats = SolverStats()
+    metrics["stats"] = stats.as_dict()
 
     print(f"\n=== Running: {label} ===")
     io_utils.print_grid(grid)
 
+    if solver != "csp":
+        print(f"\n[run] Starting {solver.upper()} search...")
+        metrics = parallel.solve_grid(label, grid, count_limit=count_limit, collect_stats=True, solver=solver)
+        if count_limit is not None and metrics["ac3_consistent"]:
+            print(f"[run] Solutions found: {metrics['solutions']}{'+' if metrics['solutions'] == count_limit else ''}")
+        io_utils.print_status(is_consistent=metrics["ac3_consistent"], solved=metrics["solved"])
+        if metrics["solved"]:
+            print("\nSolution:")
+            io_utils.print_grid(metrics["solution"])
+        print(f"[run] Finished ({metrics['result_str']}). time={metrics['time_sec']:.4f}s")
+        return metrics
+
     t0 = time.perf_counter()
     if verbose_queue:
         print("\n[run] Starting AC-3 (verbose)...")
-        consistent, pops = ac3_verbose(sudoku_csp_from_grid(grid))
+        consistent, pops = ac3_verbose(sudoku_csp_from_grid(grid), stats=stats, every=trace_every, interval=trace_interval)
         q_lengths = None
     else:
         print("\n[run] Starting AC-3...")
         csp = sudoku_csp_from_grid(grid)
-        consistent, q_lengths = ac3_mod.ac3(csp, track_queue=True)
+        consistent, q_lengths = ac3_mod.ac3(csp, track_queue=True, stats=stats)
         pops = len(q_lengths) if q_lengths is not None else 0
 
     metrics["ac3_consistent"] = bool(consistent)
     metrics["ac3_pops"] = int(pops)
+    metrics["stats"] = stats.as_dict()
 
     if not consistent:
         metrics["time_sec"] = time.perf_counter() - t0
@@ -117,6 +127,8 @@ def run_one_puzzle(grid: List[List[int]], *, verbose_queue: bool, label: str) ->
         metrics["solved"] = True
         metrics["time_sec"] = time.perf_counter() - t0
         metrics["result_str"] = "SOLVED BY AC-3"
+        if count_limit is not None:
+            metrics["solutions"] = 1
         io_utils.print_status(is_consistent=True, solved=True)
         print("\nSolution:")
         io_utils.print_grid(csp.to_grid())
@@ -128,15 +140,27 @@ def run_one_puzzle(grid: List[List[int]], *, verbose_queue: bool, label: str) ->
 
     csp = sudoku_csp_from_grid(grid)
     consistent, _ = ac3_mod.ac3(csp)
-    solved = bt.solve(csp)
+    solution = None
+    if count_limit is not None:
+        found: List[List[List[int]]] = []  # at most count_limit grids
+        metrics["solutions"] = bt.count_solutions(csp, count_limit, found.append, stats=stats)
+        solved = bool(found)
+        if solved:
+            solution = found[0]
+        print(f"[run] Solutions found: {metrics['solutions']}{'+' if metrics['solutions'] == count_limit else ''}")
+    else:
+        solved = bt.solve(csp, stats=stats)
+        if solved:
+            solution = csp.to_grid()
     metrics["solved"] = bool(solved)
+    metrics["stats"] = stats.as_dict()
     metrics["time_sec"] = time.perf_counter() - t0
     metrics["result_str"] = "SOLVED BY BACKTRACKING" if solved else "NO SOLUTION"
 
     io_utils.print_status(is_consistent=True, solved=metrics["solved"])
     if solved:
         print("\nSolution:")
-        io_utils.print_grid(csp.to_grid())
+        io_utils.print_grid(solution)
     print(f"[run] Finished. time={metrics['time_sec']:.4f}s")
 
     return metrics
@@ -151,62 +175,186 @@ def print_summary(results: List[dict]) -> None:
     avg_time = total_time / total if total else 0.0
 
     solved = sum(1 for r in results if r["solved"])
-    by_ac3 = sum(1 for r in results if "AC-3" in r["result_str"])
+    by_ac3 = sum(1 for r in results if "AC-3" in r["result_str"] or "PROPAGATION" in r["result_str"])
     by_bt = sum(1 for r in results if "BACKTRACKING" in r["result_str"])
-    unsat = sum(1 for r in results if r["result_str"] == "UNSOLVABLE")
+    by_dlx = sum(1 for r in results if "DLX" in r["result_str"])
+    by_sat = sum(1 for r in results if "SAT" in r["result_str"])
+    by_cache = sum(1 for r in results if "CACHE" in r["result_str"])
+    unsat = sum(1 for r in results if r["result_str"].startswith("UNSOLVABLE"))
 
     print(f"Total puzzles run     : {total}")
     print(f"Solved (total)        : {solved}")
-    print(f"  - by AC-3 only      : {by_ac3}")
+    print(f"  - by AC-3/propagation: {by_ac3}")
     print(f"  - by Backtracking   : {by_bt}")
+    if by_dlx:
+        print(f"  - by DLX            : {by_dlx}")
+    if by_sat:
+        print(f"  - by SAT (CDCL)     : {by_sat}")
+    if by_cache:
+        print(f"From the cache        : {by_cache}")
     print(f"Unsolvable (AC-3)     : {unsat}")
+    counted = [r for r in results if "solutions" in r]
+    if counted:
+        print(f"Unique solution       : {sum(1 for r in counted if r['solutions'] == 1)}")
+        print(f"Multiple solutions    : {sum(1 for r in counted if r['solutions'] > 1)}")
     print(f"Total runtime (s)     : {total_time:.4f}")
     print(f"Average runtime (s)   : {avg_time:.4f}")
+    with_stats = [r["stats"] for r in results if r.get("stats")]
+    if with_stats:
+        totals = SolverStats.total(SolverStats.from_dict(d) for d in with_stats)
+        print("-------------------------------------------------")
+        print(f"Counters (over {len(with_stats)} puzzle(s), max_* = maximum):")
+        for name, value in totals.as_dict().items():
+            print(f"  {name:<20}: {value}")
     print("-------------------------------------------------")
     print("Per-file results:")
     for r in results:                      # >>> added
-        print(f"  {r['label']:<35} : {r['result_str']:<22} | {r['time_sec']:.4f} s")
+        line = f"  {r['label']:<35} : {r['result_str']:<22} | {r['time_sec']:.4f} s"
+        if "solutions" in r:
+            line += f" | solutions: {r['solutions']}"
+        if r.get("stats"):
+            line += f" | nodes: {r['stats']['nodes']}, checks: {r['stats']['constraint_checks']}"
+        print(line)
     print("=================================================")
 
 
 # ---------- Runner modes ----------
 
-def run_short():
+def run_short(trace_every: int = 1, trace_interval: float = 0.0, solver: str = "csp"):
     print("\n=== SHORT TEST MODE ===")
-    batches = [
-        ("valid", io_utils.get_valid_puzzles()),
-        ("unsolvable", io_utils.get_unsolvable_puzzles()),
-        ("unofficial", io_utils.get_unofficial_puzzles()),
-    ]
     results = []
-    for label, puzzles in batches:
-        if not puzzles:
+    for label in io_utils.CATEGORIES:
+        first = next(io_utils.iter_test_puzzles(label, errors="skip"), None)
+        if first is None:
             print(f"[info] No puzzles in {label}/")
             continue
-        grid = puzzles[0]
+        grid = first[1]
         file_label = f"{label}/example_1"
-        results.append(run_one_puzzle(grid, verbose_queue=True, label=file_label))
+        results.append(run_one_puzzle(grid, verbose_queue=True, label=file_label,
+                                      trace_every=trace_every, trace_interval=trace_interval, solver=solver))
     print_summary(results)
 
 
-def run_full():
+def _all_puzzles() -> Iterator[Tuple[List[List[int]], str]]:
+    # Streamed from the test_puzzles/ folders; a bad file is reported and skipped
+    for category in io_utils.CATEGORIES:
+        for _, grid in io_utils.iter_test_puzzles(category, errors="skip"):
+            yield grid, category
+
+
+def run_full(count_limit: Optional[int] = None, solver: str = "csp"):
     print("\n=== FULL TEST MODE ===")
     results = []
-    all_puzzles = (
-        list((p, "valid") for p in io_utils.get_valid_puzzles())
-        + list((p, "unsolvable") for p in io_utils.get_unsolvable_puzzles())
-        + list((p, "unofficial") for p in io_utils.get_unofficial_puzzles())
-    )
-    for i, (grid, cat) in enumerate(all_puzzles, 1):
+    for i, (grid, cat) in enumerate(_all_puzzles(), 1):
         label = f"{cat}/puzzle_{i}"
-        results.append(run_one_puzzle(grid, verbose_queue=False, label=label))
+        results.append(run_one_puzzle(grid, verbose_queue=False, label=label, count_limit=count_limit,
+                                      solver=solver))
+    print_summary(results)
+
+
+def run_vector():
+    print("\n=== VECTORIZED BATCH MODE ===")
+    import batch_numpy  # NumPy is only needed for this mode
+
+    all_puzzles = list(_all_puzzles())  # one batch, so every grid is in memory anyway
+    t0 = time.perf_counter()
+    solved = batch_numpy.solve_batch([grid for grid, _ in all_puzzles])
+    elapsed = time.perf_counter() - t0
+
+    result_strs = {
+        "propagation": "SOLVED BY PROPAGATION",
+        "backtracking": "SOLVED BY BACKTRACKING",
+        "unsolvable": "UNSOLVABLE",
+        "no solution": "NO SOLUTION",
+    }
+    results = []
+    for i, ((grid, cat), res) in enumerate(zip(all_puzzles, solved), 1):
+        results.append({
+            "label": f"{cat}/puzzle_{i}",
+            "solved": res["grid"] is not None,
+            "time_sec": elapsed / len(all_puzzles),  # batch time split evenly
+            "result_str": result_strs[res["status"]],
+        })
+    print(f"[run] Batch of {len(all_puzzles)} finished. time={elapsed:.4f}s")
+    print_summary(results)
+
+
+def _cached_result(label: str, solution: Optional[List[List[int]]], time_sec: float) -> dict:
+    """Metrics for a puzzle answered by the solution cache (same keys as parallel.solve_grid)"""
+    return {
+        "label": label,
+        "ac3_used": False,
+        "ac3_pops": 0,
+        "ac3_consistent": solution is not None,
+        "bt_used": False,
+        "solved": solution is not None,
+        "time_sec": time_sec,
+        "result_str": "SOLVED FROM CACHE" if solution is not None else "UNSOLVABLE (CACHE)",
+        "solution": solution,
+    }
+
+
+def _solve_cached(items: Iterable[Tuple[str, List[List[int]]]], cache: canon.SolutionCache,
+                  workers: Optional[int], chunksize: int, solver: str = "csp") -> List[dict]:
+    """
+    Answer every puzzle whose canonical form is cached, send one representative of each
+    remaining canonical form to the pool and map its solution onto the equivalent puzzles.
+    Results are in input order.
+    """
+    results: List[Optional[dict]] = []
+    pending: Dict[str, List[Tuple[int, str, canon.Canonical, float]]] = {}
+    to_solve = []
+    for label, grid in items:
+        t0 = time.perf_counter()
+        canonical = canon.canonicalize(grid)
+        if canonical.key not in pending:
+            hit, solution = cache.get(canonical)
+            if hit:
+                results.append(_cached_result(label, solution, time.perf_counter() - t0))
+                continue
+            pending[canonical.key] = []
+            to_solve.append((label, grid))
+        results.append(None)
+        pending[canonical.key].append((len(results) - 1, label, canonical, time.perf_counter() - t0))
+
+    for r, waiting in zip(parallel.solve_many(to_solve, workers=workers, chunksize=chunksize, collect_stats=True,
+                                             solver=solver),
+                          pending.values()):
+        (index, _, canonical, canon_sec), *equivalent = waiting
+        cache.put(canonical, r["solution"] if r["solved"] else None)
+        r["time_sec"] += canon_sec
+        results[index] = r
+        for index, label, canonical, canon_sec in equivalent:
+            t0 = time.perf_counter()
+            _, solution = cache.get(canonical)
+            results[index] = _cached_result(label, solution, canon_sec + time.perf_counter() - t0)
+    return results
+
+
+def run_batch(path: str, workers: Optional[int], chunksize: int, ordered: bool, count_limit: Optional[int] = None,
+              cache: Optional[canon.SolutionCache] = None, solver: str = "csp"):
+    print("\n=== BATCH MODE ===")
+    items = io_utils.iter_puzzles(path)
+    print(f"[INFO] Streaming puzzles from {path}")
+    t0 = time.perf_counter()
+    if cache is not None and count_limit is None:
+        # Results are put back in input order, so ordered has no effect here
+        results = _solve_cached(items, cache, workers, chunksize, solver)
+    else:
+        results = list(parallel.solve_many(items, workers=workers, chunksize=chunksize, ordered=ordered,
+                                            count_limit=count_limit, collect_stats=True, solver=solver))
+    elapsed = time.perf_counter() - t0
+    print(f"[run] Batch finished. wall time={elapsed:.4f}s")
+    if cache is not None:
+        print(f"[run] {cache}")
     print_summary(results)
 
 
-def run_manual():
+def run_manual(trace_every: int = 1, trace_interval: float = 0.0, solver: str = "csp"):
     print("\n=== MANUAL MODE ===")
     grid = io_utils.manual_input()
-    results = [run_one_puzzle(grid, verbose_queue=True, label="manual_input")]
+    results = [run_one_puzzle(grid, verbose_queue=True, label="manual_input",
+                              trace_every=trace_every, trace_interval=trace_interval, solver=solver)]
     print_summary(results)
 
 
@@ -214,15 +362,46 @@ def run_manual():
 
 def main():
     parser = argparse.ArgumentParser(description="CP468 Sudoku CSP Demo Runner")
-    parser.add_argument("--mode", choices=["short", "full", "manual"], default="short")
+    parser.add_argument("--mode", choices=["short", "full", "manual", "vector", "batch"], default="short")
+    parser.add_argument("--engine", choices=parallel.SOLVERS, default="csp",
+                        help="csp: AC-3 + backtracking, dlx: exact cover search with dancing links, "
+                             "sat: CDCL on a CNF encoding (not in vector mode)")
+    parser.add_argument("--path", default=str(io_utils._puzzle_dir() / "valid"),
+                        help="batch mode: directory or multi-puzzle file")
+    parser.add_argument("--workers", type=int, default=None, help="batch mode: worker processes (default: all cores)")
+    parser.add_argument("--chunksize", type=int, default=16, help="batch mode: puzzles per dispatch")
+    parser.add_argument("--unordered", action="store_true", help="batch mode: collect results as they finish")
+    parser.add_argument("--count-limit", type=int, default=None, metavar="N",
+                        help="full/batch mode: count solutions up to N per puzzle (2 = uniqueness check)")
+    parser.add_argument("--trace-every", type=int, default=1, metavar="N",
+                        help="short/manual mode: print every N-th AC-3 queue step")
+    parser.add_argument("--trace-interval", type=float, default=0.0, metavar="SEC",
+                        help="short/manual mode: print at most one AC-3 queue step per SEC seconds")
+    parser.add_argument("--cache", action="store_true",
+                        help="batch mode: answer puzzles equivalent to an earlier one from a solution cache")
+    parser.add_argument("--cache-file", help="batch mode: keep the solution cache in this JSON file (implies --cache)")
+    parser.add_argument("--cache-size", type=int, default=4096, help="batch mode: most puzzles kept in the cache")
     args = parser.parse_args()
+    if args.trace_every < 1:
+        parser.error("--trace-every must be at least 1")
+    if args.count_limit is not None and args.count_limit < 1:
+        parser.error("--count-limit must be at least 1")
+    if args.cache_size < 1:
+        parser.error("--cache-size must be at least 1")
 
     if args.mode == "short":
-        run_short()
+        run_short(args.trace_every, args.trace_interval, args.engine)
     elif args.mode == "full":
-        run_full()
+        run_full(args.count_limit, args.engine)
     elif args.mode == "manual":
-        run_manual()
+        run_manual(args.trace_every, args.trace_interval, args.engine)
+    elif args.mode == "vector":
+        run_vector()
+    elif args.mode == "batch":
+        cache = canon.SolutionCache(args.cache_size, args.cache_file) if args.cache or args.cache_file else None
+        run_batch(args.path, args.workers, args.chunksize, not args.unordered, args.count_limit, cache, args.engine)
+        if args.cache_file:
+            cache.save()
 
 
 if __name__ == "__main__":
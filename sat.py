@@ -0,0 +1,437 @@
+"""
+CP468 — sat.py
+Sudoku as CNF, solved by a built-in CDCL SAT solver, with DIMACS export.
+
+Encoding (n x n grid, box^2 = n): variable (r * n + c) * n + d is "cell (r, c) holds d"
+(d = 1..n, so variables run 1..n^3, DIMACS style). Clauses:
+    - every cell holds at least one digit, and at most one (pairwise)
+    - every row, column and box holds every digit at least once, and at most once (pairwise)
+    - one unit clause per given
+write_dimacs(path, grid) writes exactly these clauses, so an external solver's verdict /
+model can be checked against ours.
+
+CDCLSolver is a MiniSat-style conflict-driven clause learning solver:
+    - two watched literals per clause; a clause is only visited when one of its
+      watches becomes false
+    - first-UIP conflict analysis with local minimization; the learnt clause sends the
+      search back to its second-highest level (non-chronological backjump)
+    - VSIDS: variables in learnt clauses get their activity bumped, the bump grows
+      geometrically (same as decaying the rest), decisions take the most active variable
+    - phase saving, Luby restarts (backtracking.luby) every restart_base x luby(i)
+      conflicts, and learnt clauses beyond a growing limit are dropped by LBD at restarts
+Literals are DIMACS ints outside the solver and 2 * var (+1 if negated) inside it.
+With stats, the search adds to nodes (decisions), backtracks (conflicts), backjumps
+(conflicts that skipped a level), nogoods (clauses learnt), restarts and max_depth
+(deepest decision level).
+
+Functions / classes:
+    - encode(grid) -> (n_vars, clauses)
+    - to_dimacs(n_vars, clauses, comment) -> str, write_dimacs(path, grid)
+    - CDCLSolver(n_vars): add_clause(lits), solve(stats) -> bool, model
+    - SudokuSAT(grid): consistent, solutions(stats), count(limit, on_solution, stats)
+    - solve(grid, stats) -> Optional[Grid]
+    - count_solutions(grid, limit, on_solution, stats) -> int
+"""
+
+from __future__ import annotations
+import heapq
+import math
+from itertools import combinations
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from backtracking import luby
+
+if TYPE_CHECKING:
+    from metrics import SolverStats
+
+Grid = List[List[int]]
+Clause = List[int]
+
+RESTART_BASE = 100        # conflicts per Luby unit
+VAR_DECAY = 0.95          # VSIDS: the bump grows by 1 / VAR_DECAY per conflict
+MAX_LEARNTS = 2000        # learnt clauses kept before the first reduction
+LEARNT_GROWTH = 1.1       # the limit grows by this factor at every reduction
+
+
+def encode(grid: Grid) -> Tuple[int, List[Clause]]:
+    """(number of variables, clauses) of the grid's CNF encoding (see module docstring)"""
+    size = len(grid)
+    box = math.isqrt(size)
+    if size == 0 or box * box != size or any(len(row) != size for row in grid):
+        raise ValueError(f"Grid must be n x n with n a perfect square, got {size} rows.")
+
+    def var(r: int, c: int, d: int) -> int:
+        return (r * size + c) * size + d
+
+    units = [[(r, c) for c in range(size)] for r in range(size)]
+    units += [[(r, c) for r in range(size)] for c in range(size)]
+    units += [[(br + i, bc + j) for i in range(box) for j in range(box)]
+              for br in range(0, size, box) for bc in range(0, size, box)]
+
+    clauses: List[Clause] = []
+    for r in range(size):
+        for c in range(size):
+            v = grid[r][c]
+            if not 0 <= v <= size:
+                raise ValueError(f"Value {v} at ({r}, {c}) is out of range for a {size}x{size} grid.")
+            if v:
+                clauses.append([var(r, c, v)])
+    for r in range(size):
+        for c in range(size):
+            cell = [var(r, c, d) for d in range(1, size + 1)]
+            clauses.append(cell)
+            clauses.extend([-a, -b] for a, b in combinations(cell, 2))
+    for unit in units:
+        for d in range(1, size + 1):
+            lits = [var(r, c, d) for r, c in unit]
+            clauses.append(lits)
+            clauses.extend([-a, -b] for a, b in combinations(lits, 2))
+    return size ** 3, clauses
+
+
+def to_dimacs(n_vars: int, clauses: Sequence[Clause], comment: str = "") -> str:
+    """CNF in DIMACS format ("p cnf <vars> <clauses>", one 0-terminated clause per line)"""
+    lines = [f"c {line}" for line in comment.splitlines()]
+    lines.append(f"p cnf {n_vars} {len(clauses)}")
+    lines.extend(" ".join(map(str, clause)) + " 0" for clause in clauses)
+    return "\n".join(lines) + "\n"
+
+
+def write_dimacs(path: str, grid: Grid) -> None:
+    """Write the grid's CNF encoding to path in DIMACS format"""
+    n_vars, clauses = encode(grid)
+    size = len(grid)
+    comment = (f"CP468 Sudoku {size}x{size}: variable (r * {size} + c) * {size} + d "
+               f"means cell (r, c) holds d (r, c from 0, d from 1)")
+    with open(path, "w") as f:
+        f.write(to_dimacs(n_vars, clauses, comment))
+
+
+class CDCLSolver:
+    """
+    CDCL solver over variables 1..n_vars (see module docstring). Clauses can be added
+    between solve() calls (e.g. to block a model), so solving is incremental.
+    ok turns False once the clauses are known to be unsatisfiable.
+    """
+
+    def __init__(self, n_vars: int, restart_base: int = RESTART_BASE) -> None:
+        n = n_vars + 1
+        self.n_vars = n_vars
+        self.restart_base = restart_base
+        self.ok = True
+        self.val = [0] * (2 * n)              # per literal: 1 true, -1 false, 0 unassigned
+        self.level = [0] * n
+        self.reason: List[Optional[Clause]] = [None] * n
+        self.phase = [False] * n              # last value of each variable (phase saving)
+        self.activity = [0.0] * n
+        self.var_inc = 1.0
+        self.heap = [(0.0, v) for v in range(1, n)]
+        self.watches: List[List[Clause]] = [[] for _ in range(2 * n)]
+        self.trail: List[int] = []
+        self.trail_lim: List[int] = []        # trail length at the start of each decision level
+        self.qhead = 0
+        self.learnts: List[Tuple[int, Clause]] = []  # (LBD, clause)
+        self.max_learnts = MAX_LEARNTS
+        self.seen = [False] * n
+        self.model: List[bool] = []
+
+    # ---------- Clauses ----------
+
+    def add_clause(self, lits: Iterable[int]) -> bool:
+        """
+        Add a clause of DIMACS literals (at decision level 0). Literals already false at
+        level 0 are dropped and satisfied clauses are skipped. Returns self.ok.
+        """
+        if not self.ok:
+            return False
+        self._cancel_until(0)
+        val = self.val
+        clause: Clause = []
+        for lit in set(lits):
+            p = 2 * lit if lit > 0 else -2 * lit + 1
+            if val[p] == 1 or p ^ 1 in clause:
+                return True
+            if val[p] == 0:
+                clause.append(p)
+        if not clause:
+            self.ok = False
+        elif len(clause) == 1:
+            self._enqueue(clause[0], None)
+            self.ok = self._propagate() is None
+        else:
+            self.watches[clause[0]].append(clause)
+            self.watches[clause[1]].append(clause)
+        return self.ok
+
+    # ---------- Assignment ----------
+
+    def _enqueue(self, p: int, reason: Optional[Clause]) -> None:
+        v = p >> 1
+        self.val[p] = 1
+        self.val[p ^ 1] = -1
+        self.level[v] = len(self.trail_lim)
+        self.reason[v] = reason
+        self.trail.append(p)
+
+    def _cancel_until(self, level: int) -> None:
+        if len(self.trail_lim) <= level:
+            return
+        val, phase, activity, heap = self.val, self.phase, self.activity, self.heap
+        start = self.trail_lim[level]
+        for p in self.trail[start:]:
+            v = p >> 1
+            val[p] = val[p ^ 1] = 0
+            phase[v] = not p & 1
+            heapq.heappush(heap, (-activity[v], v))
+        del self.trail[start:]
+        del self.trail_lim[level:]
+        self.qhead = len(self.trail)
+
+    def _propagate(self) -> Optional[Clause]:
+        """Unit propagation over the watch lists; returns a conflicting clause or None"""
+        val, watches, trail = self.val, self.watches, self.trail
+        while self.qhead < len(trail):
+            false_lit = trail[self.qhead] ^ 1
+            self.qhead += 1
+            ws = watches[false_lit]
+            i = j = 0
+            n = len(ws)
+            while i < n:
+                c = ws[i]
+                i += 1
+                if not c:
+                    continue  # deleted learnt clause: drop the watch
+                if c[0] == false_lit:
+                    c[0], c[1] = c[1], false_lit
+                first = c[0]
+                if val[first] == 1:
+                    ws[j] = c
+                    j += 1
+                    continue
+                for k in range(2, len(c)):
+                    if val[c[k]] != -1:
+                        c[1], c[k] = c[k], false_lit
+                        watches[c[1]].append(c)
+                        break
+                else:
+                    ws[j] = c
+                    j += 1
+                    if val[first] == -1:
+                        while i < n:
+                            ws[j] = ws[i]
+                            j += 1
+                            i += 1
+                        del ws[j:]
+                        self.qhead = len(trail)
+                        return c
+                    self._enqueue(first, c)
+            del ws[j:]
+        return None
+
+    # ---------- Conflict analysis ----------
+
+    def _bump(self, v: int) -> None:
+        self.activity[v] += self.var_inc
+        if self.activity[v] > 1e100:
+            activity = self.activity
+            for u in range(1, len(activity)):
+                activity[u] *= 1e-100
+            self.var_inc *= 1e-100
+            self.heap = [(-activity[u], u) for u in range(1, len(activity)) if not self.val[2 * u]]
+            heapq.heapify(self.heap)
+
+    def _analyze(self, conflict: Clause) -> Tuple[Clause, int, int]:
+        """First-UIP learnt clause (asserting literal first), backjump level and LBD"""
+        seen, level, reason, trail = self.seen, self.level, self.reason, self.trail
+        current = len(self.trail_lim)
+        learnt: Clause = [0]
+        touched: List[int] = []
+        pending = 0
+        p = -1
+        idx = len(trail) - 1
+        c = conflict
+        while True:
+            for q in (c if p < 0 else c[1:]):
+                v = q >> 1
+                if not seen[v] and level[v] > 0:
+                    seen[v] = True
+                    touched.append(v)
+                    self._bump(v)
+                    if level[v] == current:
+                        pending += 1
+                    else:
+                        learnt.append(q)
+            while not seen[trail[idx] >> 1]:
+                idx -= 1
+            p = trail[idx]
+            idx -= 1
+            c = reason[p >> 1]
+            seen[p >> 1] = False  # resolved away: only the clause's own variables stay marked
+            pending -= 1
+            if pending == 0:
+                break
+        learnt[0] = p ^ 1
+
+        # Local minimization: drop literals implied by the other literals of the clause
+        kept = [learnt[0]]
+        for q in learnt[1:]:
+            r = reason[q >> 1]
+            if r is None or not all(seen[x >> 1] or level[x >> 1] == 0 for x in r[1:]):
+                kept.append(q)
+        for v in touched:
+            seen[v] = False
+
+        if len(kept) == 1:
+            return kept, 0, 1
+        # Watch the highest-level remaining literal second; that level is the backjump target
+        best = max(range(1, len(kept)), key=lambda k: level[kept[k] >> 1])
+        kept[1], kept[best] = kept[best], kept[1]
+        lbd = len({level[q >> 1] for q in kept})
+        return kept, level[kept[1] >> 1], lbd
+
+    def _reduce_learnts(self) -> None:
+        """Delete the worse half of the learnt clauses (by LBD, then length); glue clauses stay"""
+        self.learnts.sort(key=lambda e: (e[0], len(e[1])))
+        keep = len(self.learnts) // 2
+        for lbd, c in self.learnts[keep:]:
+            v = c[0] >> 1
+            if lbd > 2 and self.reason[v] is not c:
+                c.clear()  # watches of an empty clause are dropped lazily
+        self.learnts = [e for e in self.learnts if e[1]]
+        self.max_learnts = int(self.max_learnts * LEARNT_GROWTH)
+
+    # ---------- Search ----------
+
+    def _pick_branch(self) -> int:
+        heap, val = self.heap, self.val
+        while heap:
+            _, v = heapq.heappop(heap)
+            if not val[2 * v]:
+                return 2 * v if self.phase[v] else 2 * v + 1
+        return -1
+
+    def solve(self, stats: Optional["SolverStats"] = None) -> bool:
+        """Search for a model; returns True (self.model is set) or False (unsatisfiable)"""
+        if not self.ok:
+            return False
+        self._cancel_until(0)
+        if self._propagate() is not None:
+            self.ok = False
+            return False
+
+        restart = 1
+        budget = self.restart_base * luby(restart)
+        conflicts = 0
+        while True:
+            conflict = self._propagate()
+            if conflict is not None:
+                conflicts += 1
+                level = len(self.trail_lim)
+                if level == 0:
+                    self.ok = False
+                    return False
+                learnt, back_level, lbd = self._analyze(conflict)
+                if stats is not None:
+                    stats.backtracks += 1
+                    stats.nogoods += 1
+                    if back_level < level - 1:
+                        stats.backjumps += 1
+                self._cancel_until(back_level)
+                if len(learnt) == 1:
+                    self._enqueue(learnt[0], None)
+                else:
+                    self.watches[learnt[0]].append(learnt)
+                    self.watches[learnt[1]].append(learnt)
+                    self.learnts.append((lbd, learnt))
+                    self._enqueue(learnt[0], learnt)
+                self.var_inc /= VAR_DECAY
+                continue
+
+            if conflicts >= budget:
+                self._cancel_until(0)
+                restart += 1
+                budget = self.restart_base * luby(restart)
+                conflicts = 0
+                if stats is not None:
+                    stats.restarts += 1
+                if len(self.learnts) > self.max_learnts:
+                    self._reduce_learnts()
+                if len(self.heap) > 4 * self.n_vars:
+                    self.heap = [(-self.activity[v], v) for v in range(1, self.n_vars + 1) if not self.val[2 * v]]
+                    heapq.heapify(self.heap)
+                continue
+
+            p = self._pick_branch()
+            if p < 0:
+                self.model = [False] + [self.val[2 * v] == 1 for v in range(1, self.n_vars + 1)]
+                return True
+            self.trail_lim.append(len(self.trail))
+            self._enqueue(p, None)
+            if stats is not None:
+                stats.nodes += 1
+                if len(self.trail_lim) > stats.max_depth:
+                    stats.max_depth = len(self.trail_lim)
+
+
+class SudokuSAT:
+    """
+    A Sudoku grid (0 = empty) as a CDCLSolver over its CNF encoding. consistent is False
+    when unit propagation of the givens alone already fails. Solutions are enumerated
+    by blocking each model found, so the solver keeps what it learnt between them.
+    """
+
+    __slots__ = ("grid", "size", "solver", "consistent")
+
+    def __init__(self, grid: Grid) -> None:
+        n_vars, clauses = encode(grid)
+        self.grid = grid
+        self.size = len(grid)
+        self.solver = CDCLSolver(n_vars)
+        for clause in clauses:
+            if not self.solver.add_clause(clause):
+                break
+        self.consistent = self.solver.ok
+
+    def to_grid(self, model: Sequence[bool]) -> Grid:
+        size = self.size
+        out = [[0] * size for _ in range(size)]
+        for r in range(size):
+            for c in range(size):
+                base = (r * size + c) * size
+                out[r][c] = next(d for d in range(1, size + 1) if model[base + d])
+        return out
+
+    def solutions(self, stats: Optional["SolverStats"] = None) -> Iterator[Grid]:
+        """Yield every solution grid"""
+        size = self.size
+        while self.solver.solve(stats):
+            grid = self.to_grid(self.solver.model)
+            yield grid
+            # Block this solution: some empty cell must take a different digit
+            block = [-((r * size + c) * size + grid[r][c])
+                     for r in range(size) for c in range(size) if not self.grid[r][c]]
+            if not self.solver.add_clause(block):
+                return
+
+    def count(self, limit: Optional[int] = None, on_solution: Optional[Callable[[Grid], None]] = None,
+              stats: Optional["SolverStats"] = None) -> int:
+        """Count solutions, stopping at limit; on_solution gets every solution found"""
+        n = 0
+        for solution in self.solutions(stats):
+            n += 1
+            if on_solution is not None:
+                on_solution(solution)
+            if n == limit:
+                break
+        return n
+
+
+def solve(grid: Grid, stats: Optional["SolverStats"] = None) -> Optional[Grid]:
+    """First solution of grid, or None if it has none"""
+    return next(SudokuSAT(grid).solutions(stats), None)
+
+
+def count_solutions(grid: Grid, limit: Optional[int] = None, on_solution: Optional[Callable[[Grid], None]] = None,
+                    stats: Optional["SolverStats"] = None) -> int:
+    """Number of solutions of grid, up to limit (see SudokuSAT.count)"""
+    return SudokuSAT(grid).count(limit, on_solution, stats)
@@ -0,0 +1,420 @@
+"""
+CP468 — server.py
+Local solve service: newline-delimited JSON over TCP or a Unix socket.
+
+One request per line, one response per line (matched by "id"; a connection may
+send several requests without waiting, answers come back as they finish):
+    {"id": 1, "puzzle": "530070000\\n600195000\\n..."}     read_puzzle text format
+    {"id": 2, "puzzle": "...", "count": 2, "timeout": 5}   uniqueness check, own timeout
+    {"id": 3, "op": "stats"}                              counters and latency percentiles
+    {"id": 4, "op": "ping"}
+Responses carry "status": solved / unsolvable / no solution / timeout / busy / error,
+plus "solution", "solutions" (with count), "method", "solve_sec" and "latency_ms".
+
+Work runs on `workers` worker processes that are warmed up at start (modules
+imported, 9x9 topology built), so a request only pays for the solve. At most
+workers + queue_size requests are in the system (solving or waiting for a worker);
+beyond that the server answers "busy" at once. A request that is not answered within
+its timeout gets "timeout"; if its solve was already running, that worker process is
+killed and replaced by a fresh warm one, so a runaway solve cannot hold a worker
+(the same happens to a worker process that crashed; a replacement that fails to
+start is logged and retried).
+"count" is capped at MAX_COUNT.
+
+Usage:
+    python server.py [--port 8765 | --unix /tmp/sudoku.sock] [--workers 4] [--queue-size 64] [--timeout 10]
+    python server.py --send test_puzzles/valid/difficult1.txt [--port 8765 | --unix ...]
+    python server.py --send-stats [--port 8765 | --unix ...]
+"""
+
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import signal
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Deque, Dict, Optional
+
+from metrics import percentile
+from topology import get_topology
+import ac3
+import alldiff
+import io_utils
+import parallel
+
+DEFAULT_PORT = 8765
+
+# Latencies kept for the percentiles (most recent requests)
+LATENCY_HISTORY = 10_000
+
+# Longest request line accepted (a 25x25 puzzle is well under this)
+MAX_LINE = 1 << 20
+
+# Largest "count" a request may ask for
+MAX_COUNT = 1000
+
+# Seconds between attempts to start a replacement worker that failed to come up
+RESTART_RETRY_SEC = 1.0
+
+
+def _warm_up() -> None:
+    """Pool initializer: build the 9x9 topology once per worker process"""
+    get_topology(3)
+
+
+def _ready() -> int:
+    return os.getpid()
+
+
+class _Worker:
+    """One warm worker process (a single-process pool) that can be killed mid-solve and replaced"""
+
+    def __init__(self) -> None:
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.pid: Optional[int] = None
+
+    async def start(self) -> None:
+        self.pool = ProcessPoolExecutor(max_workers=1, initializer=_warm_up)
+        self.pid = await asyncio.get_running_loop().run_in_executor(self.pool, _ready)
+
+    def kill(self) -> None:
+        """Terminate the process at once, whatever it is running"""
+        if self.pid is not None:
+            try:
+                os.kill(self.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+            self.pid = None
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+
+class SolveServer:
+    """
+    asyncio front end: connections put admitted requests on a queue, and one
+    dispatcher task per worker process hands them over one at a time.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        queue_size: int = 64,
+        timeout: float = 10.0,
+        engine: str = "ac3",
+        propagation: str = "ac3",
+    ) -> None:
+        if queue_size < 1:
+            raise ValueError("queue_size must be at least 1.")
+        if timeout <= 0:
+            raise ValueError("timeout must be positive.")
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.engine = engine
+        self.propagation = propagation
+        self._workers = [_Worker() for _ in range(self.workers)]
+        self.queue: Optional[asyncio.Queue] = None
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.unix_path: Optional[str] = None
+        self._dispatchers = []
+        self.admitted = 0  # requests solving or waiting, released by the dispatcher
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_HISTORY)
+        self.counts: Dict[str, int] = {}
+        self.recycled = 0  # workers killed because their request timed out (or replaced after a crash)
+        self.restart_failures = 0  # replacement workers that failed to start and were retried
+
+    async def start(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT,
+                    unix_path: Optional[str] = None) -> asyncio.AbstractServer:
+        """Warm the workers up and start listening (on unix_path if given, else host:port)"""
+        # Every process is started before the first request
+        await asyncio.gather(*(worker.start() for worker in self._workers))
+        self.queue = asyncio.Queue()  # bounded by the admission check in _respond
+        self._dispatchers = [asyncio.create_task(self._dispatch(worker)) for worker in self._workers]
+        if unix_path:
+            self.unix_path = unix_path
+            self.server = await asyncio.start_unix_server(self._handle, path=unix_path, limit=MAX_LINE)
+        else:
+            self.server = await asyncio.start_server(self._handle, host, port, limit=MAX_LINE)
+        return self.server
+
+    async def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.unix_path and os.path.exists(self.unix_path):
+            os.unlink(self.unix_path)
+        for task in self._dispatchers:
+            task.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+        # Killed rather than joined, so a solve still running cannot keep close() waiting
+        for worker in self._workers:
+            worker.kill()
+
+    # ---------- Request handling ----------
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        lock = asyncio.Lock()
+        tasks = set()
+
+        async def answer(line: bytes) -> None:
+            response = await self._respond(line)
+            async with lock:
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:  # line longer than MAX_LINE
+                    async with lock:
+                        writer.write(json.dumps({"status": "error", "error": "request too long"}).encode() + b"\n")
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.create_task(answer(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            writer.close()
+
+    async def _respond(self, line: bytes) -> dict:
+        t0 = time.perf_counter()
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+        except ValueError as e:
+            return self._count({"status": "error", "error": f"bad request: {e}"})
+        response = {"id": request.get("id")}
+
+        op = request.get("op", "solve")
+        if op == "ping":
+            return {**response, "status": "ok"}
+        if op == "stats":
+            return {**response, "status": "ok", "stats": self.stats()}
+        if op != "solve":
+            return self._count({**response, "status": "error", "error": f"unknown op {op!r}"})
+
+        try:
+            grid = self._parse(request)
+            count = request.get("count")
+            if count is not None and (not isinstance(count, int) or not 1 <= count <= MAX_COUNT):
+                raise ValueError(f"count must be an integer from 1 to {MAX_COUNT}")
+            timeout = float(request.get("timeout", self.timeout))
+            if timeout <= 0:
+                raise ValueError("timeout must be positive")
+        except (ValueError, TypeError) as e:
+            return self._count({**response, "status": "error", "error": str(e)})
+
+        if self.admitted >= self.workers + self.queue_size:
+            return self._count({**response, "status": "busy", "error": "queue full, retry later"})
+        self.admitted += 1
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((str(request.get("id", "")), grid, count, future))
+
+        try:
+            metrics = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.latencies.append(time.perf_counter() - t0)
+            return self._count({**response, "status": "timeout"})
+        except Exception as e:  # raised in the worker
+            return self._count({**response, "status": "error", "error": str(e)})
+
+        latency = time.perf_counter() - t0
+        self.latencies.append(latency)
+        if not metrics["ac3_consistent"]:
+            status = "unsolvable"
+        else:
+            status = "solved" if metrics["solved"] else "no solution"
+        response.update({
+            "status": status,
+            "method": metrics["result_str"],
+            "solution": metrics["solution"],
+            "solve_sec": metrics["time_sec"],
+            "latency_ms": latency * 1e3,
+        })
+        if count is not None:
+            response["solutions"] = metrics["solutions"]
+        return self._count(response)
+
+    @staticmethod
+    def _parse(request: dict):
+        if "grid" in request:
+            grid = request["grid"]
+            if not isinstance(grid, list) or not all(isinstance(row, list) for row in grid):
+                raise ValueError("grid must be a list of rows")
+            return io_utils.parse_puzzle("\n".join(" ".join(str(v) for v in row) for row in grid))
+        puzzle = request.get("puzzle")
+        if not isinstance(puzzle, str):
+            raise ValueError("request needs a 'puzzle' string (read_puzzle format) or a 'grid'")
+        return io_utils.parse_puzzle(puzzle)
+
+    async def _dispatch(self, worker: _Worker) -> None:
+        """Feed queued requests to one worker, one at a time"""
+        loop = asyncio.get_running_loop()
+        while True:
+            label, grid, count, future = await self.queue.get()
+            try:
+                if future.done():  # timed out while waiting in the queue
+                    continue
+                work = loop.run_in_executor(worker.pool, parallel.solve_grid, label, grid,
+                                            self.engine, self.propagation, count)
+                # future is cancelled by wait_for in _respond when the request times out
+                try:
+                    await asyncio.wait((work, future), return_when=asyncio.FIRST_COMPLETED)
+                except asyncio.CancelledError:
+                    work.cancel()  # close(): the worker gets killed there
+                    raise
+                if not work.done():
+                    work.cancel()
+                    await self._replace(worker)
+                    continue
+                try:
+                    metrics = work.result()
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                    if isinstance(e, BrokenProcessPool):  # the process died on its own
+                        await self._replace(worker)
+                else:
+                    if not future.done():
+                        future.set_result(metrics)
+            finally:
+                self.admitted -= 1
+                self.queue.task_done()
+
+    async def _replace(self, worker: _Worker) -> None:
+        """
+        Kill the worker's process and start a fresh warm one. A failed start is logged
+        and retried: the dispatcher must not die, or the server would quietly run one
+        worker short. Meanwhile the other dispatchers keep serving the queue, and
+        requests that wait too long get their "timeout" as usual.
+        """
+        worker.kill()
+        self.recycled += 1
+        while True:
+            try:
+                await worker.start()
+                return
+            except Exception as e:
+                worker.kill()
+                self.restart_failures += 1
+                print(f"[WARN] could not start a replacement worker ({e!r}); retrying in {RESTART_RETRY_SEC} s")
+                await asyncio.sleep(RESTART_RETRY_SEC)
+
+    # ---------- Statistics ----------
+
+    def _count(self, response: dict) -> dict:
+        status = response["status"]
+        self.counts[status] = self.counts.get(status, 0) + 1
+        return response
+
+    def stats(self) -> dict:
+        lat = list(self.latencies)
+        latency = {}
+        if lat:
+            latency = {
+                "p50": percentile(lat, 50) * 1e3,
+                "p90": percentile(lat, 90) * 1e3,
+                "p99": percentile(lat, 99) * 1e3,
+                "max": max(lat) * 1e3,
+            }
+        return {
+            "requests": sum(self.counts.values()),
+            "by_status": dict(self.counts),
+            "in_flight": self.admitted,
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "queue_size": self.queue_size,
+            "workers": self.workers,
+            "workers_recycled": self.recycled,
+            "worker_restart_failures": self.restart_failures,
+            "latency_ms": latency,
+        }
+
+
+# ---------- Client ----------
+
+async def query(payload: dict, host: str = "127.0.0.1", port: int = DEFAULT_PORT,
+                unix_path: Optional[str] = None) -> dict:
+    """Send one request and wait for its response (for scripts and local testing)"""
+    if unix_path:
+        reader, writer = await asyncio.open_unix_connection(unix_path, limit=MAX_LINE)
+    else:
+        reader, writer = await asyncio.open_connection(host, port, limit=MAX_LINE)
+    try:
+        writer.write(json.dumps(payload).encode() + b"\n")
+        await writer.drain()
+        return json.loads(await reader.readline())
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def serve(args) -> None:
+    server = SolveServer(args.workers, args.queue_size, args.timeout, args.ac3_engine, args.propagation)
+    await server.start(args.host, args.port, args.unix)
+    where = args.unix or f"{args.host}:{args.port}"
+    print(f"[INFO] Listening on {where} with {server.workers} warm worker(s), queue size {args.queue_size}")
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows: Ctrl+C still raises KeyboardInterrupt
+            pass
+    try:
+        await stop.wait()
+    finally:
+        print(f"\n[INFO] {json.dumps(server.stats())}")
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sudoku CSP solve service (newline-delimited JSON)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", help="listen on / connect to this Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--queue-size", type=int, default=64, help="requests allowed to wait for a worker")
+    parser.add_argument("--timeout", type=float, default=10.0, help="default per-request timeout in seconds")
+    parser.add_argument("--ac3-engine", choices=ac3.ENGINES, default="ac3")
+    parser.add_argument("--propagation", choices=alldiff.STRENGTHS, default="ac3")
+    parser.add_argument("--send", metavar="PUZZLE", help="client: solve this puzzle file on a running server")
+    parser.add_argument("--count", type=int, default=None, help="client: count solutions up to N")
+    parser.add_argument("--send-stats", action="store_true", help="client: print the server's statistics")
+    args = parser.parse_args()
+
+    if args.send or args.send_stats:
+        if args.send:
+            with open(args.send) as f:
+                payload = {"id": args.send, "puzzle": f.read()}
+            if args.count is not None:
+                payload["count"] = args.count
+        else:
+            payload = {"op": "stats"}
+        response = asyncio.run(query(payload, args.host, args.port, args.unix))
+        if response.get("solution"):
+            io_utils.print_grid(response.pop("solution"))
+        print(json.dumps(response, indent=2))
+        return
+
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -10,95 +10,146 @@ Contributors:
 """
 
 from __future__ import annotations
-from typing import Callable, Dict, Iterable, List, Set, Tuple
+import math
+from functools import lru_cache
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+import bitset
 import constraints
+from topology import Topology, get_topology
 
-Var = Tuple[int, int]  # (row, col), 0-based
-Value = int            # 1..9
+Var = int              # cell index r * size + c, 0-based
+Value = int            # 1..size (size = box * box, 9 for a classic board)
+Domain = int           # bitmask, bit (v - 1) set iff v is a candidate
 
 
 
 class CSP:
-    """CSP object for Sudoku"""
+    """
+    CSP object for Sudoku.
+    The board structure (variables, neighbors, arcs) lives in a shared Topology;
+    each instance only owns its mutable domains.
+    constraint is a plain check(xi, vi, xj, vj) or a constraints.Constraint whose kind
+    lets the engines skip calling it (see constraints.kind_of).
+    """
+
+    __slots__ = ("topology", "domains", "constraint")
 
     def __init__(
         self,
-        variables: List[Var],
-        domains: Dict[Var, Set[Value]],
-        neighbors: Dict[Var, Set[Var]],
-        constraint: Callable[[Var, Value, Var, Value], bool],
+        topology: Topology,
+        domains: List[Domain],
+        constraint: Callable[[Var, Value, Var, Value], bool] = constraints.NOT_EQUAL,
     ) -> None:
-        self.variables = variables
+        self.topology = topology
         self.domains = domains
-        self.neighbors = neighbors
         self.constraint = constraint
 
+    @property
+    def variables(self) -> range:
+        return self.topology.cells
+
+    @property
+    def neighbors(self) -> Sequence[Tuple[Var, ...]]:
+        return self.topology.peers
+
     def all_arcs(self) -> Iterable[Tuple[Var, Var]]:
-        for xi in self.variables:
-            for xj in self.neighbors.get(xi, ()):
-                yield (xi, xj)
+        return zip(self.topology.arc_src, self.topology.arc_dst)
+
+    def copy(self) -> "CSP":
+        """New CSP sharing the topology, with its own copy of the domains"""
+        return CSP(self.topology, list(self.domains), self.constraint)
 
     def is_solved(self) -> bool:
         for v in self.variables:
-            if len(self.domains.get(v, ())) != 1:
+            if not bitset.is_singleton(self.domains[v]):
                 return False
+        kind = constraints.kind_of(self.constraint)
+        if kind == constraints.ALLDIFF:
+            # Singleton masks: a scope is all-different iff no two of them share a bit
+            domains = self.domains
+            for scope in self.constraint.scopes:
+                seen = 0
+                for v in scope:
+                    if seen & domains[v]:
+                        return False
+                    seen |= domains[v]
+            return True
+        if kind == constraints.NEQ:
+            domains = self.domains
+            return all(domains[xi] != domains[xj] for xi in self.variables for xj in self.neighbors[xi] if xi < xj)
         for xi in self.variables:
-            vi = next(iter(self.domains[xi]))
-            for xj in self.neighbors.get(xi, ()):
+            vi = bitset.lowest_value(self.domains[xi])
+            for xj in self.neighbors[xi]:
                 if xi < xj:
-                    vj = next(iter(self.domains[xj]))
+                    vj = bitset.lowest_value(self.domains[xj])
                     if not self.constraint(xi, vi, xj, vj):
                         return False
         return True
 
     def to_grid(self) -> List[List[int]]:
-        """Return a 9x9 grid of ints; 0 for unsolved cells"""
-        grid: List[List[int]] = [[0 for _ in range(9)] for _ in range(9)]
-        for (r, c) in self.variables:
-            d = self.domains.get((r, c), set())
-            grid[r][c] = next(iter(d)) if len(d) == 1 else 0
+        """Return a size x size grid of ints; 0 for unsolved cells"""
+        size = self.topology.size
+        grid: List[List[int]] = [[0 for _ in range(size)] for _ in range(size)]
+        for v, (r, c) in enumerate(self.topology.coords):
+            d = self.domains[v]
+            grid[r][c] = bitset.lowest_value(d) if bitset.is_singleton(d) else 0
         return grid
 
     def __repr__(self) -> str:
-        assigned = sum(1 for v in self.variables if len(self.domains[v]) == 1)
+        assigned = sum(1 for v in self.variables if bitset.is_singleton(self.domains[v]))
         return (
             f"CSP(vars={len(self.variables)}, "
             f"assigned={assigned}, "
-            f"arcs={sum(len(self.neighbors[v]) for v in self.variables)})"
+            f"arcs={len(self.topology.arc_src)})"
         )
 
 
-def sudoku_csp_from_grid(grid: List[List[int]]) -> CSP:
-    """Construct a Sudoku CSP from a 9x9 integer grid (0=empty)"""
-    if len(grid) != 9 or any(len(row) != 9 for row in grid):
-        raise ValueError("Grid must be 9x9.")
-    for r in range(9):
-        for c in range(9):
+def box_size(size: int) -> int:
+    """Box size of a size x size board (3 for 9x9, 4 for 16x16); ValueError if size is not a square"""
+    box = math.isqrt(size)
+    if size < 1 or box * box != size:
+        raise ValueError(f"Board size must be a perfect square (4, 9, 16, 25, ...), got {size}.")
+    return box
+
+
+def sudoku_csp_from_grid(grid: List[List[int]], box: Optional[int] = None) -> CSP:
+    """
+    Construct a Sudoku CSP from a size x size integer grid (0=empty).
+    The box size is inferred from the grid (9x9 -> 3, 16x16 -> 4, 25x25 -> 5) unless given.
+    """
+    if box is None:
+        box = box_size(len(grid))
+    size = box * box
+    if len(grid) != size or any(len(row) != size for row in grid):
+        raise ValueError(f"Grid must be {size}x{size}.")
+    for r in range(size):
+        for c in range(size):
             v = grid[r][c]
-            if not isinstance(v, int) or not (0 <= v <= 9):
-                raise ValueError("Grid values must be integers in 0..9.")
+            if not isinstance(v, int) or not (0 <= v <= size):
+                raise ValueError(f"Grid values must be integers in 0..{size}.")
 
-    variables: List[Var] = [(r, c) for r in range(9) for c in range(9)]
-    full_domain: Set[Value] = set(range(1, 10))
+    # Neighbors (row, column, box) come from the shared topology
+    topology = get_topology(box)
+    full_domain: Domain = bitset.full_mask(size)
 
     # Initialize domains
-    domains: Dict[Var, Set[Value]] = {}
-    for (r, c) in variables:
-        val = grid[r][c]
-        domains[(r, c)] = {val} if 1 <= val <= 9 else set(full_domain)
-
-    # Build neighbors (row, column, box)
-    neighbors: Dict[Var, Set[Var]] = {v: set() for v in variables}
-    for (r1, c1) in variables:
-        for (r2, c2) in variables:
-            if (r1, c1) == (r2, c2):
-                continue
-            if (constraints.same_row((r1, c1), (r2, c2)) or constraints.same_col((r1, c1), (r2, c2)) or constraints.same_box((r1, c1), (r2, c2))):
-                neighbors[(r1, c1)].add((r2, c2))
+    domains: List[Domain] = [
+        bitset.bit(val) if val else full_domain
+        for row in grid
+        for val in row
+    ]
 
     return CSP(
-        variables=variables,
+        topology=topology,
         domains=domains,
-        neighbors=neighbors,
-        constraint=constraints.binary_neq
-    )
\ No newline at end of file
+        constraint=unit_constraint(box)
+    )
+
+
+@lru_cache(maxsize=None)
+def unit_constraint(box: int) -> constraints.Constraint:
+    """
+    All-different over the rows, columns and boxes, shared by every CSP of that board size;
+    anything that builds a Sudoku CSP without sudoku_csp_from_grid should use it too
+    """
+    return constraints.all_different(get_topology(box).units)
@@ -0,0 +1,89 @@
+"""
+CP468 — topology.py
+Shared, read-only Sudoku board structure (cells, units, peers, arcs).
+
+The neighbor graph only depends on the board size, so it is built once per
+box size and reused by every CSP instance instead of being rebuilt per puzzle.
+
+Functions:
+    - get_topology(box) -> Topology
+"""
+
+from __future__ import annotations
+from array import array
+from functools import lru_cache
+from typing import Tuple
+
+
+class Topology:
+    """
+    Immutable board structure for a (box*box) x (box*box) Sudoku.
+
+    Cells are numbered row-major: cell = r * size + c.
+    units are the rows, then the columns, then the boxes.
+    """
+
+    __slots__ = (
+        "box",
+        "size",
+        "n_cells",
+        "cells",
+        "coords",
+        "units",
+        "cell_units",
+        "peers",
+        "arc_src",
+        "arc_dst",
+    )
+
+    def __init__(self, box: int) -> None:
+        size = box * box
+        n_cells = size * size
+        self.box = box
+        self.size = size
+        self.n_cells = n_cells
+        self.cells = range(n_cells)
+        self.coords: Tuple[Tuple[int, int], ...] = tuple(divmod(i, size) for i in self.cells)
+
+        rows = [tuple(r * size + c for c in range(size)) for r in range(size)]
+        cols = [tuple(r * size + c for r in range(size)) for c in range(size)]
+        boxes = [
+            tuple(
+                (br + r) * size + (bc + c)
+                for r in range(box)
+                for c in range(box)
+            )
+            for br in range(0, size, box)
+            for bc in range(0, size, box)
+        ]
+        self.units: Tuple[Tuple[int, ...], ...] = tuple(rows + cols + boxes)
+
+        # (row unit, col unit, box unit) indices into self.units for each cell
+        self.cell_units: Tuple[Tuple[int, int, int], ...] = tuple(
+            (r, size + c, 2 * size + (r // box) * box + c // box)
+            for (r, c) in self.coords
+        )
+
+        peers = []
+        for i in self.cells:
+            p = set()
+            for u in self.cell_units[i]:
+                p.update(self.units[u])
+            p.discard(i)
+            peers.append(tuple(sorted(p)))
+        self.peers: Tuple[Tuple[int, ...], ...] = tuple(peers)
+
+        # Every directed arc (xi, xj) as two parallel flat arrays
+        self.arc_src = array("i", (i for i in self.cells for _ in self.peers[i]))
+        self.arc_dst = array("i", (j for i in self.cells for j in self.peers[i]))
+
+    def __repr__(self) -> str:
+        return f"Topology(size={self.size}, cells={self.n_cells}, arcs={len(self.arc_src)})"
+
+
+@lru_cache(maxsize=None)
+def get_topology(box: int = 3) -> Topology:
+    """Return the shared topology for a board with the given box size (3 -> 9x9)"""
+    if box < 1:
+        raise ValueError("Box size must be at least 1.")
+    return Topology(box)